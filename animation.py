@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# The animated version of a session, in a choice of formats: gif, animated webp, or an mp4 loop.
+# webp and mp4 are a fraction of the size of a gif, so they upload much faster over venue Wi-Fi.
+# webp needs Pillow built with libwebp. mp4 needs ffmpeg installed. Without them the booth falls back to gif.
+
+import io
+import os
+import subprocess
+import time
+from PIL import Image # https://pillow.readthedocs.io/
+import gif_encoder
+
+formats = ['gif', 'webp', 'mp4']
+webp_quality = 75 # 0-100
+webp_method = 0 # 0 is fastest, 6 is smallest. Above 0 saved little on booth pics for 2-3x the time.
+mp4_crf = 23 # x264 quality. Lower is better and bigger.
+mp4_preset = 'veryfast'
+ffmpeg = 'ffmpeg' # path to the ffmpeg binary
+
+# same arguments as gif_encoder.encode_frames. delay is in 1/100 of a second.
+def encode_webp(frames, path, delay):
+	frames[0].save(path, 'WEBP', save_all=True, append_images=frames[1:], duration=delay * 10, loop=0,
+		quality=webp_quality, method=webp_method)
+
+# frames go to ffmpeg as raw rgb, or raw grey for 'L' frames, through a pipe, so nothing is written out in between
+def encode_mp4(frames, path, delay):
+	w, h = frames[0].size
+	mode, pix_fmt = ('L', 'gray') if frames[0].mode == 'L' else ('RGB', 'rgb24')
+	command = [ffmpeg, '-loglevel', 'error', '-y',
+		'-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', '%dx%d' % (w, h), '-r', '%g' % (100.0 / delay), '-i', '-',
+		'-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', # h.264 wants even sizes
+		'-c:v', 'libx264', '-preset', mp4_preset, '-crf', str(mp4_crf), '-pix_fmt', 'yuv420p',
+		'-movflags', '+faststart', path]
+	process = subprocess.Popen(command, stdin=subprocess.PIPE)
+	process.communicate(b''.join(f.convert(mode).tobytes() for f in frames))
+	if process.returncode != 0:
+		raise IOError("ffmpeg failed making " + path)
+
+def encode_gif(frames, path, delay):
+	gif_encoder.encode_frames(frames, path, delay)
+
+encoders = {'gif': encode_gif, 'webp': encode_webp, 'mp4': encode_mp4}
+
+# can this format be made here? Tries a tiny animation, which covers every Pillow and ffmpeg build.
+def available(fmt):
+	if fmt == 'gif':
+		return True
+	if fmt == 'webp':
+		try:
+			tiny = [Image.new('RGB', (2, 2)), Image.new('RGB', (2, 2), (255, 255, 255))]
+			tiny[0].save(io.BytesIO(), 'WEBP', save_all=True, append_images=tiny[1:])
+			return True
+		except Exception:
+			return False
+	if fmt == 'mp4':
+		devnull = open(os.devnull, 'w')
+		try:
+			return subprocess.call([ffmpeg, '-version'], stdout=devnull, stderr=devnull) == 0
+		except OSError:
+			return False
+		finally:
+			devnull.close()
+	return False
+
+# the format to use: fmt if it can be made here, else gif
+def choose(fmt):
+	if fmt not in formats:
+		raise ValueError("Unknown animation format " + fmt + ". Choose one of: " + ", ".join(formats))
+	if not available(fmt):
+		print("Can't make " + fmt + " animations here, making gifs instead")
+		return 'gif'
+	return fmt
+
+# the file name of the animation for a session
+def path(prefix, fmt):
+	return prefix + '.' + fmt
+
+# encode frames (same size RGB, or grey 'L', images) as fmt. Returns (seconds, bytes).
+def encode(fmt, frames, animation_path, delay):
+	start = time.time()
+	encoders[fmt](frames, animation_path, delay)
+	return time.time() - start, os.path.getsize(animation_path)
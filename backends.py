@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# Hardware backends for the photo booth: the button and LED, the camera and the display.
+# 'pi' drives the real hardware. 'sim' needs none of it: the button presses itself,
+# the camera makes synthetic frames and the display is a headless pygame surface.
+# That lets whole sessions run, and be timed, on an ordinary Linux box.
+
+import os
+import threading
+import time
+import pygame
+import camera_manager
+
+names = ['pi', 'sim']
+
+# the real button and LED, through RPi.GPIO
+class PiGPIO(object):
+
+	def __init__(self, led_pin, btn_pin):
+		import RPi.GPIO as GPIO
+		self.GPIO = GPIO
+		self.led_pin = led_pin
+		self.btn_pin = btn_pin
+		GPIO.setmode(GPIO.BOARD)
+		GPIO.setup(led_pin,GPIO.OUT) # LED
+		GPIO.setup(btn_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+		GPIO.output(led_pin,False) #for some reason the pin turns on at the beginning of the program. Why?
+
+	def led(self, on):
+		self.GPIO.output(self.led_pin, on)
+
+	# call callback(time of the edge) from the GPIO interrupt thread on every real press.
+	# Edges within debounce seconds of the last accepted one are contact bounce and ignored.
+	def on_press(self, callback, debounce):
+		state = {'last': 0}
+		def edge(channel):
+			now = time.time()
+			if now - state['last'] < debounce:
+				return
+			state['last'] = now
+			callback(now)
+		self.GPIO.add_event_detect(self.btn_pin, self.GPIO.FALLING, callback=edge)
+
+	def cleanup(self):
+		self.GPIO.cleanup()
+
+# a button that presses itself every press_interval seconds, and an LED that only counts.
+# With hold, a path, it waits for that file to exist before its first press.
+class SimGPIO(object):
+
+	def __init__(self, press_interval=0.05, hold=None):
+		self.press_interval = max(press_interval, 0.05)
+		self.hold = hold
+		self.led_on = False
+		self.led_changes = 0
+		self.presses = 0
+
+	def led(self, on):
+		if on != self.led_on:
+			self.led_changes += 1
+		self.led_on = on
+
+	def on_press(self, callback, debounce):
+		def press():
+			while self.hold is not None and not os.path.exists(self.hold):
+				time.sleep(self.press_interval)
+			while True:
+				time.sleep(self.press_interval)
+				self.presses += 1
+				callback(time.time())
+		thread = threading.Thread(target=press, name='sim-button')
+		thread.daemon = True
+		thread.start()
+
+	def cleanup(self):
+		pass
+
+# full screen pygame display on the Pi's monitor
+def pi_display(monitor_w, monitor_h):
+	pygame.init()
+	pygame.display.set_mode((monitor_w, monitor_h))
+	screen = pygame.display.get_surface()
+	pygame.display.set_caption('Photo Booth Pics')
+	pygame.mouse.set_visible(False) #hide the mouse cursor
+	pygame.display.toggle_fullscreen()
+	return screen
+
+# a pygame surface that is never shown anywhere
+def headless_display(monitor_w, monitor_h):
+	os.environ['SDL_VIDEODRIVER'] = 'dummy'
+	pygame.init()
+	pygame.display.set_mode((monitor_w, monitor_h))
+	return pygame.display.get_surface()
+
+class Backend(object):
+
+	def __init__(self, name, gpio, camera, screen):
+		self.name = name
+		self.gpio = gpio
+		self.camera = camera # a camera_manager.CameraManager, not yet opened
+		self.screen = screen
+
+# build the named backend. sim_timings are FakeCamera's (open_time, converge_time, capture_time),
+# and sim_hold a file the simulated button waits for before its first press.
+def load(name, led_pin, btn_pin, monitor_w, monitor_h, press_interval=0.05, sim_timings=(0, 0, 0), sim_hold=None):
+	if name == 'pi':
+		return Backend(name,
+			PiGPIO(led_pin, btn_pin),
+			camera_manager.PiCameraManager((monitor_w, monitor_h)),
+			pi_display(monitor_w, monitor_h))
+	if name == 'sim':
+		return Backend(name,
+			SimGPIO(press_interval, sim_hold),
+			camera_manager.FakeCamera(*sim_timings),
+			headless_display(monitor_w, monitor_h))
+	raise ValueError("Unknown backend " + name + ". Choose one of: " + ", ".join(names))
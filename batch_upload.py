@@ -1,83 +1,374 @@
 #!/usr/bin/env python
 # created by chris@drumminhands.com
 # Batch upload photos post event, if there was no internet connection at the event
-# Note, there are limits to how often/much you can upload to Tumblr via their API. 
+# Note, there are limits to how often/much you can upload to Tumblr via their API.
 # If you have issues, try to upload in smaller batches or less frequently.
+#
+# Uploads run on a small pool of workers behind a token bucket rate limiter.
+# Finished sessions are written to a manifest, so an interrupted run picks up where it left off.
+# Sessions come from the booth's catalog when there is one, else from a scan of the pics folder.
+# Sessions still in the booth's own upload queue are left to it, so nothing is posted twice.
+# usage: python batch_upload.py [--workers 4] [--rate 30] [--max-retries 5] [--stub] [--scan]
 
 import argparse
 import os
-import glob
 import stat
 import sys
+import threading
 import time
-import pytumblr # https://github.com/tumblr/pytumblr
+import traceback
+try:
+	import Queue as queue # python 2
+except ImportError:
+	import queue
 import config # this is the config file config.py
+from upload_queue import post_failed, read_jobs
+from catalog import animation_extensions, all_pics, session_length
 
 # global variables
-delay = 1 # delay between uploads. Don't abuse the Tumblr server. 
+rate = 60 # posts per minute allowed by the rate limiter. Tumblr also caps posts per day (250), so big batches may need two days.
+burst = 3 # how many posts may go out back to back before the rate limiter kicks in
+workers = 4 # uploads running at the same time
+max_retries = 5 # attempts per session before it is reported as failed
+retry_delay = 2 # seconds before a failed attempt is tried again, doubling each time
+manifest_name = 'batch_uploaded.txt' # list of uploaded sessions, kept in config.file_path
+# pytumblr has no public way to send through a session, so pooled_request() overrides its TumblrRequest.
+# That is only done on the pytumblr releases it was written against. Check it again before adding another.
+pytumblr_pooled = ('0.1.',)
 
 # Setup the tumblr OAuth Client
-client = pytumblr.TumblrRestClient(
-    config.consumer_key,
-    config.consumer_secret,
-    config.oath_token,
-    config.oath_secret,
-)
-
-def main():
+# With sessions from tumblr_sessions(), every post goes through a kept-alive connection.
+def tumblr_client(session=None):
+	import pytumblr # https://github.com/tumblr/pytumblr
+	client = pytumblr.TumblrRestClient(
+		config.consumer_key,
+		config.consumer_secret,
+		config.oath_token,
+		config.oath_secret,
+	)
+	if session is not None:
+		version = pytumblr_version()
+		if version is not None and version.startswith(pytumblr_pooled):
+			client.request = pooled_request(session)
+		else:
+			print("pytumblr %s isn't one pooled_request() was written for, posting without kept-alive connections" % version)
+	return client
+
+# the installed pytumblr's version, or None if it can't be found
+def pytumblr_version():
+	try:
+		from importlib.metadata import version # python 3.8 and up
+	except ImportError:
+		try:
+			import pkg_resources
+		except ImportError:
+			return None
+		version = lambda name: pkg_resources.get_distribution(name).version
+	try:
+		return version('pytumblr')
+	except Exception:
+		return None
+
+# A requests session for each thread that sends, as requests.Session isn't documented as thread-safe.
+# Each keeps its keep-alive connection to Tumblr open, so a thread's posts after its first skip the connect and TLS handshake.
+# Used like a requests.Session: its get, post, head and delete go through the calling thread's own session.
+# With timeout, seconds, a request that doesn't give its own gives up after that long.
+class ThreadSessions(object):
+
+	def __init__(self, timeout=None):
+		self.local = threading.local()
+		self.timeout = timeout
+
+	def session(self):
+		session = getattr(self.local, 'session', None)
+		if session is None:
+			import requests
+			session = self.local.session = requests.Session()
+		return session
+
+	def get(self, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		return self.session().get(url, **kwargs)
+
+	def post(self, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		return self.session().post(url, **kwargs)
+
+	def head(self, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		return self.session().head(url, **kwargs)
+
+	def delete(self, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		return self.session().delete(url, **kwargs)
+
+def tumblr_sessions(timeout=None):
+	return ThreadSessions(timeout)
+
+# pytumblr's request object, sending through session instead of a new connection per call.
+# The same calls TumblrRequest makes in pytumblr 0.1.x, see pytumblr_pooled.
+def pooled_request(session):
+	from pytumblr.request import TumblrRequest
+	try:
+		from urllib import urlencode # python 2
+	except ImportError:
+		from urllib.parse import urlencode
+
+	class PooledTumblrRequest(TumblrRequest):
+		def get(self, url, params):
+			url = self.host + url
+			if params:
+				url = url + "?" + urlencode(params)
+			return self.json_parse(session.get(url, allow_redirects=False, headers=self.headers, auth=self.oauth))
+
+		def post(self, url, params={}, files=[]):
+			url = self.host + url
+			if files:
+				return self.post_multipart(url, params, files)
+			return self.json_parse(session.post(url, data=str(urlencode(params)), headers=self.headers, auth=self.oauth))
+
+		def delete(self, url, params):
+			url = self.host + url
+			if params:
+				url = url + "?" + urlencode(params)
+			return self.json_parse(session.delete(url, allow_redirects=False, headers=self.headers, auth=self.oauth))
+
+		def post_multipart(self, url, params, files):
+			return self.json_parse(session.post(url, data=params, params=params, files=files,
+				headers=self.headers, allow_redirects=False, auth=self.oauth))
+
+	return PooledTumblrRequest(config.consumer_key, config.consumer_secret, config.oath_token, config.oath_secret)
+
+# stand-in for the Tumblr client, to load test the upload mode locally without posting anything
+class StubTumblrClient(object):
+
+	def __init__(self, latency=0.5, fail_every=0):
+		self.latency = latency # seconds each post takes
+		self.fail_every = fail_every # fail every nth post, 0 never fails
+		self.posts = 0
+		self.lock = threading.Lock()
+
+	def create_photo(self, blog, **kwargs):
+		with self.lock:
+			self.posts += 1
+			n = self.posts
+		time.sleep(self.latency)
+		if self.fail_every and n % self.fail_every == 0:
+			return {'meta': {'status': 503, 'msg': 'Service Unavailable'}, 'response': []}
+		return {'id': n}
+
+	def create_video(self, blog, **kwargs):
+		return self.create_photo(blog, **kwargs)
+
+# token bucket. Each post takes a token; tokens refill at rate per minute up to burst.
+class RateLimiter(object):
+
+	def __init__(self, per_minute, burst):
+		self.interval = 60.0 / per_minute
+		self.burst = burst
+		self.tokens = float(burst)
+		self.last = time.time()
+		self.lock = threading.Lock()
+
+	def take(self):
+		while True:
+			with self.lock:
+				now = time.time()
+				self.tokens = min(self.burst, self.tokens + (now - self.last) / self.interval)
+				self.last = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) * self.interval
+			time.sleep(wait)
+
+# sessions already uploaded by an earlier run
+class Manifest(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.done = set()
+		if os.path.exists(path):
+			f = open(path)
+			try:
+				self.done = set(line.strip() for line in f if line.strip())
+			finally:
+				f.close()
+
+	def add(self, session):
+		with self.lock:
+			f = open(self.path, 'a')
+			try:
+				f.write(session + '\n')
+				f.flush()
+				os.fsync(f.fileno()) # so a crash right after still counts this one as done
+			finally:
+				f.close()
+			self.done.add(session)
+
+# list the sessions to upload from the catalog, as (session name, animation path or list of jpgs)
+def catalog_sessions(catalog):
+	sessions = []
+	for session in catalog.pending_uploads():
+		if config.make_gifs:
+			files = catalog.files(session, 'animation')
+			if files:
+				sessions.append((session, files[0]))
+		else:
+			files = catalog.files(session, 'frame')
+			if files:
+				sessions.append((session, files))
+	return sessions
+
+# the sessions waiting in the booth's upload queue. Failed jobs, given up on, aren't counted.
+def queued_sessions(queue_path):
+	sessions = set()
+	for job in read_jobs(queue_path):
+		if job.get('session'):
+			sessions.add(job['session'])
+		sessions.update(os.path.basename(f)[:session_length] for f in job['files'])
+	return sessions
+
+# list the sessions to upload from a scan of the pics folder, and its event and day folders,
+# as (session name, animation path or list of jpgs)
+def find_sessions():
+	sessions = []
+	files = all_pics(config.file_path) # sorted by name, so by session
 	if config.make_gifs:
-		files = glob.glob(config.file_path + '*.gif')
-		files.sort() # organize the list
 		for f in files:
-			uploadOne(f)
+			if os.path.splitext(f)[1] not in animation_extensions:
+				continue
+			session = os.path.basename(f)[:session_length]
+			if not sessions or sessions[-1][0] != session: # one animation per session, if it was made in more than one format
+				sessions.append((session, f))
 	else:
-		files = glob.glob(config.file_path + '*.jpg')
-		files.sort() # organize the list
-		
 		previous_group = "0000-00-00-00-00-00" # used to not duplicate groups
-		
+
 		for f in files:
-			current_group = f[len(config.file_path):]
-			current_group = current_group[:19]
+			if not f.endswith('.jpg'):
+				continue
+			current_group = os.path.basename(f)[:session_length]
 			if (current_group != previous_group): # remove duplicates
-				uploadMultiple(current_group) #upload a group of pics
-				print "Uploaded: " + current_group
+				sessions.append((current_group, groupJpgs(os.path.dirname(f), current_group)))
 				previous_group = current_group # remember for next time through loop
+	return sessions
 
-	print "Completed uploading pics"
-	
-def uploadOne(pic):	
-	while True: 
-		try:
-			file_to_upload = pic
-			print "Uploading " + file_to_upload
-			client.create_photo(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], data=file_to_upload)
-			time.sleep(delay) # wait a bit
-# 			cmd = "mv " + file_to_upload + " " + config.file_path + "/batch_uploaded"
-# 			os.system(cmd) # once uploaded, move to sub directory
-			break
-		except ValueError:
-			print pic + " not uploaded. Error."					
-
-def uploadMultiple(group_name):
-	while True: 
+def groupJpgs(folder, group_name):
+	# create an array and populate with file paths to our jpgs
+	myJpgs=[0 for i in range(4)]
+	for i in range(4):
+		myJpgs[i]=os.path.join(folder, group_name + "-0" + str(i+1) + ".jpg")
+	return myJpgs
+
+def uploadOne(client, pic):
+	print("Uploading " + pic)
+	if pic.endswith('.mp4'): # an mp4 animation is a video post
+		return client.create_video(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], data=pic)
+	return client.create_photo(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], data=pic)
+
+def uploadMultiple(client, myJpgs):
+	# upload files into one post
+	return client.create_photo(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], format="markdown", data=myJpgs)
+
+# try one session up to max_retries times. Returns True once it is uploaded.
+def upload_session(client, limiter, session, data, retries):
+	for attempt in range(retries):
+		limiter.take()
 		try:
-			# create an array and populate with file paths to our jpgs
-			myJpgs=[0 for i in range(4)]
-			for i in range(4):
-				myJpgs[i]=config.file_path + group_name + "-0" + str(i+1) + ".jpg"
-			
-			# upload files into one post
-			client.create_photo(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], format="markdown", data=myJpgs)
-			
-			# wait a bit
-			time.sleep(delay)
-				
-			break
-		except ValueError:
-			print group_name + " not uploaded. Error."
-				
-print 'Batch Upload Start'
-
-# run the main program
-main()
+			if isinstance(data, list):
+				response = uploadMultiple(client, data)
+			else:
+				response = uploadOne(client, data)
+			if not post_failed(response):
+				return True
+			print(session + " not uploaded. Error: " + str(response['meta'].get('msg')))
+		except Exception as e: # a dropped connection or a missing file mustn't stop the run
+			print(session + " not uploaded. Error: " + repr(e))
+		if attempt < retries - 1:
+			time.sleep(retry_delay * 2 ** attempt)
+	return False
+
+def main(args):
+	if args.stub:
+		client = StubTumblrClient(args.stub_latency, args.stub_fail_every)
+	else:
+		client = tumblr_client(tumblr_sessions())
+
+	manifest = Manifest(args.manifest)
+	catalog = None
+	if not args.scan and os.path.exists(args.catalog):
+		import catalog as session_catalog
+		catalog = session_catalog.Catalog(args.catalog)
+		sessions = catalog_sessions(catalog)
+	else:
+		sessions = find_sessions()
+	sessions = [s for s in sessions if s[0] not in manifest.done]
+	queued = queued_sessions(args.queue_path)
+	waiting = len([s for s in sessions if s[0] in queued])
+	sessions = [s for s in sessions if s[0] not in queued]
+	print(str(len(manifest.done)) + " sessions already uploaded, " + str(waiting) + " left to the booth's upload queue, " + str(len(sessions)) + " to go")
+
+	limiter = RateLimiter(args.rate, args.burst)
+	todo = queue.Queue()
+	for s in sessions:
+		todo.put(s)
+	failed = []
+	uploaded = [0]
+	count_lock = threading.Lock()
+
+	def worker():
+		while True:
+			try:
+				session, data = todo.get_nowait()
+			except queue.Empty:
+				return
+			try:
+				done = upload_session(client, limiter, session, data, args.max_retries)
+				if done:
+					manifest.add(session)
+					if catalog is not None:
+						catalog.set_upload_status(session, 'uploaded')
+			except Exception: # e.g. the manifest couldn't be written. Count it as failed and go on with the rest.
+				traceback.print_exc()
+				done = False
+			if done:
+				with count_lock:
+					uploaded[0] += 1
+				print("Uploaded: " + session)
+			else:
+				with count_lock:
+					failed.append(session)
+
+	start = time.time()
+	threads = [threading.Thread(target=worker) for i in range(args.workers)]
+	for t in threads:
+		t.daemon = True # ctrl-c stops the run, the manifest keeps what is done
+		t.start()
+	while any(t.is_alive() for t in threads):
+		time.sleep(0.2)
+	elapsed = time.time() - start
+
+	print("Completed uploading pics")
+	print("%d uploaded, %d failed in %.1fs (%.1f posts/min)" % (uploaded[0], len(failed), elapsed, uploaded[0] * 60.0 / elapsed if elapsed else 0))
+	for session in failed:
+		print("Not uploaded: " + session + ". Run again to retry.")
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Batch upload photo booth sessions to Tumblr')
+	parser.add_argument('--workers', type=int, default=workers, help='uploads running at the same time')
+	parser.add_argument('--rate', type=float, default=rate, help='max posts per minute')
+	parser.add_argument('--burst', type=int, default=burst, help='posts allowed back to back')
+	parser.add_argument('--max-retries', type=int, default=max_retries, help='attempts per session')
+	parser.add_argument('--manifest', default=config.file_path + manifest_name, help='file listing uploaded sessions')
+	parser.add_argument('--catalog', default=config.catalog_path, help='session catalog database')
+	parser.add_argument('--queue-path', default=config.upload_queue_path, help="the booth's upload queue, whose sessions are skipped")
+	parser.add_argument('--scan', action='store_true', help='find sessions by scanning the pics folder instead of the catalog')
+	parser.add_argument('--stub', action='store_true', help='use a stand-in client instead of posting to Tumblr')
+	parser.add_argument('--stub-latency', type=float, default=0.5, help='seconds per post for --stub')
+	parser.add_argument('--stub-fail-every', type=int, default=0, help='fail every nth post for --stub')
+
+	print('Batch Upload Start')
+
+	# run the main program
+	main(parser.parse_args())
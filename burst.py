@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# Burst capture: several frames per pose off the video port, keeping only the best of them.
+# Frames are scored on a small luminance copy: sharpness is the variance of its Laplacian
+# (blinks and motion blur flatten it), and exposure marks down dark, bright or clipped frames.
+# All of it runs in Pillow's C filters and histograms, not per pixel in Python.
+
+import io
+import time
+from collections import deque
+from PIL import Image, ImageFilter, ImageStat # https://pillow.readthedocs.io/
+
+score_size = 160 # frames are scored at about this width
+clip_limit = 0.05 # fraction of pixels that may be pure black or white before exposure is marked down
+laplacian = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+# sharpness and exposure of one jpg. Higher is better for both.
+def score(data):
+	img = Image.open(io.BytesIO(data))
+	img.draft('L', (score_size, score_size * img.size[1] // img.size[0])) # the jpeg decoder does the downscale
+	img = img.convert('L')
+	if img.size[0] > score_size * 2:
+		img = img.resize((score_size, score_size * img.size[1] // img.size[0]))
+	sharpness = ImageStat.Stat(img.filter(laplacian)).var[0]
+	levels = ImageStat.Stat(img)
+	brightness = levels.mean[0]
+	clipped = (levels.h[0] + levels.h[255]) / float(levels.count[0])
+	exposure = 1 - abs(brightness - 128) / 128.0 # 1 at mid grey, 0 at black or white
+	if clipped > clip_limit:
+		exposure *= clip_limit / clipped
+	return sharpness, exposure
+
+class Burst(object):
+
+	def __init__(self, size):
+		self.frames = deque(maxlen=size) # ring buffer of jpg data, the newest burst
+		self.scored = 0 # frames scored so far
+		self.scoring = 0 # seconds spent scoring
+
+	def fill(self, camera):
+		for data in camera.capture_burst(self.frames.maxlen):
+			self.frames.append(data)
+
+	# the best frame in the buffer: the sharpest, weighted by exposure. Returns (jpg data, index).
+	def best(self):
+		start = time.time()
+		scores = [score(data) for data in self.frames]
+		self.scoring += time.time() - start
+		self.scored += len(scores)
+		ranked = [sharpness * exposure for sharpness, exposure in scores]
+		index = ranked.index(max(ranked))
+		return self.frames[index], index
+
+	def per_frame(self):
+		return self.scoring / self.scored if self.scored else 0
+
+	def report(self):
+		return "burst: %d frames scored, %.1fms each" % (self.scored, self.per_frame() * 1000)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# Keeps the camera open and previewing between sessions.
+# Instead of a fixed warm up sleep before every shot, wait until the exposure has actually settled.
+# PiCameraManager drives the real camera. FakeCamera implements the same interface
+# so time-to-first-shot and inter-shot latency can be measured on any Linux box.
+
+import io
+import time
+
+settle_interval = 0.05 # seconds between exposure readings
+settle_samples = 3 # readings in a row that must agree before exposure counts as settled
+settle_tolerance = 0.02 # how much (as a fraction) a reading may move and still agree
+settle_timeout = 2 # never wait longer than the old fixed warm up
+
+# What every camera shares. Each camera also provides, like picamera:
+#   open(), close()
+#   configure(resolution, iso, saturation)
+#   show_preview(), hide_preview()
+#   exposure_state()       a tuple of numbers that stop moving once exposure has settled
+#   capture(output)        one jpg, to a file name or a stream
+#   capture_continuous(output)  a generator of jpgs, one after another into the same output
+class CameraManager(object):
+
+	def __init__(self):
+		self.resolution = None
+		self.last_settle = 0 # seconds the last settle() took
+
+	# count jpgs back to back, as a list of bytes
+	def capture_burst(self, count):
+		streams = [io.BytesIO() for i in range(count)]
+		for stream in streams:
+			self.capture(stream)
+		return [stream.getvalue() for stream in streams]
+
+	# wait until exposure and gains stop moving, up to settle_timeout. Returns seconds waited.
+	# sleep can be swapped for one that keeps an event loop running.
+	def settle(self, timeout=settle_timeout, sleep=time.sleep):
+		start = time.time()
+		previous = self.exposure_state()
+		steady = 0
+		while steady < settle_samples and time.time() - start < timeout:
+			sleep(settle_interval)
+			current = self.exposure_state()
+			if all(abs(c - p) <= settle_tolerance * max(abs(p), 1e-6) for c, p in zip(current, previous)):
+				steady += 1
+			else:
+				steady = 0
+			previous = current
+		self.last_settle = time.time() - start
+		return self.last_settle
+
+class PiCameraManager(CameraManager):
+
+	def __init__(self, preview_resolution):
+		CameraManager.__init__(self)
+		self.preview_resolution = preview_resolution
+		self.camera = None
+
+	# open the camera once and leave the preview running, hidden, so exposure keeps tracking the room
+	def open(self):
+		import picamera # http://picamera.readthedocs.org/en/release-1.4/install2.html
+		self.camera = picamera.PiCamera()
+		self.camera.vflip = False
+		self.camera.hflip = False # photos are not mirrored
+		self.camera.start_preview(resolution=self.preview_resolution) # start preview at low res but the right ratio
+		self.camera.preview.hflip = True # the preview alone shows users a mirror image
+		self.hide_preview()
+
+	# change settings on the open camera, no reinitialization needed
+	def configure(self, resolution, iso, saturation):
+		self.camera.saturation = saturation
+		self.camera.iso = iso
+		if resolution != self.resolution:
+			self.camera.resolution = resolution
+			self.camera.preview.hflip = True # the renderer is rebuilt with the new resolution
+			self.resolution = resolution
+
+	def show_preview(self):
+		self.camera.preview.alpha = 255
+
+	def hide_preview(self):
+		self.camera.preview.alpha = 0 # still running, just invisible over the pygame screens
+
+	def exposure_state(self):
+		return (self.camera.exposure_speed, float(self.camera.analog_gain), float(self.camera.digital_gain))
+
+	# output is a filename or a stream
+	def capture(self, output):
+		self.camera.capture(output, format='jpeg')
+
+	def capture_continuous(self, output):
+		return self.camera.capture_continuous(output, format='jpeg')
+
+	# the video port is much faster than the still port, so a burst takes little longer than one still
+	def capture_burst(self, count):
+		streams = [io.BytesIO() for i in range(count)]
+		self.camera.capture_sequence(streams, format='jpeg', use_video_port=True)
+		return [stream.getvalue() for stream in streams]
+
+	def close(self):
+		if self.camera is not None:
+			self.camera.stop_preview()
+			self.camera.close()
+			self.camera = None
+
+# stand-in camera with made up timings, for benchmarks off the Pi
+class FakeCamera(CameraManager):
+
+	def __init__(self, open_time=1.0, converge_time=0.3, capture_time=0.2):
+		CameraManager.__init__(self)
+		self.open_time = open_time # like picamera.PiCamera() on a Pi
+		self.converge_time = converge_time # time constant of the simulated auto exposure
+		self.capture_time = capture_time # seconds per still
+		self.changed = time.time() # when the light or the settings last changed
+		self.preview = False
+		self.saturation = 0
+		self.shots = 0
+
+	def open(self):
+		time.sleep(self.open_time)
+		self.changed = time.time()
+
+	def configure(self, resolution, iso, saturation):
+		self.saturation = saturation
+		if resolution != self.resolution:
+			self.resolution = resolution
+			self.changed = time.time() # exposure starts over after a mode change
+
+	def show_preview(self):
+		self.preview = True
+
+	def hide_preview(self):
+		self.preview = False
+
+	# exposure approaches its target exponentially after each change
+	def exposure_state(self):
+		if self.converge_time <= 0: # settles instantly
+			return (10000,)
+		age = time.time() - self.changed
+		return (10000 * (1 + 2.0 ** (-age / self.converge_time * 10)),)
+
+	# a synthetic frame: a gradient with a block that moves from shot to shot
+	def frame(self):
+		from PIL import Image, ImageDraw # https://pillow.readthedocs.io/
+		self.shots += 1
+		w, h = self.resolution
+		img = Image.linear_gradient('L').resize((w, h)).convert('RGB')
+		x = (self.shots * w // 7) % w
+		ImageDraw.Draw(img).rectangle((x, h // 4, x + w // 5, h * 3 // 4), fill=(255, 255, 255))
+		return img
+
+	def capture(self, output):
+		time.sleep(self.capture_time)
+		self.frame().save(output, 'JPEG')
+
+	# like the video port: quicker than stills, and all but one frame of each burst motion blurred
+	def capture_burst(self, count):
+		from PIL import ImageFilter # https://pillow.readthedocs.io/
+		sharp = self.shots % count
+		frames = []
+		for i in range(count):
+			time.sleep(self.capture_time / 4.0)
+			img = self.frame()
+			if i != sharp:
+				img = img.filter(ImageFilter.GaussianBlur(abs(i - sharp) * 2))
+			stream = io.BytesIO()
+			img.save(stream, 'JPEG')
+			frames.append(stream.getvalue())
+		return frames
+
+	def capture_continuous(self, output):
+		counter = 1
+		while True:
+			if hasattr(output, 'write'): # like picamera, each frame is written after the last. The caller empties the stream.
+				self.capture(output)
+				yield output
+			else:
+				filename = output.format(counter=counter)
+				self.capture(filename)
+				yield filename
+			counter += 1
+
+	def close(self):
+		pass
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# Session catalog: an SQLite index of every session the booth has taken.
+# Records each session's frames, derivatives, animation and upload status as they are created,
+# so finding pending uploads or an event's sessions is an indexed query instead of a directory scan.
+# usage: python catalog.py --rebuild    index an existing pics folder
+#        python catalog.py --pending    list sessions still waiting to upload
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+schema = '''
+create table if not exists sessions (
+	id text primary key, -- the session timestamp, the start of every filename
+	event text,
+	created real,
+	upload_status text not null default 'none', -- none, pending, uploaded or failed
+	uploaded real
+);
+create table if not exists files (
+	path text primary key,
+	session text not null references sessions(id),
+	kind text not null, -- frame, derivative, animation (gif, webp or mp4) or strip
+	bytes integer,
+	created real
+);
+create index if not exists sessions_by_status on sessions(upload_status, id);
+create index if not exists sessions_by_event on sessions(event, id);
+create index if not exists files_by_session on files(session, kind);
+'''
+
+session_length = 19 # len("2016-07-31-10-26-26")
+animation_extensions = ['.gif', '.webp', '.mp4'] # see animation.formats
+
+# every pic under file_path, sorted by name: in the event and day folders storage.py makes, and loose from before them
+def all_pics(file_path):
+	pics = []
+	for folder, dirs, names in os.walk(file_path):
+		for name in names:
+			if name.endswith('.jpg') or os.path.splitext(name)[1] in animation_extensions:
+				pics.append((name, os.path.join(folder, name)))
+	return [path for name, path in sorted(pics)]
+
+class Catalog(object):
+
+	def __init__(self, db_path, event=None):
+		self.event = event # tagged on new sessions
+		self.lock = threading.Lock() # the booth writes from the event loop and the upload worker
+		self.db = sqlite3.connect(db_path, check_same_thread=False)
+		self.db.executescript(schema)
+
+	def add_session(self, session, event=None, created=None):
+		with self.lock, self.db:
+			self.db.execute('insert or ignore into sessions (id, event, created) values (?, ?, ?)',
+				(session, event or self.event, created or time.time()))
+
+	def add_file(self, session, path, kind):
+		size = os.path.getsize(path) if os.path.exists(path) else None
+		with self.lock, self.db:
+			self.db.execute('insert or replace into files (path, session, kind, bytes, created) values (?, ?, ?, ?, ?)',
+				(path, session, kind, size, time.time()))
+
+	def set_upload_status(self, session, status):
+		with self.lock, self.db:
+			self.db.execute('update sessions set upload_status = ?, uploaded = ? where id = ?',
+				(status, time.time() if status == 'uploaded' else None, session))
+
+	def query(self, sql, args=()):
+		with self.lock:
+			return self.db.execute(sql, args).fetchall()
+
+	# sessions not yet uploaded, oldest first. Includes sessions taken offline, which were never queued.
+	def pending_uploads(self):
+		return [row[0] for row in self.query("select id from sessions where upload_status != 'uploaded' order by id")]
+
+	def sessions(self, event=None):
+		if event is None:
+			return [row[0] for row in self.query('select id from sessions order by id')]
+		return [row[0] for row in self.query('select id from sessions where event = ? order by id', (event,))]
+
+	def files(self, session, kind=None):
+		if kind is None:
+			return [row[0] for row in self.query('select path from files where session = ? order by path', (session,))]
+		return [row[0] for row in self.query('select path from files where session = ? and kind = ? order by path', (session, kind))]
+
+	def all_files(self):
+		return [row[0] for row in self.query('select path from files')]
+
+	# (session, created) with one of statuses, oldest first
+	def sessions_with_status(self, statuses):
+		marks = ', '.join('?' * len(statuses))
+		return self.query('select id, created from sessions where upload_status in (%s) order by id' % marks, tuple(statuses))
+
+	# (sessions, bytes) of everything in the catalog
+	def usage(self):
+		sessions = self.query('select count(*) from sessions')[0][0]
+		return sessions, self.query('select coalesce(sum(bytes), 0) from files')[0][0]
+
+	def remove_files(self, paths):
+		with self.lock, self.db:
+			self.db.executemany('delete from files where path = ?', [(path,) for path in paths])
+
+	def remove_session(self, session):
+		with self.lock, self.db:
+			self.db.execute('delete from files where session = ?', (session,))
+			self.db.execute('delete from sessions where id = ?', (session,))
+
+	def clear(self):
+		with self.lock, self.db:
+			self.db.execute('delete from files')
+			self.db.execute('delete from sessions')
+
+	# index a pics folder that was filled before the catalog existed. One walk of the folder.
+	# Sessions listed in uploaded (e.g. batch_upload's manifest) are marked uploaded, the rest pending.
+	def rebuild(self, file_path, uploaded=()):
+		uploaded = set(uploaded)
+		sessions = {}
+		files = []
+		for path in all_pics(file_path):
+			name = os.path.basename(path)
+			session = name[:session_length]
+			if os.path.splitext(name)[1] in animation_extensions:
+				kind = 'animation'
+			elif name.endswith('-strip.jpg'):
+				kind = 'strip'
+			elif name.endswith('.jpg') and len(name) == session_length + len('-01.jpg'):
+				kind = 'frame'
+			elif name.endswith('.jpg'): # -sm.jpg, -01-web.jpg and so on
+				kind = 'derivative'
+			else:
+				continue
+			stat = os.stat(path)
+			sessions.setdefault(session, stat.st_mtime)
+			files.append((path, session, kind, stat.st_size, stat.st_mtime))
+		with self.lock, self.db:
+			self.db.executemany("insert or ignore into sessions (id, event, created, upload_status) values (?, ?, ?, ?)",
+				[(s, self.event, created, 'uploaded' if s in uploaded else 'pending') for s, created in sessions.items()])
+			self.db.executemany('insert or replace into files (path, session, kind, bytes, created) values (?, ?, ?, ?, ?)', files)
+		return len(sessions), len(files)
+
+	def close(self):
+		self.db.close()
+
+if __name__ == '__main__':
+	import config # this is the config python file config.py
+	parser = argparse.ArgumentParser(description='Photo booth session catalog')
+	parser.add_argument('--db', default=config.catalog_path, help='catalog database')
+	parser.add_argument('--file-path', default=config.file_path, help='pics folder to index')
+	parser.add_argument('--event', default=config.event_name, help='event to tag rebuilt sessions with')
+	parser.add_argument('--rebuild', action='store_true', help='index every session in the pics folder')
+	parser.add_argument('--pending', action='store_true', help='list sessions waiting to upload')
+	args = parser.parse_args()
+
+	catalog = Catalog(args.db, args.event)
+	if args.rebuild:
+		from batch_upload import manifest_name
+		manifest = os.path.join(args.file_path, manifest_name)
+		uploaded = []
+		if os.path.exists(manifest):
+			f = open(manifest)
+			try:
+				uploaded = [line.strip() for line in f if line.strip()]
+			finally:
+				f.close()
+		start = time.time()
+		sessions, files = catalog.rebuild(args.file_path, uploaded)
+		print("Indexed %d sessions, %d files in %.2fs" % (sessions, files, time.time() - start))
+	if args.pending:
+		for session in catalog.pending_uploads():
+			print(session)
+	catalog.close()
@@ -9,17 +9,38 @@ tumblr_blog = 'TUMBLR_BLOG' # replace with your tumblr account name without .tum
 tagsForTumblr = "MyTagsHere" # change to tags you want, separated with commas
 
 #Config settings to change behavior of photo booth
+backend = 'pi' # 'pi' for the real camera, button and monitor. 'sim' to run without any of them, e.g. for benchmarks.
 monitor_w = 800    # width of the display monitor
 monitor_h = 480    # height of the display monitor
 file_path = '/home/pi/photobooth/pics/' # path to save images
+catalog_path = '/home/pi/photobooth/catalog.db' # index of sessions and their files. Keep it outside file_path.
+event_name = 'MyEvent' # sessions are tagged with this in the catalog, so one event's pics can be found later
+metrics_log = '/home/pi/photobooth/sessions.jsonl' # stage timings of every session, one json line each. None to turn off.
+metrics_port = 8000 # serve counters and timings at http://<booth>:8000/metrics. 0 to turn off.
+gallery_port = 8080 # guests browse the sessions on their phones at http://<booth>:8080/ over the local Wi-Fi. 0 to turn off.
+upload_queue_path = '/home/pi/photobooth/upload_queue/' # where posts wait to be uploaded. Keep it outside file_path.
 clear_on_startup = False # True will clear previously stored photos as the program launches. False will leave all previous photos.
+storage_quota_mb = 0 # most the pics may take, in MB. The oldest uploaded sessions are removed to keep under it. 0 for no quota.
+storage_min_free_mb = 500 # keep this much of the card free, removing the oldest uploaded sessions if need be. 0 to never check.
+keep_days = 0 # remove uploaded sessions older than this many days. 0 keeps them until space is needed.
+keep_frames = True # False removes a session's full size frames once its upload is confirmed. The animation, web copies and strip stay.
+keep_unposted = True # False lets the quota remove sessions that were never queued for upload (post_online off), oldest first
 debounce = 0.3 # how long to debounce the button. Add more time if the button triggers too many times.
 post_online = True # True to upload images. False to store locally only.
+upload_target_seconds = 10 # on a slow link, shrink posts to upload in about this long. 0 always posts full size.
 capture_count_pics = True # if true, show a photo count between taking photos. If false, do not. False is faster.
 make_gifs = True   # True to make an animated gif. False to post 4 jpgs into one post.
 hi_res_pics = False  # True to save high res pics from camera.
                     # If also uploading, the program will also convert each image to a smaller image before making the gif.
                     # False to first capture low res pics. False is faster.
                     # Careful, each photo costs against your daily Tumblr upload max.
+full_sensor = False # True takes pics at the camera's full 2592x1944, e.g. for prints. Needs gpu_mem=256 in /boot/config.txt.
+                    # Decoding is kept within derivatives.decode_budget_mb, so the Pi's memory holds out.
+animation_format = 'gif' # gif, webp (a fraction of the size) or mp4 (smaller still, needs ffmpeg). Falls back to gif if it can't be made.
+make_strips = False # True to also save a 2x6 inch, 300 DPI print strip of each session
+strip_logo = None # path to a logo for the bottom of the print strip. None for just the date.
+burst_size = 1 # frames per pose. More than 1 shoots a quick burst and keeps the sharpest, best exposed frame.
+pipeline_workers = 0 # 1 or more to make gifs in background processes while the next group takes pics. 0 does it during the session.
+pipeline_backlog = 3 # most sessions processing at once. When full, the next session waits, which keeps memory in check.
 camera_iso = 800    # adjust for lighting issues. Normal is 100 or 200. Sort of dark is 400. Dark is 800 max.
                     # available options: 100, 200, 320, 400, 500, 640, 800
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Keeps track of whether the upload host can be reached, from a background thread,
+# so sessions and the upload queue read a cached answer instead of waiting on DNS and a connect.
+# The state only flips after several probes agree, so one dropped packet on flaky venue Wi-Fi
+# doesn't stop the uploads, and one lucky probe doesn't start them.
+
+import socket
+import threading
+import time
+from collections import deque
+try:
+	from urlparse import urlparse # python 2
+except ImportError:
+	from urllib.parse import urlparse
+
+interval = 10 # seconds between probes
+timeout = 2 # seconds a probe may take
+ttl = 60 # seconds a result stays good. Older than this (the probe thread is stuck) counts as offline.
+up_after = 2 # successful probes in a row before going online. The first probe after starting decides on its own.
+down_after = 2 # failed probes in a row before going offline
+history_size = 100 # state changes kept for metrics
+
+class ConnectivityMonitor(object):
+
+	# url is the upload host, e.g. https://api.tumblr.com/
+	# With a requests session, or batch_upload.ThreadSessions, probes are HEAD requests through it, which keeps a connection warm.
+	# Without one, probes are a plain TCP connect.
+	# on_probe(seconds, ok, online) is called after every probe.
+	def __init__(self, url, session=None, on_probe=None):
+		self.url = url
+		parsed = urlparse(url)
+		self.host = parsed.hostname
+		self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+		self.session = session
+		self.on_probe = on_probe
+		self.state = False
+		self.checked = 0 # when the last probe finished
+		self.streak = 0 # probes in a row that disagreed with state
+		self.probes = 0
+		self.failures = 0
+		self.history = deque(maxlen=history_size) # (time, online) at every change
+		self.lock = threading.Lock()
+		self.wake = threading.Event()
+		self.stopped = False
+
+	def probe(self):
+		try:
+			if self.session is not None:
+				self.session.head(self.url, timeout=timeout, allow_redirects=False).close()
+			else:
+				s = socket.create_connection((self.host, self.port), timeout)
+				s.close()
+			return True
+		except Exception:
+			return False
+
+	# probe once and update the state
+	def check(self):
+		start = time.time()
+		ok = self.probe()
+		seconds = time.time() - start
+		with self.lock:
+			self.probes += 1
+			if not ok:
+				self.failures += 1
+			self.checked = time.time()
+			if ok == self.state:
+				self.streak = 0
+			else:
+				self.streak += 1
+				if self.streak >= (up_after if ok else down_after) or self.probes == 1:
+					self.state = ok
+					self.streak = 0
+					self.history.append((self.checked, ok))
+					print("Connectivity: " + ("online" if ok else "offline"))
+			online = self.state
+		if self.on_probe is not None:
+			self.on_probe(seconds, ok, online)
+		return online
+
+	# the cached state. Never blocks on the network.
+	def online(self):
+		with self.lock:
+			return self.state and time.time() - self.checked < ttl
+
+	# probe again now, e.g. after an upload failed
+	def recheck(self):
+		self.wake.set()
+
+	def run(self):
+		while not self.stopped:
+			self.check()
+			self.wake.wait(interval)
+			self.wake.clear()
+
+	def start(self):
+		thread = threading.Thread(target=self.run, name='connectivity')
+		thread.daemon = True
+		thread.start()
+		return thread
+
+	def stop(self):
+		self.stopped = True
+		self.wake.set()
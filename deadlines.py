@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# Time budgets for the stages of a session, so a hung camera, encoder or disk can't freeze the booth.
+# A stage runs under a SIGALRM timer. If it overruns, DeadlineExceeded is raised on the main thread,
+# wherever it is waiting, the stage is marked breached and the session carries on with a fallback.
+# Work already handed to another thread can't be stopped, so it is left to finish in the background.
+# Signals only reach the main thread, so stages started on any other thread run without a limit.
+# Stages nest: an inner stage never outlives the one it is in.
+# The event loop runs each of its callbacks under a guard. A stage that runs out while a callback it didn't start
+# is running waits for that callback to return, so the loop's timers and results from other threads are never cut off.
+
+import signal
+import threading
+import time
+
+class DeadlineExceeded(Exception):
+
+	def __init__(self, stage):
+		Exception.__init__(self, "%s ran past its %.1fs deadline" % (stage.name, stage.seconds))
+		self.stage = stage
+
+# one stage's budget. Use with 'with'; breached is set, and the exception swallowed, if it ran out.
+class Stage(object):
+
+	def __init__(self, deadlines, name, seconds):
+		self.deadlines = deadlines
+		self.name = name
+		self.seconds = seconds # None for no limit of its own
+		self.due = None # when it runs out, from the nearest limit of its own or an outer stage
+		self.breached = False
+
+	def __enter__(self):
+		self.deadlines.push(self)
+		return self
+
+	def __exit__(self, kind, error, tb):
+		self.deadlines.pop(self)
+		if isinstance(error, DeadlineExceeded) and error.stage is self:
+			self.breached = True
+			self.deadlines.breach(self.name)
+			return True
+		return False
+
+# holds back the deadlines of the stages running when it was entered, until it exits. Use with 'with'.
+class Guard(object):
+
+	def __init__(self, deadlines):
+		self.deadlines = deadlines
+		self.active = False
+
+	def __enter__(self):
+		deadlines = self.deadlines
+		if deadlines.enabled and threading.current_thread() is deadlines.thread:
+			deadlines.guards.append(len(deadlines.stack))
+			self.active = True
+		return self
+
+	def __exit__(self, kind, error, tb):
+		if not self.active:
+			return False
+		deadlines = self.deadlines
+		deadlines.guards.pop()
+		if deadlines.pending and kind is None: # one ran out while guarded, end it now
+			deadlines.pending = False
+			deadlines.check()
+		return False
+
+class Deadlines(object):
+
+	# budgets maps stage names to seconds. Stages not in it have no limit.
+	# on_breach(name) is called for every stage that runs out, e.g. to count it in the metrics.
+	# Make it on the main thread.
+	def __init__(self, budgets, on_breach=None):
+		self.budgets = budgets
+		self.on_breach = on_breach
+		self.breaches = {} # stage name -> times it ran out
+		self.stack = [] # the stages running now, outermost first
+		self.guards = [] # for each guard entered, how many stages were running then
+		self.pending = False # a stage ran out while guarded
+		self.thread = threading.current_thread()
+		self.enabled = hasattr(signal, 'setitimer') # not on Windows
+		if self.enabled:
+			signal.signal(signal.SIGALRM, self.expired)
+
+	def budget(self, name):
+		return self.budgets.get(name)
+
+	# a stage to run with 'with'. seconds overrides the budget, e.g. for a stage that covers several pics.
+	def stage(self, name, seconds=None):
+		if seconds is None:
+			seconds = self.budget(name)
+		return Stage(self, name, seconds)
+
+	def push(self, stage):
+		if not self.enabled or threading.current_thread() is not self.thread:
+			return
+		if stage.seconds is not None:
+			stage.due = time.time() + stage.seconds
+		if self.stack and self.stack[-1].due is not None and (stage.due is None or self.stack[-1].due < stage.due):
+			stage.due = self.stack[-1].due
+		self.stack.append(stage)
+		self.arm()
+
+	def pop(self, stage):
+		if stage in self.stack:
+			self.stack.remove(stage)
+			self.arm()
+
+	# set the timer for the innermost running stage, or clear it
+	def arm(self):
+		if self.stack and self.stack[-1].due is not None:
+			signal.setitimer(signal.ITIMER_REAL, max(0.001, self.stack[-1].due - time.time()))
+		else:
+			signal.setitimer(signal.ITIMER_REAL, 0)
+
+	# a guard for a callback, e.g. one run by the event loop
+	def guard(self):
+		return Guard(self)
+
+	# the SIGALRM handler
+	def expired(self, signum, frame):
+		self.check()
+
+	# The outermost stage that has run out ends, with everything inside it.
+	# If it was running before the innermost guard was entered, it ends when that guard exits.
+	def check(self):
+		now = time.time()
+		for i, stage in enumerate(self.stack):
+			if stage.due is not None and stage.due <= now:
+				if self.guards and i < self.guards[-1]:
+					self.pending = True
+					return
+				raise DeadlineExceeded(stage)
+		self.arm() # early, or left over from a stage that has just finished
+
+	def breach(self, name):
+		self.breaches[name] = self.breaches.get(name, 0) + 1
+		if self.on_breach is not None:
+			self.on_breach(name)
+
+	def report(self):
+		if not self.breaches:
+			return "deadlines: none missed"
+		parts = ["%s %d" % (name, self.breaches[name]) for name in sorted(self.breaches)]
+		return "deadlines: %d missed (%s)" % (sum(self.breaches.values()), ", ".join(parts))
+
+# fn, held up by seconds first. A slow stand-in for trying out the deadlines and their fallbacks.
+def slowed(fn, seconds):
+	def slow(*args, **kwargs):
+		time.sleep(seconds)
+		return fn(*args, **kwargs)
+	return slow
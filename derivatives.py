@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# Every smaller version of a session's pics (gif frame, replay, web, print) from one decode of each pic.
+# The jpeg decoder does the first downscale itself (draft mode, in the DCT domain), to the largest size
+# any derivative needs. Each derivative is then resized from the next larger one, not from the original.
+# Pillow lets go of the GIL while it decodes and resizes, so a thread per pic keeps every core busy.
+# Black and white pics can be made in mode 'L': the decoder skips the colour planes,
+# and every image after that takes a third of the memory.
+# Memory stays bounded at any camera resolution, the full 2592x1944 sensor included: fewer pics are decoded at once
+# when each decodes bigger, and the worker threads are kept from session to session, so their memory is reused
+# rather than each session's new threads claiming more.
+
+import atexit
+import os
+import time
+from multiprocessing.pool import ThreadPool
+from PIL import Image
+
+workers = 4 # pics decoded and resized at once
+decode_budget_mb = 24 # most decoded pixels held at once across the threads. A pic needing more gets the threads to itself.
+quality = 85 # jpg quality of saved derivatives
+
+# the size of a size-shaped image shrunk to fit inside box. Never enlarges.
+def fitted(size, box):
+	if box is None:
+		return size
+	scale = min(1.0, box[0] / float(size[0]), box[1] / float(size[1]))
+	return max(1, int(round(size[0] * scale))), max(1, int(round(size[1] * scale)))
+
+# the size the jpeg decoder gives for a size-shaped pic in draft mode, asked for at least target.
+# It can only shrink by 1/2, 1/4 or 1/8; anything bigger than half the pic is a full size decode.
+def decoded_size(size, target):
+	scale = 1
+	while scale < 8 and size[0] // (scale * 2) >= target[0] and size[1] // (scale * 2) >= target[1]:
+		scale *= 2
+	return (size[0] + scale - 1) // scale, (size[1] + scale - 1) // scale
+
+# how many pics to decode at once, keeping their decoded pixels inside decode_budget_mb
+def decode_threads(pic_size, specs, mode, count):
+	target = max((fitted(pic_size, box) for name, box, save in specs), key=lambda size: size[0] * size[1])
+	w, h = decoded_size(pic_size, target)
+	mb = w * h * (1 if mode == 'L' else 4) / (1024.0 * 1024) # Pillow keeps RGB as 4 bytes a pixel
+	return max(1, min(workers, count, int(decode_budget_mb // mb)))
+
+pool = None # the worker threads, kept between sessions
+pool_pid = None # the process that made them, so a forked pipeline worker makes its own
+
+def worker_pool():
+	global pool, pool_pid
+	if pool is None or pool_pid != os.getpid():
+		pool = ThreadPool(workers)
+		pool_pid = os.getpid()
+		atexit.register(close)
+	return pool
+
+# stop the worker threads, before the interpreter starts taking itself apart
+def close():
+	global pool
+	if pool is not None and pool_pid == os.getpid():
+		pool.close()
+		pool.join()
+	pool = None
+
+# the derivatives of one pic. source is a path or a file-like object.
+# specs are (name, (max width, max height) or None for full size, save). Saved ones are written to path_prefix-name.jpg.
+# mode is 'RGB', or 'L' for one channel grey. keep names the derivatives to hand back, the rest are only saved. None keeps all.
+# returns ({name: image}, {'decode' or name: seconds})
+def make(source, specs, path_prefix=None, mode='RGB', keep=None):
+	timings = {}
+	start = time.time()
+	img = Image.open(source)
+	targets = [(name, fitted(img.size, box), save) for name, box, save in specs]
+	targets.sort(key=lambda t: t[1][0] * t[1][1], reverse=True) # largest first, so each resizes from the one before
+	img.draft(mode, targets[0][1]) # decode at the smallest scale still at least as big as the largest target
+	current = img.convert(mode)
+	timings['decode'] = time.time() - start
+	pics = {}
+	for name, size, save in targets:
+		start = time.time()
+		if current.size != size:
+			current = current.resize(size, Image.LANCZOS)
+		if save and path_prefix is not None:
+			current.save(path_prefix + '-' + name + '.jpg', 'JPEG', quality=quality)
+		if keep is None or name in keep:
+			pics[name] = current
+		timings[name] = time.time() - start
+	return pics, timings
+
+# the derivatives of every pic, on as many threads as decode_budget_mb allows. path_prefixes line up with sources, or None to save nothing.
+# All the pics are expected to be the same size, as they are from one session.
+# returns ({name: [image per pic]}, {'decode' or name: seconds, summed over the pics})
+def make_all(sources, specs, path_prefixes=None, mode='RGB', keep=None):
+	if path_prefixes is None:
+		path_prefixes = [None] * len(sources)
+	pic_size = Image.open(sources[0]).size # only reads the jpg header
+	if hasattr(sources[0], 'seek'):
+		sources[0].seek(0)
+	jobs = list(zip(sources, path_prefixes))
+	threads = decode_threads(pic_size, specs, mode, len(jobs))
+	lanes = [jobs[i::threads] for i in range(threads)] # each thread makes its lane's pics one after another
+	done = worker_pool().map(lambda lane: [make(source, specs, prefix, mode, keep) for source, prefix in lane], lanes)
+	results = [None] * len(jobs)
+	for i, lane in enumerate(done):
+		results[i::threads] = lane
+	pics = dict((name, [p[name] for p, t in results]) for name, box, save in specs if keep is None or name in keep)
+	timings = {}
+	for p, t in results:
+		for name, seconds in t.items():
+			timings[name] = timings.get(name, 0) + seconds
+	return pics, timings
+
+# peak is the stage's peak memory in MB, from session_metrics, if it was tracked
+def report(timings, peak=None):
+	parts = ["%s %.3fs" % (name, timings[name]) for name in sorted(timings)]
+	if peak is not None:
+		parts.append("peak memory %.0fMB" % peak)
+	return "derivatives: " + ", ".join(parts)
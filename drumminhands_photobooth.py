@@ -2,21 +2,36 @@
 # created by chris@drumminhands.com
 # see instructions at http://www.drumminhands.com/2014/06/15/raspberry-pi-photo-booth/
 
-import os
-import glob
 import time
+launched = time.time() # for the startup timings
+import os
+import io
+import threading
 import traceback
 from time import sleep
-import RPi.GPIO as GPIO
-import picamera # http://picamera.readthedocs.org/en/release-1.4/install2.html
+import argparse
+import backends # real and simulated hardware, backends.py
+import frame_store # keeps a session's pics in memory, frame_store.py
 import atexit
 import sys
-import socket
 import pygame
+from PIL import Image # https://pillow.readthedocs.io/
 from pygame.locals import QUIT, KEYDOWN, K_ESCAPE
-import pytumblr # https://github.com/tumblr/pytumblr
 import config # this is the config python file config.py
-from signal import alarm, signal, SIGALRM, SIGKILL
+import burst # several frames per pose, keeping the best, burst.py
+import animation # gif, webp or mp4 animations, animation.py
+import derivatives # every smaller size of each pic from one decode, derivatives.py
+import photo_strip # print layout of a session, photo_strip.py
+import screen_cache # preloaded, pre-scaled screen images, screen_cache.py
+import renderer # frame scheduled replay and countdown, renderer.py
+import session_metrics # per stage timings, session_metrics.py
+import event_loop # runs button presses, screen events and timers, event_loop.py
+import pipeline as pipelining # post-capture work in worker processes, pipeline.py
+import catalog as session_catalog # index of sessions, catalog.py
+import storage as pic_storage # event and day folders, quota and pruning, storage.py
+import deadlines as deadline_timers # a time budget for each stage, deadlines.py
+import gallery as guest_gallery # sessions served to guests' phones, gallery.py
+import socket
 
 ########################
 ### Variables Config ###
@@ -29,13 +44,23 @@ capture_delay = 1 # delay between pics
 prep_delay = 5 # number of seconds at step 1 as users prep to have photo taken
 gif_delay = 100 # How much time between frames in the animated gif
 restart_delay = 10 # how long to display finished message before beginning a new session
-test_server = 'www.google.com'
+upload_url = 'https://api.tumblr.com/' # the upload host, checked in the background to see if the booth is online
+camera_saturation = -100 # -100 takes black and white pics. Change to 0 if you want color images.
+pic_mode = 'L' if camera_saturation == -100 else 'RGB' # black and white pics are resized, encoded and replayed as one channel grey
 
 # full frame of v1 camera is 2592x1944. Wide screen max is 2592,1555
 # if you run into resource issues, try smaller, like 1920x1152. 
+# or set full_sensor = True in config.py, which takes the full frame and keeps its processing within a memory budget
 # or increase memory http://picamera.readthedocs.io/en/release-1.12/fov.html#hardware-limits
 high_res_w = 1296 # width of high res image, if taken
 high_res_h = 972 # height of high res image, if taken
+full_res_w = 2592 # width of the camera's full frame, taken when config.full_sensor is True
+full_res_h = 1944 # height of the camera's full frame
+
+# most seconds a stage may take before the session goes on without it, so a stalled camera, encoder or disk can't freeze the booth.
+# capture is per pic. upload is how long a stalled post to Tumblr waits before the queue tries it again later.
+# backpressure is the wait for a free worker process, when the pipeline has a backlog.
+stage_budgets = {'camera_init': 10, 'capture': 10, 'backpressure': 30, 'derivatives': 20, 'gif': 20, 'strip': 20, 'save': 15, 'replay': 30, 'upload': 60}
 
 #############################
 ### Variables that Change ###
@@ -47,33 +72,48 @@ offset_x = 0 # how far off to left corner to display photos
 offset_y = 0 # how far off to left corner to display photos
 replay_delay = 1 # how much to wait in-between showing pics on-screen after taking
 replay_cycles = 2 # how many times to show each photo on-screen after taking
+replay_cache_size = 8 # how many scaled replay images to keep in memory
+queued_replay_cycles = 1 # replay cycles when there is a line of guests. 0 skips the replay.
+guests_waiting = False # set when the button is pressed during a session
+show_countdown = True # count down the seconds over the instructions screen
+camera_degraded = False # set when the camera misses a deadline. Pics are low res from then on.
+pipeline_stalled = False # set when no worker process frees up in time. Sessions are finished locally until one does.
+
+# smaller versions of each pic, all made from one decode: (name, largest width x height, save as a jpg)
+derivative_sizes = [
+	('gif', (500, 500), False), # Tumblr's max animated gif's are 500 pixels wide
+	('replay', (config.monitor_w, config.monitor_h), False), # shown on screen after the pics are taken
+	('web', (1024, 1024), True), # for viewing online, saved as -01-web.jpg and so on
+	('thumb', (320, 320), True), # the guests' gallery's index, saved as -01-thumb.jpg
+]
+derivative_uses = ['gif', 'replay', 'print'] # the derivatives the session goes on to use. The rest are saved and let go of straight away.
+
+# screens shown by the booth, loaded and scaled at startup
+static_screens = ["intro.png", "instructions.png", "pose1.png", "pose2.png", "pose3.png", "pose4.png",
+	"processing.png", "uploading.png", "finished.png", "finished2.png"]
 
 ####################
 ### Other Config ###
 ####################
 real_path = os.path.dirname(os.path.realpath(__file__))
 
-# Setup the tumblr OAuth Client
-client = pytumblr.TumblrRestClient(
-    config.consumer_key,
-    config.consumer_secret,
-    config.oath_token,
-    config.oath_secret,
-)
-
-# GPIO setup
-GPIO.setmode(GPIO.BOARD)
-GPIO.setup(led_pin,GPIO.OUT) # LED
-GPIO.setup(btn_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.output(led_pin,False) #for some reason the pin turns on at the beginning of the program. Why?
-
-# initialize pygame
-pygame.init()
-pygame.display.set_mode((config.monitor_w, config.monitor_h))
-screen = pygame.display.get_surface()
-pygame.display.set_caption('Photo Booth Pics')
-pygame.mouse.set_visible(False) #hide the mouse cursor
-pygame.display.toggle_fullscreen()
+# hardware, the Tumblr client and the upload queue are set up by setup()
+gpio = None # button and LED
+camera = None # camera_manager.CameraManager
+screen = None # pygame display surface
+screens = None # screen_cache.ScreenCache
+gallery = None # gallery.Gallery, when config.gallery_port is set
+display = None # renderer.Renderer, draws everything on screen
+client = None # pytumblr.TumblrRestClient, or a stand-in on the sim backend
+uploads = None # upload_queue.UploadQueue
+metrics = None # session_metrics.Metrics
+loop = None # event_loop.EventLoop, runs everything on the main thread
+pipeline = None # pipeline.Pipeline, when post-capture work runs in worker processes
+catalog = None # catalog.Catalog, the index of sessions and their files
+storage = None # storage.Storage, where sessions are saved and what is pruned
+deadlines = None # deadlines.Deadlines, the time budget of each stage
+connection = None # connectivity.ConnectivityMonitor, on the pi backend
+startup_times = [] # (stage, seconds) for each step of setup()
 
 #################
 ### Functions ###
@@ -82,42 +122,35 @@ pygame.display.toggle_fullscreen()
 # clean up running programs as needed when main program exits
 def cleanup():
   print('Ended abruptly')
+  if camera is not None:
+    camera.close()
   pygame.quit()
-  GPIO.cleanup()
-atexit.register(cleanup)
+  if gpio is not None:
+    gpio.cleanup()
 
-# A function to handle keyboard/mouse/device input events    
+# A function to handle keyboard/mouse/device input events. The event loop calls it on every turn.
 def input(events):
     for event in events:  # Hit the ESC key to quit the slideshow.
         if (event.type == QUIT or
             (event.type == KEYDOWN and event.key == K_ESCAPE)):
             pygame.quit()
+            sys.exit(0) # quit Python
                 
 #delete files in folder
 def clear_pics(channel):
-	files = glob.glob(config.file_path + '*')
-	for f in files:
-		os.remove(f) 
+	removed = storage.clear(uploads) # every file in the catalog, and any from before it, and their queued posts
 	#light the lights in series to show completed
-	print "Deleted previous pics"
-	for x in range(0, 3): #blink light
-		GPIO.output(led_pin,True); 
-		sleep(0.25)
-		GPIO.output(led_pin,False);
-		sleep(0.25)
-
-# check if connected to the internet   
-def is_connected():
-  try: 
-    # see if we can resolve the host name -- tells us if there is a DNS listening  
-    host = socket.gethostbyname(test_server)
-    # connect to the host -- tells us if the host is actually
-    # reachable
-    s = socket.create_connection((host, 80), 2)
-    return True
-  except:
-     pass
-  return False    
+	print "Deleted previous pics, %.1fMB" % (removed / 1048576.0)
+	blink(3)
+
+# blink the light, without holding up the event loop
+# returns the timers, to cancel the blinking
+def blink(times):
+	timers = []
+	for x in range(0, times):
+		timers.append(loop.call_later(x * 0.5, gpio.led, True))
+		timers.append(loop.call_later(x * 0.5 + 0.25, gpio.led, False))
+	return timers
 
 # set variables to properly display the image on screen at right ratio
 def set_demensions(img_w, img_h):
@@ -128,28 +161,7 @@ def set_demensions(img_w, img_h):
     global transform_y, transform_x, offset_y, offset_x
 
     # based on output screen resolution, calculate how to display
-    ratio_h = (config.monitor_w * img_h) / img_w 
-
-    if (ratio_h < config.monitor_h):
-        #Use horizontal black bars
-        #print "horizontal black bars"
-        transform_y = ratio_h
-        transform_x = config.monitor_w
-        offset_y = (config.monitor_h - ratio_h) / 2
-        offset_x = 0
-    elif (ratio_h > config.monitor_h):
-        #Use vertical black bars
-        #print "vertical black bars"
-        transform_x = (config.monitor_h * img_w) / img_h
-        transform_y = config.monitor_h
-        offset_x = (config.monitor_w - transform_x) / 2
-        offset_y = 0
-    else:
-        #No need for black bars as photo ratio equals screen ratio
-        #print "no black bars"
-        transform_x = config.monitor_w
-        transform_y = config.monitor_h
-        offset_y = offset_x = 0
+    transform_x, transform_y, offset_x, offset_y = screen_cache.fit(img_w, img_h, config.monitor_w, config.monitor_h)
 
     # uncomment these lines to troubleshoot screen ratios
 #     print str(img_w) + " x " + str(img_h)
@@ -160,111 +172,194 @@ def set_demensions(img_w, img_h):
 #     print "offset_x: "+ str(offset_x)
 
 # display one image on screen
-def show_image(image_path):
-
-	# clear the screen
-	screen.fill( (0,0,0) )
-
-	# load the image
-	img = pygame.image.load(image_path)
-	img = img.convert() 
+# opener is an optional function returning the image as a file-like object, for images held in memory
+def show_image(image_path, opener=None):
 
-	# set pixel dimensions based on image
-	set_demensions(img.get_width(), img.get_height())
+	# get the image, already loaded and scaled to fit the current display
+	img, offset = screens.get(image_path, opener)
+	display.show(img, offset) # only redraws what changed
 
-	# rescale the image to fit the current display
-	img = pygame.transform.scale(img, (transform_x,transfrom_y))
-	screen.blit(img,(offset_x,offset_y))
-	pygame.display.flip()
+# the intro screen, with how much room is left for pics
+def show_intro():
+	show_image(real_path + "/intro.png")
+	if storage is not None:
+		display.caption(storage.status(), (255, 80, 80) if storage.stuck else renderer.caption_color)
 
 # display a blank screen
 def clear_screen():
-	screen.fill( (0,0,0) )
-	pygame.display.flip()
-
-# display a group of images
-def display_pics(jpg_group):
-    for i in range(0, replay_cycles): #show pics a few times
-		for i in range(1, total_pics+1): #show each pic
-			show_image(config.file_path + jpg_group + "-0" + str(i) + ".jpg")
-			time.sleep(replay_delay) # pause 
-				
-# define the photo taking function for when the big button is pressed 
-def start_photobooth(): 
+	display.clear()
 
-	input(pygame.event.get()) # press escape to exit pygame. Then press ctrl-c to exit python.
-
-	################################# Begin Step 1 #################################
-	
-	print "Get Ready"
-	GPIO.output(led_pin,False);
-	show_image(real_path + "/instructions.png")
-	sleep(prep_delay)
-	
-	# clear the screen
-	clear_screen()
-	
-	camera = picamera.PiCamera()  
-	camera.vflip = False
-	camera.hflip = True # flip for preview, showing users a mirror image
-	camera.saturation = -100 # comment out this line if you want color images
-	camera.iso = config.camera_iso
-	
-	pixel_width = 0 # local variable declaration
-	pixel_height = 0 # local variable declaration
-	
-	if config.hi_res_pics:
-		camera.resolution = (high_res_w, high_res_h) # set camera resolution to high res
+# display a group of images, straight from the session's in-memory frames
+# replay is an optional list of the pics already decoded at screen size
+def display_pics(frames, cycles=replay_cycles, replay=None):
+	if replay is not None:
+		pics = [screens.get(frames.path(i), lambda: replay[i-1]) for i in range(1, total_pics+1)]
 	else:
-		pixel_width = 500 # maximum width of animated gif on tumblr
-		pixel_height = config.monitor_h * pixel_width // config.monitor_w
-		camera.resolution = (pixel_width, pixel_height) # set camera resolution to low res
-		
-	################################# Begin Step 2 #################################
-	
-	print "Taking pics"
-	
-	now = time.strftime("%Y-%m-%d-%H-%M-%S") #get the current date and time for the start of the filename
-	
+		pics = [screens.get(frames.path(i), lambda: frames.reader(i)) for i in range(1, total_pics+1)]
+	display.slideshow(pics * cycles, replay_delay) # show pics a few times, fading from one to the next
+
+# take one pic into frames. With a burst, only its best frame is kept.
+# Returns how long scoring took, which comes out of the capture_delay that follows.
+def take_pic(frames, shots):
+	if shots is None:
+		frames.capture(camera)
+		return 0
+	shots.fill(camera)
+	start = time.time()
+	data, index = loop.run_in_thread(shots.best)
+	frames.add(data)
+	scoring = time.time() - start
+	metrics.observe('burst_scoring', scoring)
+	return scoring
+				
+# the resolution to take pics at. Low res once the camera has missed a deadline.
+def camera_resolution():
+	if config.full_sensor and not camera_degraded:
+		return full_res_w, full_res_h # the whole sensor
+	if config.hi_res_pics and not camera_degraded:
+		return high_res_w, high_res_h
+	pixel_width = 500 # maximum width of animated gif on tumblr
+	pixel_height = config.monitor_h * pixel_width // config.monitor_w
+	return pixel_width, pixel_height
+
+# take the session's pics into frames, each within the capture deadline.
+# Returns False as soon as one misses it, which leaves frames short.
+def take_pics(frames, shots, timer):
 	if config.capture_count_pics:
 		try: # take the photos
 			for i in range(1,total_pics+1):
-				camera.hflip = True # preview a mirror image
-				camera.start_preview(resolution=(config.monitor_w, config.monitor_h)) # start preview at low res but the right ratio
-				time.sleep(2) #warm up camera
-				GPIO.output(led_pin,True) #turn on the LED
-				filename = config.file_path + now + '-0' + str(i) + '.jpg'
-				camera.hflip = False # flip back when taking photo
-				camera.capture(filename)
-				print(filename)
-				GPIO.output(led_pin,False) #turn off the LED
-				camera.stop_preview()
+				with timer.span('capture_' + str(i)), deadlines.stage('capture') as stage:
+					camera.show_preview() # preview a mirror image
+					camera.settle(sleep=loop.wait) # wait for the exposure to settle, rather than a fixed warm up
+					gpio.led(True) #turn on the LED
+					scoring = take_pic(frames, shots)
+					print(frames.path(i) + " (settled in %.2fs)" % camera.last_settle)
+					gpio.led(False) #turn off the LED
+					camera.hide_preview()
+				if stage.breached:
+					return False
 				show_image(real_path + "/pose" + str(i) + ".png")
-				time.sleep(capture_delay) # pause in-between shots
+				loop.wait(max(0, capture_delay - scoring)) # pause in-between shots
 				clear_screen()
 				if i == total_pics+1:
 					break
 		finally:
-			camera.close()
+			camera.hide_preview()
+			gpio.led(False)
 	else:
-		camera.start_preview(resolution=(config.monitor_w, config.monitor_h)) # start preview at low res but the right ratio
-		time.sleep(2) #warm up camera
+		with timer.span('capture_1'), deadlines.stage('capture') as stage: # the first shot includes the exposure settling
+			camera.show_preview()
+			camera.settle(sleep=loop.wait) # wait for the exposure to settle, rather than a fixed warm up
+		if stage.breached:
+			camera.hide_preview()
+			return False
 		
 		try: #take the photos
-			for i, filename in enumerate(camera.capture_continuous(config.file_path + now + '-' + '{counter:02d}.jpg')):
-				GPIO.output(led_pin,True) #turn on the LED
-				print(filename)
-				time.sleep(capture_delay) # pause in-between shots
-				GPIO.output(led_pin,False) #turn off the LED
-				if i == total_pics-1:
-					break
+			if shots is not None: # a burst per pic, back to back
+				for i in range(1,total_pics+1):
+					with timer.span('capture_' + str(i)), deadlines.stage('capture') as stage:
+						gpio.led(True) #turn on the LED
+						scoring = take_pic(frames, shots)
+						print(frames.path(i))
+					if stage.breached:
+						return False
+					loop.wait(max(0, capture_delay - scoring)) # pause in-between shots
+					gpio.led(False) #turn off the LED
+			else:
+				stream = io.BytesIO()
+				shot_start = time.time()
+				budget = deadlines.budget('capture')
+				with deadlines.stage('capture', budget and budget * total_pics) as stage: # one stream for all the pics
+					for i, stream in enumerate(camera.capture_continuous(stream)):
+						timer.add('capture_' + str(i+1), shot_start, time.time() - shot_start)
+						gpio.led(True) #turn on the LED
+						frames.add(stream.getvalue())
+						stream.seek(0) # picamera writes each frame after the last, so start the stream over
+						stream.truncate()
+						print(frames.path(i+1))
+						loop.wait(capture_delay) # pause in-between shots
+						gpio.led(False) #turn off the LED
+						if i == total_pics-1:
+							break
+						shot_start = time.time()
+				if stage.breached:
+					return False
 		finally:
-			camera.stop_preview()
-			camera.close()
+			camera.hide_preview()
+			gpio.led(False)
+	return True
+
+# define the photo taking function for when the big button is pressed 
+# pressed_at is when the button was pressed, to measure how quickly the booth responds
+def start_photobooth(pressed_at=None): 
+	global camera_degraded, pipeline_stalled
+
+	timer = metrics.session(None) # time every stage of the session. Named once the timestamp is known.
+
+	# Before taking any pics, make sure a worker process will be free for them.
+	# Only this session submits to the pipeline, so once there is room there still is after the capture.
+	local = pipeline is None # the rest of the session is done here, rather than in the worker processes
+	if not local and pipeline_stalled and pipeline.full(): # still no worker free, don't wait for one again
+		print "The worker processes are still busy, this session will be finished here"
+		local = True
+	elif not local:
+		pipeline_stalled = False
+		with timer.span('backpressure'), deadlines.stage('backpressure') as stage:
+			while pipeline.full(): # too many sessions still processing. Wait here to keep memory capped.
+				loop.wait(0.1)
+		if stage.breached: # a worker is hung or was killed, and its session may never come back
+			print "The worker processes missed their deadline, this session will be finished here"
+			pipeline_stalled = local = True
+
+	################################# Begin Step 1 #################################
+	
+	with timer.span('prep'):
+		print "Get Ready"
+		gpio.led(False);
+		show_image(real_path + "/instructions.png")
+		if pressed_at is not None:
+			metrics.observe('input_latency', time.time() - pressed_at)
+		if show_countdown:
+			display.countdown(prep_delay)
+		else:
+			loop.wait(prep_delay)
 		
-	########################### Begin Step 3 #################################
+		# clear the screen
+		clear_screen()
 	
-	input(pygame.event.get()) # press escape to exit pygame. Then press ctrl-c to exit python.
+	# the camera stays open between sessions, so only the settings change here
+	with timer.span('camera_init'):
+		with deadlines.stage('camera_init') as stage:
+			camera.configure(camera_resolution(), config.camera_iso, camera_saturation)
+		
+	################################# Begin Step 2 #################################
+	
+	print "Taking pics"
+	
+	now = time.strftime("%Y-%m-%d-%H-%M-%S") #get the current date and time for the start of the filename
+	session_path = storage.begin(now) # this event's folder for today, left alone by pruning until the session ends
+	frames = frame_store.SessionFrames(session_path, now) # the pics stay in memory for the whole session
+	timer.session_id = now
+	catalog.add_session(now)
+	shots = burst.Burst(config.burst_size) if config.burst_size > 1 else None
+	
+	if stage.breached or not take_pics(frames, shots, timer):
+		# the camera stalled. Start again at low res, and stay there: at high res the camera can run short of memory.
+		print "The camera missed its deadline, taking the pics again at low res"
+		camera_degraded = True
+		frames = frame_store.SessionFrames(session_path, now)
+		with deadlines.stage('camera_init') as stage:
+			camera.configure(camera_resolution(), config.camera_iso, camera_saturation)
+		if stage.breached or not take_pics(frames, shots, timer):
+			print "The camera isn't responding, ending the session"
+			storage.end(now)
+			print deadlines.report()
+			show_intro()
+			gpio.led(True)
+			timer.finish()
+			return
+		
+	########################### Begin Step 3 #################################
 	
 	print "Creating an animated gif" 
 	
@@ -273,99 +368,428 @@ def start_photobooth():
 	else:
 		show_image(real_path + "/processing.png")
 	
-	if config.make_gifs: # make the gifs
-		if config.hi_res_pics:
-			# first make a small version of each image. Tumblr's max animated gif's are 500 pixels wide.
-			for x in range(1, total_pics+1): #batch process all the images
-				graphicsmagick = "gm convert -size 500x500 " + config.file_path + now + "-0" + str(x) + ".jpg -thumbnail 500x500 " + config.file_path + now + "-0" + str(x) + "-sm.jpg"
-				os.system(graphicsmagick) #do the graphicsmagick action
-
-			graphicsmagick = "gm convert -delay " + str(gif_delay) + " " + config.file_path + now + "*-sm.jpg " + config.file_path + now + ".gif" 
-			os.system(graphicsmagick) #make the .gif
+	persisted = None
+	if not local: # hand the rest to the worker processes, so the next group can start as soon as the camera is free
+		pipeline.submit(session_job(frames), lambda result: loop.call_soon_threadsafe(session_processed, result))
+	else:
+		# save the jpgs to disk in the background, once. Nothing reads them back during the session.
+		# Without a gif, the jpgs are queued for upload once they are on disk.
+		persisted = frames.persist(on_done=lambda: session_saved(now, frames.paths(), upload=not config.make_gifs))
+	
+	pics = None
+	post_jpgs = False # set when the animation isn't made in time, so the jpgs are posted instead
+	if local:
+		# decode each pic once, straight from memory, and make every smaller size from that.
+		# On worker threads, so the screen and keys stay live.
+		with timer.span('derivatives'), deadlines.stage('derivatives') as stage:
+			prefixes = [session_path + now + "-0" + str(i) for i in range(1, total_pics+1)]
+			pics, timings = loop.run_in_thread(derivatives.make_all, frames.readers(), derivative_specs(frames), prefixes, pic_mode, derivative_uses)
+		if stage.breached: # no gif or strip this time, and the replay decodes the pics itself
+			print "The smaller pics missed their deadline, going on without them"
+			post_jpgs = config.make_gifs
 		else:
-			# make an animated gif with the low resolution images
-			graphicsmagick = "gm convert -delay " + str(gif_delay) + " " + config.file_path + now + "*.jpg " + config.file_path + now + ".gif" 
-			os.system(graphicsmagick) #make the .gif
-
-	if config.post_online: # turn off posting pics online in config.py
-		connected = is_connected() #check to see if you have an internet connection
-
-		if (connected==False):
-			print "bad internet connection"
-                    
-		while connected:
-			if config.make_gifs: 
-				try:
-					file_to_upload = config.file_path + now + ".gif"
-					client.create_photo(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], data=file_to_upload)
-					break
-				except ValueError:
-					print "Oops. No internect connection. Upload later."
-					try: #make a text file as a note to upload the .gif later
-						file = open(config.file_path + now + "-FILENOTUPLOADED.txt",'w')   # Trying to create a new file or open one
-						file.close()
-					except:
-						print('Something went wrong. Could not write file.')
-						sys.exit(0) # quit Python
-			else: # upload jpgs instead
-				try:
-					# create an array and populate with file paths to our jpgs
-					myJpgs=[0 for i in range(4)]
-					for i in range(4):
-						myJpgs[i]=config.file_path + now + "-0" + str(i+1) + ".jpg"
-					client.create_photo(config.tumblr_blog, state="published", tags=[config.tagsForTumblr], format="markdown", data=myJpgs)
-					break
-				except ValueError:
-					print "Oops. No internect connection. Upload later."
-					try: #make a text file as a note to upload the .gif later
-						file = open(config.file_path + now + "-FILENOTUPLOADED.txt",'w')   # Trying to create a new file or open one
-						file.close()
-					except:
-						print('Something went wrong. Could not write file.')
-						sys.exit(0) # quit Python				
+			for name, seconds in timings.items():
+				metrics.observe('derivative_' + name, seconds)
+			print derivatives.report(timings, timer.peaks.get('derivatives'))
+			for path in saved_derivatives(prefixes):
+				catalog.add_file(now, path, 'derivative')
+
+	if config.make_gifs and pics is not None: # make the gifs, or webp or mp4 animations
+		animation_path = animation.path(session_path + now, config.animation_format)
+		with timer.span('gif'), deadlines.stage('gif') as stage: # on a worker thread, so the screen and keys stay live
+			seconds, size = loop.run_in_thread(animation.encode, config.animation_format, pics['gif'], animation_path, gif_delay)
+		if stage.breached:
+			print "The animation missed its deadline, posting the jpgs instead"
+			post_jpgs = True
+		else:
+			print "Made %s in %.2fs, %dKB" % (animation_path, seconds, size // 1024)
+			with timer.span('enqueue'):
+				session_saved(now, gif=animation_path, upload=True)
+
+	if config.make_strips and pics is not None: # a strip to print
+		with timer.span('strip'), deadlines.stage('strip') as stage:
+			loop.run_in_thread(photo_strip.make_strip, pics['print'], session_path + now + "-strip.jpg", config.strip_logo, None, pic_mode)
+		if stage.breached:
+			print "The print strip missed its deadline, skipping it"
+		else:
+			catalog.add_file(now, session_path + now + "-strip.jpg", 'strip')
+
+	if post_jpgs: # queued once they are on disk
+		with deadlines.stage('save') as stage:
+			loop.run_in_thread(persisted.join)
+		if stage.breached:
+			print "The jpgs weren't saved in time to post"
+		else:
+			with timer.span('enqueue'):
+				session_saved(now, frames.paths(), upload=True)
+
+	if config.post_online and local: # turn off posting pics online in config.py
+		stats = uploads.stats()
+		print "Upload queue: %d waiting, oldest %ds, %d uploaded, %d failed attempts" % (stats['depth'], stats['oldest_age'], stats['succeeded'], stats['failed'])
+		if uploads.payloads is not None:
+			print uploads.payloads.report()
 	
 	########################### Begin Step 4 #################################
 	
-	input(pygame.event.get()) # press escape to exit pygame. Then press ctrl-c to exit python.
-	
+	# keep the replay short when others are waiting their turn
+	cycles = replay_cycles
+	if guests_waiting or (pipeline is not None and pipeline.pending() > 1):
+		cycles = queued_replay_cycles
 	try:
-		display_pics(now)
+		with timer.span('replay'), deadlines.stage('replay') as stage:
+			display_pics(frames, cycles, pics['replay'] if pics is not None else None)
+		if stage.breached:
+			print "Replay cut short"
 	except Exception, e:
 		tb = sys.exc_info()[2]
 		traceback.print_exception(e.__class__, e, tb)
 		pygame.quit()
 		
 	print "Done"
+	if persisted is not None:
+		with deadlines.stage('save') as stage:
+			loop.run_in_thread(persisted.join)
+		if stage.breached:
+			print "The jpgs are still being saved, going on without waiting"
+	if local: # with the pipeline, once it has finished the session
+		storage.end(now)
+	if gallery is not None and local: # with the pipeline, once it has finished the session
+		gallery.publish(now, session_path)
+	print screens.report()
+	print display.report()
+	print frames.report()
+	if shots is not None:
+		print shots.report()
+	print storage.report()
+	print deadlines.report()
+	if gallery is not None:
+		print gallery.report()
+	metrics.observe_storage(storage.headroom()[0], storage.removed_bytes)
+	storage.kick() # make room for the next session, if need be
 	
 	if config.post_online:
 		show_image(real_path + "/finished.png")
 	else:
 		show_image(real_path + "/finished2.png")
 	
-	time.sleep(restart_delay)
-	show_image(real_path + "/intro.png");
-	GPIO.output(led_pin,True) #turn on the LED
+	with timer.span('restart'):
+		loop.wait(restart_delay)
+		show_intro()
+		gpio.led(True) #turn on the LED
+	timer.finish()
+
+# the derivatives to make of a session's pics, plus one just big enough to print when making strips
+def derivative_specs(frames):
+	if config.make_strips:
+		pic_size = Image.open(frames.reader(1)).size # only reads the jpg header
+		return derivative_sizes + [('print', photo_strip.print_size(total_pics, pic_size), False)]
+	return derivative_sizes
+
+# the files derivatives.make_all() saves for pics starting with prefixes
+def saved_derivatives(prefixes):
+	return [prefix + '-' + name + ".jpg" for prefix in prefixes for name, box, save in derivative_sizes if save]
+
+# everything a worker process needs to finish a session, as plain data
+def session_job(frames):
+	return {'now': frames.now, 'file_path': frames.file_path, 'frames': frames.frames,
+		'derivatives': derivative_specs(frames), 'keep': [name for name in derivative_uses if name != 'replay'], 'make_gifs': config.make_gifs, 'animation_format': config.animation_format, 'gif_delay': gif_delay,
+		'make_strips': config.make_strips, 'strip_logo': config.strip_logo, 'mode': pic_mode}
+
+# record a session's saved files in the catalog.
+# With upload, also hand the post to the background upload queue, so the next guest doesn't wait on Tumblr.
+def session_saved(now, jpgs=(), gif=None, upload=False):
+	for path in jpgs:
+		catalog.add_file(now, path, 'frame')
+	if gif is not None:
+		catalog.add_file(now, gif, 'animation')
+	if upload and config.post_online: # turn off posting pics online in config.py
+		catalog.set_upload_status(now, 'pending')
+		if gif is not None:
+			uploads.enqueue_gif(gif, now)
+		else: # upload jpgs instead
+			uploads.enqueue_jpgs(jpgs, now)
+
+# the upload queue finished with a post, uploaded or given up on
+def upload_finished(job, status):
+	if job.get('session'):
+		catalog.set_upload_status(job['session'], status)
+		storage.kick() # its frames may not need keeping now
+
+# the upload queue tried a post. A failure may mean the connection dropped, so check now.
+def upload_attempted(seconds, ok):
+	metrics.observe_upload(seconds, ok)
+	if not ok and connection is not None:
+		connection.recheck()
+
+# the connectivity monitor checked the upload host
+def connectivity_probed(seconds, ok, online):
+	metrics.observe_connectivity(seconds, ok, online)
+	if online:
+		uploads.wake.set() # retry waiting posts now rather than after their back off
+
+# a worker process finished a session. Runs on the event loop.
+def session_processed(result):
+	if 'error' in result:
+		print "Could not process " + result['now'] + "\n" + result['error']
+		storage.end(result['now'])
+		return
+	for name, seconds in result['timings'].items():
+		metrics.observe(name, seconds)
+	for name, mb in result['peaks'].items():
+		metrics.observe_peak(name, mb)
+	session_saved(result['now'], result['jpgs'], result['gif'], upload=True)
+	for path in result['derivatives']:
+		catalog.add_file(result['now'], path, 'derivative')
+	if result['strip'] is not None:
+		catalog.add_file(result['now'], result['strip'], 'strip')
+	storage.end(result['now']) # now catalogued and queued, it may be pruned like any other
+	if result['gif'] is not None:
+		print "Made %s in %.2fs, %dKB" % (result['gif'], result['timings']['gif'], result['gif_bytes'] // 1024)
+	if gallery is not None:
+		gallery.publish(result['now'], os.path.dirname(result['jpgs'][0]))
+	print "Processed " + result['now'] + ", %d sessions still processing" % pipeline.pending()
+
+# the Tumblr client, the connectivity monitor and the upload queue.
+# Imported and built here, on a startup thread, so none of it holds up the intro screen.
+def start_uploads(backend_name):
+	global client, uploads, connection
+	import batch_upload # Tumblr client setup, batch_upload.py
+	import upload_queue # background upload queue, upload_queue.py
+	import payload # shrinks posts to the link speed, payload.py
+
+	# Setup the tumblr OAuth Client
+	if backend_name == 'sim':
+		client = batch_upload.StubTumblrClient(latency=0)
+		online = None
+	else:
+		import connectivity # background check of the upload host, connectivity.py
+		# keep-alive connections for posts and for checking the host is reachable, one for each thread.
+		# A stalled post gives up after the upload budget, rather than holding up the queue for good. The queue tries it again later.
+		session = batch_upload.tumblr_sessions(stage_budgets.get('upload'))
+		client = batch_upload.tumblr_client(session)
+		connection = connectivity.ConnectivityMonitor(upload_url, session, on_probe=connectivity_probed)
+		online = connection.online # cached, so it never holds up a session
+
+	payloads = None
+	if config.upload_target_seconds > 0:
+		payloads = payload.PayloadPreparer(os.path.join(config.upload_queue_path, 'prepared'), config.upload_target_seconds)
+
+	# start draining any posts left in the upload queue, including ones from before a reboot
+	uploads = upload_queue.UploadQueue(client, config.upload_queue_path, config.tumblr_blog, config.tagsForTumblr,
+		online=online, on_upload=upload_attempted, on_finished=upload_finished, payloads=payloads)
+	if config.post_online:
+		if connection is not None:
+			connection.start()
+		uploads.start()
+
+# run fn(*args) on a startup thread, timing it as the named startup stage
+# Anything fn raises is kept on the thread, and raised again by finish_in_background().
+def start_in_background(name, fn, *args):
+	def run():
+		start = time.time()
+		try:
+			fn(*args)
+		except Exception:
+			thread.error = sys.exc_info()
+			return
+		startup_times.append((name, time.time() - start))
+	thread = threading.Thread(target=run, name=name)
+	thread.error = None
+	thread.start()
+	return thread
+
+# wait for a startup thread, then fail startup as if it had run here if it failed
+def finish_in_background(thread):
+	thread.join()
+	if thread.error is not None:
+		print "Startup failed in %s" % thread.name
+		raise thread.error[0], thread.error[1], thread.error[2]
+
+# run fn(*args) now, timing it as the named startup stage
+def start_now(name, fn, *args, **kwargs):
+	start = time.time()
+	result = fn(*args, **kwargs)
+	startup_times.append((name, time.time() - start))
+	return result
+
+# set up the chosen hardware backend, then everything that depends on it.
+# The intro screen goes up as soon as there is a display. The slow parts (opening the camera,
+# the network clients) run on startup threads while the rest of the screens load.
+# sim_camera_open is how long the simulated camera takes to open, like a real one on a Pi,
+# and sim_hold a file the simulated button waits for before it starts pressing
+def setup(backend_name, sim_camera_open=0, sim_hold=None):
+	global gpio, camera, screen, screens, display, metrics, loop, pipeline, catalog, storage, deadlines, gallery
+	startup_times.append(('imports', time.time() - launched))
+
+	# start worker processes first, before any threads or hardware they could inherit
+	if config.pipeline_workers:
+		pipeline = start_now('pipeline', pipelining.Pipeline, config.pipeline_workers, config.pipeline_backlog)
+
+	hw = start_now('display', backends.load, backend_name, led_pin, btn_pin, config.monitor_w, config.monitor_h,
+		sim_timings=(sim_camera_open, 0, 0), sim_hold=sim_hold)
+	gpio = hw.gpio
+	screen = hw.screen
+	atexit.register(cleanup)
+	loop = event_loop.EventLoop(on_events=input)
+
+	# the intro screen first, so guests see the booth is coming up
+	screens = screen_cache.ScreenCache(config.monitor_w, config.monitor_h, replay_cache_size)
+	display = renderer.Renderer(screen, loop.wait)
+	start_now('intro', screens.preload, [real_path + "/intro.png"])
+	show_image(real_path + "/intro.png")
+	intro_shown = time.time() - launched
+
+	# open the camera once. It keeps previewing, hidden, between sessions.
+	camera = hw.camera
+	background = [start_in_background('camera', camera.open)]
+
+	# stage timings, written per session and served over http
+	metrics = session_metrics.Metrics(config.metrics_log)
+	if config.metrics_port:
+		try:
+			metrics.serve(config.metrics_port)
+		except socket.error, e: # e.g. the port is taken. The booth runs without it.
+			print "Could not serve metrics on port %d, going on without them: %s" % (config.metrics_port, e)
+	deadlines = deadline_timers.Deadlines(stage_budgets, metrics.observe_breach) # here, as it needs the main thread
+	loop.guard = deadlines.guard # so a deadline can't cut into the loop's timers and callbacks
+	background.append(start_in_background('uploads', start_uploads, backend_name))
+
+	# load and scale the rest of the static screens once, instead of on every show_image()
+	start_now('screens', screens.preload, [real_path + "/" + name for name in static_screens if name != "intro.png"])
+
+	# index of every session's files and upload status
+	catalog = start_now('catalog', session_catalog.Catalog, config.catalog_path, config.event_name)
+	storage = pic_storage.Storage(config.file_path, catalog, config.event_name, config.storage_quota_mb, config.storage_min_free_mb,
+		config.keep_days, config.keep_frames, config.keep_unposted)
+
+	# the guests' gallery, on its own niced thread
+	if config.gallery_port:
+		try:
+			gallery = start_now('gallery', guest_gallery.Gallery, config.file_path, config.gallery_port).start()
+		except socket.error, e: # e.g. the port is taken. The booth runs without it.
+			print "Could not serve the gallery on port %d, going on without it: %s" % (config.gallery_port, e)
+
+	# webp and mp4 need support installed. Check once, rather than failing every session.
+	config.animation_format = start_now('animation', animation.choose, config.animation_format)
+
+	for thread in background:
+		finish_in_background(thread)
+	ready = time.time() - launched
+	for name, seconds in startup_times:
+		metrics.observe('startup_' + name, seconds)
+	print "Startup: " + ", ".join("%s %.2fs" % (name, seconds) for name, seconds in startup_times)
+	print "Intro shown at %.2fs, ready at %.2fs" % (intro_shown, ready)
+	return ready
 
 ####################
 ### Main Program ###
 ####################
 
-## clear the previously stored pics based on config settings
-if config.clear_on_startup:
-	clear_pics(1)
-
-print "Photo booth app running..." 
-for x in range(0, 5): #blink light to show the app is running
-	GPIO.output(led_pin,True)
-	sleep(0.25)
-	GPIO.output(led_pin,False)
-	sleep(0.25)
-
-show_image(real_path + "/intro.png");
-
-while True:
-	GPIO.output(led_pin,True); #turn on the light showing users they can push the button
-	input(pygame.event.get()) # press escape to exit pygame. Then press ctrl-c to exit python.
-	GPIO.wait_for_edge(btn_pin, GPIO.FALLING)
-	time.sleep(config.debounce) #debounce
-	start_photobooth()
+sim_stalls = ['camera_init', 'capture', 'derivatives', 'gif', 'strip'] # stages --sim-stall can slow down
+
+# a --sim-stall value, stage=seconds
+def stall(text):
+	stage, seconds = text.partition('=')[::2]
+	if stage not in sim_stalls:
+		raise argparse.ArgumentTypeError("stage must be one of " + ", ".join(sim_stalls))
+	return stage, float(seconds)
+
+def main(args):
+	global prep_delay, capture_delay, replay_delay, restart_delay
+
+	config.file_path = args.file_path
+	config.upload_queue_path = args.queue_path
+	config.metrics_log = args.metrics_log
+	config.metrics_port = args.metrics_port
+	config.catalog_path = args.catalog
+	config.pipeline_workers = args.pipeline_workers
+	config.gallery_port = args.gallery_port
+	if args.hi_res:
+		config.hi_res_pics = True
+	if args.full_sensor:
+		config.full_sensor = True
+	setup(args.backend, args.sim_camera_open, args.sim_hold)
+
+	# slow stand-ins for stages, to try out their deadlines and fallbacks
+	stand_ins = {'camera_init': (camera, 'configure'), 'capture': (camera, 'capture'),
+		'derivatives': (derivatives, 'make_all'), 'gif': (animation, 'encode'), 'strip': (photo_strip, 'make_strip')}
+	for stage, seconds in args.sim_stall:
+		owner, name = stand_ins[stage]
+		setattr(owner, name, deadline_timers.slowed(getattr(owner, name), seconds))
+
+	if args.no_delays: # for simulated runs, skip the waits meant for guests
+		prep_delay = capture_delay = replay_delay = restart_delay = 0
+
+	## clear the previously stored pics based on config settings
+	if config.clear_on_startup:
+		clear_pics(1)
+	storage.start() # prune in the background from here on
+	show_intro() # now with the room left
+
+	print "Photo booth app running..." 
+	# blink light to show the app is running, then turn it on showing users they can push the button.
+	# The button works straight away. A press stops the blinking.
+	startup_blink = blink(5) + [loop.call_later(2.5, gpio.led, True)]
+
+	state = {'sessions': 0, 'busy': False}
+	start = time.time()
+
+	# runs on the event loop for every debounced press
+	def button_pressed(pressed_at):
+		global guests_waiting
+		if loop.stopped: # shutting down
+			return
+		if state['busy']: # a session is already running, so someone is waiting
+			guests_waiting = True
+			return
+		state['busy'] = True
+		guests_waiting = False
+		for timer in startup_blink:
+			timer.cancel()
+		try:
+			start_photobooth(pressed_at)
+		finally:
+			state['busy'] = False
+		state['sessions'] += 1
+		if args.sessions and state['sessions'] >= args.sessions:
+			loop.stop()
+
+	# the button interrupt only queues the press, the session runs on the loop
+	gpio.on_press(lambda pressed_at: loop.call_soon_threadsafe(button_pressed, pressed_at), config.debounce)
+	loop.every(0.1, lambda late: metrics.observe('loop_lag', late)) # how long the loop was kept from running
+	loop.run_forever()
+
+	sessions = state['sessions']
+	if pipeline is not None:
+		with deadlines.stage('backpressure') as stage:
+			while pipeline.pending(): # let the last sessions finish processing
+				loop.wait(0.1)
+		if stage.breached:
+			print "%d sessions didn't finish processing" % pipeline.pending()
+	if gallery is not None:
+		gallery.stop()
+	elapsed = time.time() - start
+	print "%d sessions in %.1fs (%.0f sessions/hour)" % (sessions, elapsed, sessions * 3600 / elapsed)
+	summary = metrics.snapshot()
+	for name in sorted(summary['stages']):
+		print "  %-12s p50 %.3fs  p95 %.3fs" % (name, summary['stages'][name]['p50'], summary['stages'][name]['p95'])
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Raspberry Pi photo booth')
+	parser.add_argument('--backend', choices=backends.names, default=config.backend, help='real hardware, or simulated')
+	parser.add_argument('--sessions', type=int, default=0, help='stop after this many sessions. 0 runs forever.')
+	parser.add_argument('--no-delays', action='store_true', help='skip the pauses meant for guests')
+	parser.add_argument('--file-path', default=config.file_path, help='where to save the pics')
+	parser.add_argument('--queue-path', default=config.upload_queue_path, help='where posts wait to be uploaded')
+	parser.add_argument('--metrics-log', default=config.metrics_log, help='json lines file of session timings')
+	parser.add_argument('--metrics-port', type=int, default=config.metrics_port, help='port serving counters and timings. 0 turns it off.')
+	parser.add_argument('--catalog', default=config.catalog_path, help='session catalog database')
+	parser.add_argument('--gallery-port', type=int, default=config.gallery_port, help="port of the guests' gallery. 0 turns it off.")
+	parser.add_argument('--pipeline-workers', type=int, default=config.pipeline_workers, help='worker processes for post-capture work. 0 does it in the session.')
+	parser.add_argument('--hi-res', action='store_true', help='take high res pics, whatever config.py says')
+	parser.add_argument('--full-sensor', action='store_true', help="take pics at the camera's full resolution, whatever config.py says")
+	parser.add_argument('--sim-stall', type=stall, action='append', default=[], metavar='STAGE=SECONDS',
+		help='hold up a stage this long, to try out its deadline. Can be given more than once.')
+	parser.add_argument('--sim-camera-open', type=float, default=0, help='seconds the simulated camera takes to open')
+	parser.add_argument('--sim-hold', metavar='PATH', help="the simulated button doesn't press until this file exists")
+	main(parser.parse_args())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# A small cooperative event loop for the booth, in place of blocking on the button.
+# Button edges, pygame events, timers and callbacks from other threads all run here, on the main thread.
+# Long waits in a session go through wait() and run_in_thread(), which keep the loop turning,
+# so ESC, window events and timers are handled even in the middle of a session.
+
+import heapq
+import itertools
+import sys
+import threading
+import time
+try:
+	import Queue as queue # python 2
+except ImportError:
+	import queue
+import pygame
+
+tick = 0.02 # longest the loop sleeps before checking pygame events again
+
+class Timer(object):
+
+	def __init__(self, when, fn, args):
+		self.when = when
+		self.fn = fn
+		self.args = args
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+
+# the guard of a loop without deadlines
+class Unguarded(object):
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, kind, error, tb):
+		return False
+
+class EventLoop(object):
+
+	def __init__(self, on_events=None, guard=Unguarded):
+		self.on_events = on_events # called with each batch of pygame events
+		# each callback runs under guard(), e.g. deadlines.Deadlines.guard, so a deadline can't cut off the loop's own work
+		self.guard = guard
+		self.ready = queue.Queue() # callbacks posted from other threads
+		self.timers = [] # heap of (when, sequence, Timer)
+		self.sequence = itertools.count()
+		self.stopped = False
+
+	# safe to call from any thread, e.g. a GPIO interrupt
+	def call_soon_threadsafe(self, fn, *args):
+		self.ready.put((fn, args))
+
+	def call_later(self, delay, fn, *args):
+		return self.call_at(time.time() + delay, fn, *args)
+
+	def call_at(self, when, fn, *args):
+		timer = Timer(when, fn, args)
+		heapq.heappush(self.timers, (timer.when, next(self.sequence), timer))
+		return timer
+
+	# call fn every interval seconds until the returned timer is cancelled.
+	# fn gets how late (in seconds) this call is, which shows how responsive the loop is.
+	def every(self, interval, fn):
+		handle = Timer(0, fn, ())
+		def repeat(due):
+			if handle.cancelled:
+				return
+			now = time.time()
+			fn(now - due)
+			due += interval
+			if due < now: # skip the calls missed while the loop was held up
+				due = now + interval
+			self.call_at(due, repeat, due)
+		first = time.time() + interval
+		self.call_at(first, repeat, first)
+		return handle
+
+	def stop(self):
+		self.stopped = True
+		self.call_soon_threadsafe(lambda: None) # wake the loop
+
+	# one turn: pygame events, due timers, then callbacks from other threads for up to timeout seconds.
+	# Taking a timer or callback off its queue and running it is guarded as one, so neither is lost.
+	def run_once(self, timeout=tick):
+		if self.on_events is not None and pygame.display.get_init():
+			with self.guard():
+				self.on_events(pygame.event.get())
+		now = time.time()
+		while self.timers and self.timers[0][0] <= now:
+			with self.guard():
+				timer = heapq.heappop(self.timers)[2]
+				if not timer.cancelled:
+					timer.fn(*timer.args)
+		if self.timers:
+			timeout = min(timeout, self.timers[0][0] - time.time())
+		timeout = max(0, timeout)
+		while True: # then everything else already waiting
+			with self.guard():
+				try:
+					fn, args = self.ready.get(timeout=timeout)
+				except queue.Empty:
+					return
+				fn(*args)
+			timeout = 0
+
+	# a sleep that keeps the loop running. Always takes at least one turn, so wait(0) yields.
+	def wait(self, seconds):
+		deadline = time.time() + seconds
+		while True:
+			self.run_once(max(0, min(tick, deadline - time.time())))
+			if self.stopped or time.time() >= deadline:
+				return
+
+	# run fn(*args) on a worker thread, keeping the loop running until it returns.
+	# If a deadline cuts the wait short, the thread is left to finish on its own. It won't hold up the booth exiting.
+	def run_in_thread(self, fn, *args):
+		result = {}
+		def work():
+			try:
+				result['value'] = fn(*args)
+			except BaseException:
+				result['error'] = sys.exc_info()[1]
+			self.call_soon_threadsafe(lambda: None) # wake the loop
+		thread = threading.Thread(target=work)
+		thread.daemon = True
+		thread.start()
+		while thread.is_alive():
+			self.run_once(tick)
+		thread.join()
+		if 'error' in result:
+			raise result['error']
+		return result.get('value')
+
+	def run_forever(self):
+		while not self.stopped:
+			self.run_once(tick)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Holds a session's captured jpgs in memory, so the gif and replay stages never read them back from disk.
+# The jpgs are written to disk once, in the background.
+
+import io
+import threading
+
+class SessionFrames(object):
+
+	def __init__(self, file_path, now):
+		self.file_path = file_path
+		self.now = now # session timestamp, the start of every filename
+		self.frames = [] # jpg bytes, in capture order
+		self.bytes_in_memory = 0 # read from memory by later stages instead of disk
+		self.bytes_written = 0 # written to disk by persist()
+
+	# the file a frame is saved as, counting from 1 like the rest of the booth
+	def path(self, i):
+		return self.file_path + self.now + "-0" + str(i) + ".jpg"
+
+	def paths(self):
+		return [self.path(i) for i in range(1, len(self.frames)+1)]
+
+	def add(self, data):
+		self.frames.append(data)
+
+	# capture straight into a new in-memory frame
+	def capture(self, camera):
+		stream = io.BytesIO()
+		camera.capture(stream)
+		self.add(stream.getvalue())
+
+	# a fresh file-like object for frame i, for Image.open() or pygame.image.load()
+	def reader(self, i):
+		data = self.frames[i-1]
+		self.bytes_in_memory += len(data)
+		return io.BytesIO(data)
+
+	def readers(self):
+		return [self.reader(i) for i in range(1, len(self.frames)+1)]
+
+	# write every frame to disk in a background thread, then call on_done() if given
+	def persist(self, on_done=None):
+		def write():
+			for i, data in enumerate(self.frames):
+				f = open(self.path(i+1), 'wb')
+				try:
+					f.write(data)
+				finally:
+					f.close()
+				self.bytes_written += len(data)
+			if on_done is not None:
+				on_done()
+		thread = threading.Thread(target=write, name='persist-' + self.now)
+		thread.start()
+		return thread
+
+	def report(self):
+		return "session I/O: %d frames, %d bytes captured, %d bytes read from memory, %d bytes written to disk" % (
+			len(self.frames), sum(len(f) for f in self.frames), self.bytes_in_memory, self.bytes_written)
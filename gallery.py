@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+# The guests' gallery: every session's animation and pics, newest first, served from the booth over the local Wi-Fi,
+# so guests can get their gif on their phone straight away, with or without internet.
+# One thread runs a small non-blocking HTTP/1.1 server on poll(). A few hundred phones, each keeping a connection
+# open to hear about new sessions, cost that one thread, and it runs niced below capture and the screen.
+# Files go out with ETag, Last-Modified and Range support, the most asked for straight from memory.
+# New sessions are pushed to open pages as server-sent events.
+# usage: python gallery.py [port]   to serve config.file_path without the booth
+
+import errno
+import json
+import os
+import select
+import socket
+import threading
+import time
+import traceback
+from collections import deque, OrderedDict
+from email.utils import formatdate, parsedate_tz, mktime_tz
+try:
+	import Queue as queue # python 2
+except ImportError:
+	import queue
+try:
+	from urllib import unquote # python 2
+	from urlparse import urlparse, parse_qs
+except ImportError:
+	from urllib.parse import unquote, urlparse, parse_qs
+from catalog import all_pics, animation_extensions, session_length
+
+nice = 10 # priority of the gallery thread. The booth's own threads stay at 0.
+page_size = 48 # sessions per page
+cache_mb = 16 # most file bytes kept in memory
+cache_item_kb = 4096 # files bigger than this are read from the card every time
+idle_timeout = 30 # seconds before an idle keep-alive connection is closed
+heartbeat = 15 # seconds between comments on open event streams, so phones and routers keep them
+rescan_interval = 300 # seconds between walks of the pics folder, for sessions pruned or added behind the gallery's back
+max_request = 8192 # most bytes of request headers
+max_connections = 1000 # more are refused until some close
+content_types = {'.jpg': 'image/jpeg', '.gif': 'image/gif', '.webp': 'image/webp', '.mp4': 'video/mp4'}
+
+statuses = {200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+	405: 'Method Not Allowed', 416: 'Range Not Satisfiable', 431: 'Request Header Fields Too Large'}
+
+page = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>%(title)s</title>
+<style>
+body { margin: 0; background: #111; color: #eee; font-family: sans-serif; }
+h1 { font-size: 1.2em; margin: 12px; }
+#sessions { display: flex; flex-wrap: wrap; }
+.session { width: 50%%; box-sizing: border-box; padding: 4px; }
+.session img { width: 100%%; display: block; }
+.more { display: block; margin: 16px; color: #eee; }
+</style></head>
+<body><h1>%(title)s</h1>
+<div id="sessions">%(sessions)s</div>
+%(more)s
+<script>
+if (window.EventSource && %(live)s) {
+	new EventSource('/events').addEventListener('session', function (e) {
+		var session = JSON.parse(e.data), old = document.getElementById(session.id);
+		var div = document.createElement('div');
+		div.innerHTML = %(render)s;
+		if (old) { old.parentNode.replaceChild(div.firstChild, old); }
+		else { var list = document.getElementById('sessions'); list.insertBefore(div.firstChild, list.firstChild); }
+	});
+}
+</script></body></html>
+"""
+
+# a session on the page. In javascript too, for sessions pushed to an open page.
+entry = '<div class="session" id="%(id)s"><a href="%(link)s"><img src="%(thumb)s" alt="%(id)s" loading="lazy"></a></div>'
+entry_js = """'<div class="session" id="' + session.id + '"><a href="' + (session.animation || session.pics[0]) + '"><img src="' + session.thumb + '" alt="' + session.id + '" loading="lazy"></a></div>'"""
+
+def escape(text):
+	return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+def url(name):
+	return '/pics/' + name if name else None
+
+# what one session has to show, from its file names
+class Session(object):
+
+	def __init__(self, session_id):
+		self.id = session_id
+		self.animation = None
+		self.frames = []
+		self.webs = []
+		self.thumbs = []
+		self.strip = None
+
+	def add(self, name):
+		extension = os.path.splitext(name)[1]
+		if extension in animation_extensions:
+			if self.animation is None or extension == '.gif': # the gif, if it was made in more than one format
+				self.animation = name
+		elif name.endswith('-strip.jpg'):
+			self.strip = name
+		elif name.endswith('-thumb.jpg'):
+			self.thumbs.append(name)
+		elif name.endswith('-web.jpg'):
+			self.webs.append(name)
+		elif name.endswith('.jpg') and len(name) == session_length + len('-01.jpg'):
+			self.frames.append(name)
+
+	def shown(self):
+		return self.animation is not None or self.frames or self.webs
+
+	def item(self):
+		pics = sorted(self.webs or self.frames)
+		thumbs = sorted(self.thumbs) or pics
+		return {'id': self.id, 'animation': url(self.animation), 'thumb': url(thumbs[0] if thumbs else self.animation),
+			'pics': [url(name) for name in pics], 'strip': url(self.strip)}
+
+# the sessions in a pics folder, and the path of every file the gallery may serve, by name
+def scan(file_path):
+	sessions = {}
+	files = {}
+	for path in all_pics(file_path):
+		name = os.path.basename(path)
+		files[name] = path
+		sessions.setdefault(name[:session_length], Session(name[:session_length])).add(name)
+	return sessions, files
+
+# (start, end) of a Range header, inclusive. None to send the whole file, False if it can't be satisfied.
+# Only single ranges; for anything else the whole file is sent, which the spec allows.
+def byte_range(value, size):
+	if not value or not value.startswith('bytes=') or ',' in value:
+		return None
+	start, dash, end = value[len('bytes='):].strip().partition('-')
+	try:
+		if not start: # the last end bytes
+			length = int(end)
+			if length <= 0:
+				return False
+			return max(0, size - length), size - 1
+		start = int(start)
+		end = int(end) if end else size - 1
+	except ValueError:
+		return None
+	if start >= size or end < start:
+		return False
+	return start, min(end, size - 1)
+
+# the files most recently served, in memory, up to cache_mb
+class FileCache(object):
+
+	def __init__(self, limit, item_limit):
+		self.limit = limit
+		self.item_limit = item_limit
+		self.items = OrderedDict() # path -> (etag, data), least recently used first
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	# the file's bytes, or only start to end of them for a big file that isn't kept
+	def get(self, path, etag, size, start=0, end=None):
+		cached = self.items.pop(path, None)
+		if cached is not None and cached[0] == etag:
+			self.items[path] = cached
+			self.hits += 1
+			return cached[1], start
+		if cached is not None:
+			self.bytes -= len(cached[1])
+		self.misses += 1
+		f = open(path, 'rb')
+		try:
+			if size > self.item_limit: # read only what was asked for
+				f.seek(start)
+				return f.read((size if end is None else end + 1) - start), 0
+			data = f.read()
+		finally:
+			f.close()
+		self.items[path] = (etag, data)
+		self.bytes += len(data)
+		while self.bytes > self.limit and self.items:
+			old_path, (old_etag, old_data) = self.items.popitem(last=False)
+			self.bytes -= len(old_data)
+		return data, start
+
+	def drop(self, path):
+		cached = self.items.pop(path, None)
+		if cached is not None:
+			self.bytes -= len(cached[1])
+
+# poll() where there is one, select() elsewhere
+class Poller(object):
+
+	def __init__(self):
+		self.poll = select.poll() if hasattr(select, 'poll') else None
+		self.fds = {} # fd -> wants writing
+
+	def register(self, fd, write=False):
+		self.fds[fd] = write
+		if self.poll is not None:
+			self.poll.register(fd, select.POLLIN | (select.POLLOUT if write else 0))
+
+	def modify(self, fd, write):
+		if self.fds.get(fd) == write:
+			return
+		self.fds[fd] = write
+		if self.poll is not None:
+			self.poll.modify(fd, select.POLLIN | (select.POLLOUT if write else 0))
+
+	def unregister(self, fd):
+		if self.fds.pop(fd, None) is not None and self.poll is not None:
+			self.poll.unregister(fd)
+
+	# [(fd, readable, writable)]. Nothing if a signal, e.g. the booth's deadline alarm, cut the wait short.
+	def wait(self, timeout):
+		try:
+			if self.poll is not None:
+				ready = []
+				for fd, event in self.poll.poll(int(timeout * 1000)):
+					ready.append((fd, bool(event & (select.POLLIN | select.POLLHUP | select.POLLERR | select.POLLNVAL)), bool(event & select.POLLOUT)))
+				return ready
+			readers, writers, errors = select.select(list(self.fds), [fd for fd, write in self.fds.items() if write], [], timeout)
+		except (select.error, OSError) as e: # select.error is not an OSError on python 2
+			if e.args[0] == errno.EINTR:
+				return []
+			raise
+		return [(fd, fd in readers, fd in writers) for fd in set(readers) | set(writers)]
+
+class Connection(object):
+
+	def __init__(self, sock):
+		self.sock = sock
+		self.inbox = b''
+		self.outbox = deque() # bytes and memoryviews still to send
+		self.close_after = False # close once the outbox is sent
+		self.stream = False # an open event stream
+		self.active = time.time()
+
+class Gallery(object):
+
+	def __init__(self, file_path, port, title='Photo Booth'):
+		self.file_path = file_path
+		self.title = title
+		self.sessions = {} # id -> Session
+		self.files = {} # name -> path
+		self.order = [] # session ids, newest first
+		self.front = None # the first page, built once per change
+		self.published = queue.Queue() # (session id, folder) from publish()
+		self.cache = FileCache(cache_mb * 1024 * 1024, cache_item_kb * 1024)
+		self.connections = {} # fd -> Connection
+		self.poller = Poller()
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		try:
+			self.listener.bind(('', port))
+			self.listener.listen(128)
+		except socket.error: # e.g. the port is taken
+			self.listener.close()
+			raise
+		self.listener.setblocking(False)
+		self.port = self.listener.getsockname()[1] # the one picked, when port is 0
+		self.wake_read, self.wake_write = os.pipe() # publish() wakes the loop through this
+		self.stopped = False
+		self.requests = 0
+		self.bytes_sent = 0
+		self.pushed = 0
+		self.thread = None
+
+	# serve from a daemon thread. The pics folder is walked there too, so startup doesn't wait on it.
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name='gallery')
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	# stop serving, waiting up to wait seconds for the last sessions to be pushed
+	def stop(self, wait=1.0):
+		self.stopped = True
+		self.wake()
+		if self.thread is not None:
+			self.thread.join(wait)
+
+	def wake(self):
+		try:
+			os.write(self.wake_write, b'x')
+		except OSError:
+			pass
+
+	# a session's files are all written. Safe to call from any thread.
+	def publish(self, session_id, folder):
+		self.published.put((session_id, folder))
+		self.wake()
+
+	def run(self):
+		try:
+			os.nice(nice) # on Linux this lowers only this thread
+		except (AttributeError, OSError):
+			pass
+		self.rescan()
+		self.poller.register(self.listener.fileno())
+		self.poller.register(self.wake_read)
+		checked = time.time()
+		while not self.stopped:
+			for fd, readable, writable in self.poller.wait(1.0):
+				if fd == self.listener.fileno():
+					self.accept()
+				elif fd == self.wake_read:
+					os.read(self.wake_read, 4096)
+					self.take_published()
+				elif fd in self.connections:
+					connection = self.connections[fd]
+					try:
+						if readable:
+							self.read(connection)
+						if writable and fd in self.connections:
+							self.write(connection)
+					except Exception: # one bad request mustn't stop the gallery for everyone
+						traceback.print_exc()
+						if fd in self.connections:
+							self.close(connection)
+			now = time.time()
+			if now - checked >= 1:
+				self.housekeeping(now)
+				checked = now
+		self.take_published() # sessions published as the booth shut down
+		for connection in list(self.connections.values()):
+			self.close(connection)
+		self.listener.close()
+
+	# idle connections, heartbeats on event streams, and the occasional walk of the pics folder
+	def housekeeping(self, now):
+		for connection in list(self.connections.values()):
+			if connection.stream:
+				if now - connection.active >= heartbeat:
+					self.send(connection, b': still here\n\n')
+			elif now - connection.active >= idle_timeout:
+				self.close(connection)
+		if now - self.scanned >= rescan_interval:
+			self.rescan()
+
+	def rescan(self):
+		self.sessions, self.files = scan(self.file_path)
+		self.sort()
+		self.scanned = time.time()
+
+	def sort(self):
+		self.order = sorted((s for s in self.sessions if self.sessions[s].shown()), reverse=True)
+		self.front = None
+
+	def take_published(self):
+		while True:
+			try:
+				session_id, folder = self.published.get_nowait()
+			except queue.Empty:
+				return
+			session = Session(session_id)
+			try:
+				names = sorted(name for name in os.listdir(folder) if name.startswith(session_id))
+			except OSError:
+				continue
+			for name in names:
+				if name.endswith('.jpg') or os.path.splitext(name)[1] in animation_extensions:
+					self.files[name] = os.path.join(folder, name)
+					session.add(name)
+			if not session.shown():
+				continue
+			self.sessions[session_id] = session
+			self.sort()
+			event = ('event: session\ndata: %s\n\n' % json.dumps(session.item())).encode('utf-8')
+			for connection in list(self.connections.values()):
+				if connection.stream:
+					self.send(connection, event)
+					self.pushed += 1
+
+	def accept(self):
+		while True:
+			try:
+				sock, address = self.listener.accept()
+			except socket.error as e:
+				if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					return
+				raise
+			if len(self.connections) >= max_connections:
+				sock.close()
+				continue
+			sock.setblocking(False) # accepted sockets can come out blocking, with the default timeout
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			connection = Connection(sock)
+			self.connections[sock.fileno()] = connection
+			self.poller.register(sock.fileno())
+
+	def close(self, connection):
+		fd = connection.sock.fileno()
+		self.connections.pop(fd, None)
+		self.poller.unregister(fd)
+		connection.sock.close()
+
+	def read(self, connection):
+		try:
+			data = connection.sock.recv(65536)
+		except socket.error as e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return
+			self.close(connection)
+			return
+		if not data:
+			self.close(connection)
+			return
+		connection.active = time.time()
+		if connection.stream or connection.close_after:
+			return # nothing more is read from these
+		connection.inbox += data
+		while b'\r\n\r\n' in connection.inbox and not connection.stream and not connection.close_after:
+			head, connection.inbox = connection.inbox.split(b'\r\n\r\n', 1)
+			self.handle(connection, head.decode('latin-1'))
+		if len(connection.inbox) > max_request:
+			self.respond(connection, 431, [], b'', close=True)
+
+	def write(self, connection):
+		while connection.outbox:
+			chunk = connection.outbox[0]
+			try:
+				sent = connection.sock.send(chunk)
+			except socket.error as e:
+				if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					break
+				self.close(connection)
+				return
+			self.bytes_sent += sent
+			if sent < len(chunk):
+				connection.outbox[0] = memoryview(chunk)[sent:]
+				break
+			connection.outbox.popleft()
+		connection.active = time.time()
+		if not connection.outbox and connection.close_after:
+			self.close(connection)
+			return
+		self.poller.modify(connection.sock.fileno(), bool(connection.outbox))
+
+	# queue bytes for a connection, sending what the socket takes straight away
+	def send(self, connection, *chunks):
+		connection.outbox.extend(chunk for chunk in chunks if len(chunk))
+		self.write(connection)
+
+	def respond(self, connection, status, headers, body, head=False, close=False):
+		lines = ['HTTP/1.1 %d %s' % (status, statuses[status])]
+		lines += ['%s: %s' % header for header in headers]
+		if not connection.stream and status != 304:
+			lines.append('Content-Length: %d' % len(body))
+		if close:
+			lines.append('Connection: close')
+			connection.close_after = True
+		self.requests += 1
+		self.send(connection, ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'), b'' if head else body)
+
+	def handle(self, connection, head):
+		lines = head.split('\r\n')
+		try:
+			method, target, version = lines[0].split(' ', 2)
+		except ValueError:
+			self.respond(connection, 400, [], b'', close=True)
+			return
+		headers = {}
+		for line in lines[1:]:
+			name, colon, value = line.partition(':')
+			headers[name.strip().lower()] = value.strip()
+		keep_alive = headers.get('connection', '').lower() != 'close' if version == 'HTTP/1.1' else headers.get('connection', '').lower() == 'keep-alive'
+		if method not in ('GET', 'HEAD') or int(headers.get('content-length', 0) or 0):
+			self.respond(connection, 405, [('Allow', 'GET, HEAD')], b'', close=True)
+			return
+		head_only = method == 'HEAD'
+		request = urlparse(target)
+		query = parse_qs(request.query)
+		path = unquote(request.path)
+		close = not keep_alive
+		if path == '/':
+			body = self.page(query.get('before', [None])[0])
+			self.respond(connection, 200, [('Content-Type', 'text/html; charset=utf-8'), ('Cache-Control', 'no-cache')], body, head_only, close)
+		elif path == '/sessions.json':
+			try:
+				limit = max(1, min(int(query.get('limit', [page_size])[0]), page_size * 4))
+			except ValueError:
+				limit = page_size
+			body = json.dumps([self.sessions[s].item() for s in self.newest(query.get('before', [None])[0], limit)]).encode('utf-8')
+			self.respond(connection, 200, [('Content-Type', 'application/json'), ('Cache-Control', 'no-cache')], body, head_only, close)
+		elif path == '/events':
+			connection.stream = True
+			self.respond(connection, 200, [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')], b'retry: 5000\n\n', head_only)
+		elif path.startswith('/pics/'):
+			self.serve_file(connection, path[len('/pics/'):], headers, head_only, close)
+		else:
+			self.respond(connection, 404, [('Content-Type', 'text/plain')], b'Not found\n', head_only, close)
+
+	# session ids newest first, from just before the given one
+	def newest(self, before, limit):
+		order = self.order
+		if before:
+			order = [s for s in order if s < before]
+		return order[:limit]
+
+	def page(self, before=None):
+		if before is None and self.front is not None:
+			return self.front
+		shown = self.newest(before, page_size)
+		sessions = []
+		for s in shown:
+			item = self.sessions[s].item()
+			sessions.append(entry % {'id': escape(s), 'link': escape(item['animation'] or item['pics'][0]), 'thumb': escape(item['thumb'])})
+		more = ''
+		if len(shown) == page_size:
+			more = '<a class="more" href="/?before=%s">Older</a>' % escape(shown[-1])
+		body = (page % {'title': escape(self.title), 'sessions': ''.join(sessions), 'more': more,
+			'live': 'true' if before is None else 'false', 'render': entry_js}).encode('utf-8')
+		if before is None:
+			self.front = body
+		return body
+
+	def serve_file(self, connection, name, headers, head_only, close):
+		path = self.files.get(name)
+		try:
+			if path is None:
+				raise OSError(errno.ENOENT, name)
+			stat = os.stat(path)
+		except OSError:
+			if path is not None: # pruned since it was listed
+				self.forget(name)
+			self.respond(connection, 404, [('Content-Type', 'text/plain')], b'Not found\n', head_only, close)
+			return
+		size = stat.st_size
+		etag = '"%x-%x"' % (int(stat.st_mtime * 1000), size)
+		common = [('ETag', etag), ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)), ('Cache-Control', 'public, max-age=3600'),
+			('Accept-Ranges', 'bytes')]
+		if self.not_modified(headers, etag, stat.st_mtime):
+			self.respond(connection, 304, common, b'', True, close)
+			return
+		common.append(('Content-Type', content_types.get(os.path.splitext(name)[1], 'application/octet-stream')))
+		span = None
+		if headers.get('if-range', etag) == etag: # a range of a file that has since changed gets the whole new file
+			span = byte_range(headers.get('range'), size)
+		if span is False:
+			self.respond(connection, 416, [('Content-Range', 'bytes */%d' % size)], b'', head_only, close)
+			return
+		start, end = span if span else (0, size - 1)
+		try:
+			data, offset = self.cache.get(path, etag, size, start, end)
+		except IOError:
+			self.forget(name)
+			self.respond(connection, 404, [('Content-Type', 'text/plain')], b'Not found\n', head_only, close)
+			return
+		body = memoryview(data)[offset:offset + end - start + 1]
+		if span:
+			self.respond(connection, 206, common + [('Content-Range', 'bytes %d-%d/%d' % (start, end, size))], body, head_only, close)
+		else:
+			self.respond(connection, 200, common, body, head_only, close)
+
+	def not_modified(self, headers, etag, mtime):
+		if 'if-none-match' in headers:
+			tags = [tag.strip() for tag in headers['if-none-match'].split(',')]
+			return etag in tags or '*' in tags
+		since = headers.get('if-modified-since')
+		if since:
+			parsed = parsedate_tz(since)
+			return parsed is not None and int(mtime) <= mktime_tz(parsed)
+		return False
+
+	# a file that has gone, e.g. pruned by storage.py. Its session goes too, once nothing in it is left.
+	def forget(self, name):
+		path = self.files.pop(name, None)
+		if path is not None:
+			self.cache.drop(path)
+		session_id = name[:session_length]
+		if session_id in self.sessions and not any(n.startswith(session_id) for n in self.files):
+			del self.sessions[session_id]
+			self.sort()
+
+	def stats(self):
+		streams = len([c for c in list(self.connections.values()) if c.stream])
+		return {'sessions': len(self.order), 'requests': self.requests, 'connections': len(self.connections), 'streams': streams,
+			'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses, 'cache_bytes': self.cache.bytes,
+			'bytes_sent': self.bytes_sent, 'pushed': self.pushed}
+
+	def report(self):
+		s = self.stats()
+		files = s['cache_hits'] + s['cache_misses']
+		return "gallery: %d sessions, %d requests, %d phones connected, %d%% of files from memory, %.1fMB sent" % (
+			s['sessions'], s['requests'], s['streams'], 100 * s['cache_hits'] // max(1, files), s['bytes_sent'] / (1024.0 * 1024))
+
+if __name__ == '__main__':
+	import sys
+	import config
+	gallery = Gallery(config.file_path, int(sys.argv[1]) if len(sys.argv) > 1 else config.gallery_port)
+	print("Serving %s at http://0.0.0.0:%d/" % (config.file_path, gallery.port))
+	gallery.run()
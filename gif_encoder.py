@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# In-process animated gif encoder. Replaces the "gm convert" shell-outs in start_photobooth(),
+# so each frame is decoded once and nothing is re-read from disk between thumbnailing and the gif.
+
+from PIL import Image # https://pillow.readthedocs.io/
+
+gif_colors = 256 # size of the palette shared by every frame
+gray_levels = 64 # greys in the fixed palette of black and white gifs. As smooth as a 256 colour palette was, and as small. 256 keeps every grey.
+
+# a one channel grey frame as a palette frame, with no quantizing: a lookup table takes each grey to its palette index
+def gray_frame(frame, levels=gray_levels):
+	indexed = Image.frombytes('P', frame.size, frame.point([v * levels // 256 for v in range(256)]).tobytes())
+	indexed.putpalette([i * 255 // (levels - 1) for i in range(levels) for rgb in range(3)])
+	return indexed
+
+# open each capture and shrink it on the way in if asked to. mode 'L' loads them grey.
+def load_frames(sources, max_size=None, mode='RGB'):
+	frames = []
+	for src in sources: # a file path or a file-like object
+		img = Image.open(src)
+		if max_size:
+			img.draft(mode, (max_size, max_size)) # let the jpeg decoder do most of the downscale
+			img.thumbnail((max_size, max_size), Image.LANCZOS)
+		frames.append(img.convert(mode))
+	return frames
+
+# build one palette for the whole animation, so frames don't flicker and deltas stay small
+def shared_palette(frames, colors=gif_colors):
+	width = max(f.size[0] for f in frames)
+	height = sum(f.size[1] for f in frames)
+	montage = Image.new('RGB', (width, height))
+	y = 0
+	for f in frames: # stack every frame into one image and quantize it once
+		montage.paste(f, (0, y))
+		y += f.size[1]
+	return montage.quantize(colors, method=Image.MEDIANCUT)
+
+# map every frame onto the palette and drop frames identical to the one before.
+# With no palette, the frames are grey and go straight onto a fixed palette of levels greys.
+# delay is one for every frame, or a list with each frame's own.
+# returns a list of [frame, duration in ms]
+def index_frames(frames, palette, delay, levels=gray_levels):
+	delays = delay if isinstance(delay, list) else [delay] * len(frames)
+	indexed = []
+	previous = None
+	for f, d in zip(frames, delays):
+		frame = f.quantize(palette=palette, dither=Image.NONE) if palette is not None else gray_frame(f, levels)
+		data = frame.tobytes()
+		if data == previous: # nothing changed, so show the last frame for longer
+			indexed[-1][1] += d * 10
+			continue
+		indexed.append([frame, d * 10]) # gif delay is in 1/100 sec, pillow wants ms
+		previous = data
+	return indexed
+
+# encode the animated gif
+# delay matches "gm convert -delay", in 1/100 of a second
+def make_gif(sources, gif_path, delay, max_size=None, colors=gif_colors):
+	return encode_frames(load_frames(sources, max_size), gif_path, delay, colors)
+
+# encode frames already loaded by load_frames(). Grey ('L') frames need no palette built.
+# delay as for index_frames().
+def encode_frames(frames, gif_path, delay, colors=gif_colors):
+	palette = None
+	if any(f.mode != 'L' for f in frames):
+		palette = shared_palette(frames, colors)
+	indexed = index_frames(frames, palette, delay, min(colors, gray_levels))
+	first = indexed[0][0]
+	# every frame shares one palette, so pillow only writes the changed rectangle of each frame
+	first.save(gif_path, save_all=True,
+		append_images=[f for f, d in indexed[1:]],
+		duration=[d for f, d in indexed],
+		loop=0, disposal=1, optimize=False)
+	return len(indexed)
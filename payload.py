@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# Shrinks posts to fit the venue's uplink before they are uploaded.
+# Recent uploads give the link's throughput, and from that a byte budget per post.
+# Files over budget are re-encoded: lower jpeg or webp quality, a smaller gif palette, then smaller frames.
+# Prepared files are kept until the post goes through, so a retry never re-encodes.
+
+import glob
+import math
+import os
+import threading
+import time
+from collections import deque
+from PIL import Image, ImageSequence # https://pillow.readthedocs.io/
+import animation
+import gif_encoder
+
+window = 5 # uploads the throughput is measured over
+min_budget = 100 * 1024 # never squeeze a post below this many bytes
+# re-encodings to try, in order, until one fits. Each is (scale, quality for jpg and webp, gif colors).
+# The last rungs are small enough that even a hi res gif fits in min_budget.
+ladder = [
+	(1.0, 85, 128),
+	(1.0, 70, 64),
+	(1.0, 55, 32),
+	(0.75, 60, 64),
+	(0.5, 60, 64),
+	(0.5, 50, 32),
+	(0.35, 50, 32),
+	(0.25, 40, 16),
+	(0.2, 40, 16),
+]
+
+# a one channel picture, or a palette of nothing but greys like gif_encoder writes for black and white
+def is_gray(img):
+	if img.mode == 'P':
+		palette = img.getpalette() or []
+		return all(palette[i] == palette[i + 1] == palette[i + 2] for i in range(0, len(palette), 3))
+	return img.mode == 'L'
+
+# the picture in its own mode: grey stays one channel, so it re-encodes on gif_encoder's grey palette
+def load_picture(img):
+	return img.convert('L' if is_gray(img) else 'RGB')
+
+# frames of an animation with each one's delay, in 1/100 of a second like gif_encoder.
+# Frames gif_encoder merged keep their longer hold.
+def load_animation(path):
+	img = Image.open(path)
+	mode = 'L' if is_gray(img) else 'RGB'
+	frames, delays = [], []
+	for frame in ImageSequence.Iterator(img):
+		frames.append(frame.convert(mode))
+		delays.append(frame.info.get('duration', 1000) // 10) # webp only has it once the frame is loaded
+	return frames, delays
+
+def scaled(frames, scale):
+	if scale == 1.0:
+		return frames
+	return [f.resize((int(f.size[0] * scale), int(f.size[1] * scale)), Image.LANCZOS) for f in frames]
+
+def encode_jpg(frames, path, delay, quality, colors):
+	frames[0].save(path, 'JPEG', quality=quality)
+	return 'quality %d' % quality
+
+def encode_gif(frames, path, delay, quality, colors):
+	gif_encoder.encode_frames(frames, path, delay, colors)
+	return '%d colors' % colors
+
+def encode_webp(frames, path, delay, quality, colors):
+	frames[0].save(path, 'WEBP', save_all=True, append_images=frames[1:], duration=[d * 10 for d in delay], loop=0,
+		quality=quality, method=animation.webp_method)
+	return 'quality %d' % quality
+
+encoders = {'.jpg': encode_jpg, '.gif': encode_gif, '.webp': encode_webp} # mp4s are already small, and go as they are
+
+class PayloadPreparer(object):
+
+	def __init__(self, cache_path, target_seconds=10):
+		self.cache_path = cache_path # where prepared files wait for their post to go through
+		self.target_seconds = target_seconds # how long a post should take on the measured link
+		self.uploads = deque(maxlen=window) # (bytes, seconds) of recent successful uploads
+		self.notes = {} # prepared path -> what was done to it
+		self.encodes = 0 # files re-encoded since start
+		self.hits = 0 # files found already prepared
+		self.saved = 0 # bytes saved since start
+		self.lock = threading.Lock()
+		if not os.path.isdir(cache_path):
+			os.makedirs(cache_path)
+
+	# passed every upload attempt, with the bytes sent
+	def observe(self, nbytes, seconds, ok):
+		if ok and seconds > 0:
+			with self.lock:
+				self.uploads.append((nbytes, seconds))
+
+	# bytes per second over the recent uploads. None until something has been uploaded.
+	def throughput(self):
+		with self.lock:
+			if not self.uploads:
+				return None
+			return sum(b for b, s in self.uploads) / sum(s for b, s in self.uploads)
+
+	# bytes a post may take. Rounded down to a power of two KB, so a small change in speed reuses what was prepared.
+	def budget(self):
+		speed = self.throughput()
+		if speed is None:
+			return None
+		budget = max(min_budget, speed * self.target_seconds)
+		return 1024 * 2 ** int(math.log(budget / 1024, 2))
+
+	# the files to post in place of files, and a note of what was done for the log
+	def prepare(self, files):
+		budget = self.budget()
+		if budget is None:
+			return files, 'full size, link speed not known yet'
+		each = budget // len(files)
+		prepared = [self.shrink(path, each) for path in files]
+		before = sum(os.path.getsize(path) for path in files)
+		after = sum(os.path.getsize(path) for path in prepared)
+		notes = sorted(set(self.notes.get(path, 'as is') for path in prepared))
+		return prepared, '%s, %dKB -> %dKB for a %dKB budget' % ('; '.join(notes), before // 1024, after // 1024, budget // 1024)
+
+	# path re-encoded to fit in budget bytes, or path itself if it already fits or can't be re-encoded
+	def shrink(self, path, budget):
+		name, ext = os.path.splitext(os.path.basename(path))
+		if os.path.getsize(path) <= budget or ext not in encoders:
+			return path
+		out = os.path.join(self.cache_path, '%s-%dk%s' % (name, budget // 1024, ext))
+		if os.path.exists(out):
+			self.hits += 1
+			return out
+		start = time.time()
+		if ext == '.jpg':
+			frames, delay = [load_picture(Image.open(path))], [0]
+		else:
+			frames, delay = load_animation(path)
+		tmp = out + '.tmp' + ext # renamed into place once it fits, so a crash never leaves half a file in the cache
+		for scale, quality, colors in ladder:
+			note = encoders[ext](scaled(frames, scale), tmp, delay, quality, colors)
+			if os.path.getsize(tmp) <= budget:
+				break
+		if scale != 1.0:
+			note += ', %d%% size' % (scale * 100)
+		os.rename(tmp, out)
+		self.encodes += 1
+		self.saved += os.path.getsize(path) - os.path.getsize(out)
+		self.notes[out] = note + ' in %.2fs' % (time.time() - start)
+		return out
+
+	# drop the prepared copies of files once their post is done with
+	def release(self, files):
+		for path in files:
+			name, ext = os.path.splitext(os.path.basename(path))
+			for prepared in glob.glob(os.path.join(self.cache_path, name + '-[0-9]*k' + ext)):
+				os.remove(prepared)
+				self.notes.pop(prepared, None)
+
+	def report(self):
+		speed = self.throughput()
+		return "payloads: %s, %d re-encoded, %d from cache, %dKB saved" % (
+			'%.0fKB/s' % (speed / 1024) if speed else 'link speed unknown', self.encodes, self.hits, self.saved // 1024)
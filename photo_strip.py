@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Print layout for a session: the pics tiled into a photo strip with a border,
+# an optional logo and the date, as a 300 DPI jpg ready to print.
+# Each pic is decoded at close to its printed size with JPEG draft mode,
+# then scaled and pasted whole, so there is no per-pixel work in Python.
+
+import math
+import time
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+dpi = 300
+size = (2, 6) # inches, width x height. (4, 6) with 2 columns makes a postcard.
+columns = 1
+border = 0.08 # inches around the edge
+gap = 0.05 # inches between pics
+footer = 0.5 # inches at the bottom for the logo and date. 0 for none.
+background = (255, 255, 255)
+text_color = (40, 40, 40)
+date_format = "%B %d, %Y"
+quality = 95 # jpg quality
+
+def inches(n):
+	return int(round(n * dpi))
+
+# an RGB colour in mode
+def color(rgb, mode):
+	if mode == 'RGB':
+		return rgb
+	return Image.new('RGB', (1, 1), rgb).convert(mode).getpixel((0, 0))
+
+# the box, as (left, top, right, bottom) in pixels, of each of count pics, and of the footer
+def layout(count):
+	width, height = inches(size[0]), inches(size[1])
+	rows = (count + columns - 1) // columns
+	cell_w = (width - 2 * inches(border) - (columns - 1) * inches(gap)) // columns
+	cell_h = (height - 2 * inches(border) - inches(footer) - (rows - 1) * inches(gap)) // rows
+	boxes = []
+	for i in range(count):
+		row, column = divmod(i, columns)
+		left = inches(border) + column * (cell_w + inches(gap))
+		top = inches(border) + row * (cell_h + inches(gap))
+		boxes.append((left, top, left + cell_w, top + cell_h))
+	footer_box = (inches(border), height - inches(border) - inches(footer), width - inches(border), height - inches(border))
+	return boxes, footer_box
+
+# the size pic_size shaped pics need to be to cover their cell in the strip, so they are only ever cropped, not enlarged
+def print_size(count, pic_size):
+	left, top, right, bottom = layout(count)[0][0]
+	scale = max((right - left) / float(pic_size[0]), (bottom - top) / float(pic_size[1]))
+	return int(math.ceil(pic_size[0] * scale)), int(math.ceil(pic_size[1] * scale))
+
+# a font about height pixels tall. Falls back to Pillow's built in font.
+def font(height):
+	for name in ("DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "FreeSans.ttf"):
+		try:
+			return ImageFont.truetype(name, height)
+		except (IOError, OSError):
+			pass
+	return ImageFont.load_default()
+
+# sources are paths, file-like objects or already decoded images of the session's pics, in order.
+# logo is an optional image path, fitted into the left of the footer. stamp is the time for the date.
+# mode 'L' makes a one channel grey strip, for black and white pics.
+def make_strip(sources, strip_path, logo=None, stamp=None, mode='RGB'):
+	boxes, footer_box = layout(len(sources))
+	canvas = Image.new(mode, (inches(size[0]), inches(size[1])), color(background, mode))
+	for source, box in zip(sources, boxes):
+		cell = (box[2] - box[0], box[3] - box[1])
+		if isinstance(source, Image.Image):
+			img = source
+		else:
+			img = Image.open(source)
+			img.draft(mode, cell) # decode at a fraction of full size when that is still big enough
+		img = ImageOps.fit(img.convert(mode), cell, Image.LANCZOS) # crop to the cell's shape, from the middle
+		canvas.paste(img, box[:2])
+	if footer > 0:
+		footer_w, footer_h = footer_box[2] - footer_box[0], footer_box[3] - footer_box[1]
+		text_left = footer_box[0]
+		if logo:
+			mark = Image.open(logo).convert('RGBA')
+			mark.thumbnail((footer_w // 2, footer_h), Image.LANCZOS)
+			canvas.paste(mark, (footer_box[0], footer_box[1] + (footer_h - mark.size[1]) // 2), mark)
+			text_left += mark.size[0] + inches(gap)
+		text = time.strftime(date_format, time.localtime(stamp))
+		draw = ImageDraw.Draw(canvas)
+		date_font = font(footer_h // 4)
+		text_w, text_h = draw.textsize(text, font=date_font) if hasattr(draw, 'textsize') else draw.textbbox((0, 0), text, font=date_font)[2:]
+		x = text_left + (footer_box[2] - text_left - text_w) // 2
+		draw.text((x, footer_box[1] + (footer_h - text_h) // 2), text, fill=color(text_color, mode), font=date_font)
+	canvas.save(strip_path, 'JPEG', quality=quality, dpi=(dpi, dpi))
+	return strip_path
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Runs a session's post-capture work (save the jpgs, thumbnails, the animation) in a pool of worker processes,
+# so the next group can start as soon as the camera is free.
+# The backlog is bounded: once it is full, the booth waits for a slot before taking more pics,
+# which keeps memory capped no matter how long the line is.
+
+import io
+import multiprocessing
+import os
+import threading
+import time
+import derivatives
+import animation
+import photo_strip
+from session_metrics import peak_memory, reset_peak_memory
+
+worker_nice = 10 # lower priority for workers, so capture and the screen come first
+
+def lower_priority():
+	try:
+		os.nice(worker_nice)
+	except (AttributeError, OSError):
+		pass
+
+# the work for one session. Runs in a worker process, so it only gets plain data.
+# job: now, file_path, frames (jpg bytes), derivatives (specs for derivatives.make_all), keep, make_gifs, animation_format, gif_delay, make_strips, strip_logo, mode
+def process_session(job):
+	timings = {}
+	peaks = {} # stage -> this worker's peak memory in MB during it
+	reset_peak_memory()
+	start = time.time()
+	jpgs = []
+	for i, data in enumerate(job['frames']):
+		path = job['file_path'] + job['now'] + "-0" + str(i+1) + ".jpg"
+		f = open(path, 'wb')
+		try:
+			f.write(data)
+		finally:
+			f.close()
+		jpgs.append(path)
+	timings['persist'] = time.time() - start
+	peaks['persist'] = peak_memory()
+	reset_peak_memory()
+	start = time.time()
+	prefixes = [path[:-len(".jpg")] for path in jpgs]
+	pics, derivative_timings = derivatives.make_all([io.BytesIO(data) for data in job['frames']], job['derivatives'], prefixes, job['mode'], job['keep'])
+	timings['derivatives'] = time.time() - start
+	peaks['derivatives'] = peak_memory()
+	for name, seconds in derivative_timings.items():
+		timings['derivative_' + name] = seconds
+	saved = [prefix + '-' + name + ".jpg" for prefix in prefixes for name, box, save in job['derivatives'] if save]
+	gif = None
+	gif_bytes = 0
+	if job['make_gifs']:
+		reset_peak_memory()
+		gif = animation.path(job['file_path'] + job['now'], job['animation_format'])
+		timings['gif'], gif_bytes = animation.encode(job['animation_format'], pics['gif'], gif, job['gif_delay'])
+		peaks['gif'] = peak_memory()
+	strip = None
+	if job['make_strips']:
+		reset_peak_memory()
+		start = time.time()
+		strip = job['file_path'] + job['now'] + "-strip.jpg"
+		photo_strip.make_strip(pics['print'], strip, job['strip_logo'], None, job['mode'])
+		timings['strip'] = time.time() - start
+		peaks['strip'] = peak_memory()
+	peaks = dict((name, mb) for name, mb in peaks.items() if mb is not None)
+	return {'now': job['now'], 'jpgs': jpgs, 'derivatives': saved, 'gif': gif, 'gif_bytes': gif_bytes, 'strip': strip, 'timings': timings, 'peaks': peaks}
+
+# process_session, with any error returned rather than raised, so the result callback always runs
+def run_session(job):
+	try:
+		return process_session(job)
+	except Exception:
+		import traceback
+		return {'now': job['now'], 'error': traceback.format_exc()}
+
+class Pipeline(object):
+
+	def __init__(self, workers, backlog):
+		self.pool = multiprocessing.Pool(workers, lower_priority)
+		self.backlog = backlog # most sessions waiting on or being processed at once
+		self.lock = threading.Lock()
+		self.in_flight = 0
+		self.processed = 0
+
+	def pending(self):
+		with self.lock:
+			return self.in_flight
+
+	def full(self):
+		return self.pending() >= self.backlog
+
+	# hand a session to the pool. on_done(result) is called from the pool's result thread.
+	# Callers wait for full() to clear first; this is what applies back-pressure.
+	def submit(self, job, on_done):
+		with self.lock:
+			self.in_flight += 1
+		def done(result):
+			with self.lock:
+				self.in_flight -= 1
+				self.processed += 1
+			on_done(result)
+		self.pool.apply_async(run_session, (job,), callback=done)
+
+	def close(self):
+		self.pool.close()
+		self.pool.join()
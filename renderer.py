@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# Draws the booth's screens: static images, the replay slideshow and the countdown.
+# Animations run on a frame schedule with a deadline for every frame, waiting through the event loop
+# in between, rather than sleeping. A frame whose deadline has passed is dropped, not drawn late.
+# Only the changed rectangles are sent to the display, and transition frames are rendered ahead of time.
+
+import time
+import pygame
+
+fps = 30 # target frame rate for animations
+fade_frames = 8 # frames in the cross fade between replay pics. 0 cuts straight to the next pic.
+pop_frames = 6 # frames each countdown number takes to shrink into place
+pop_scale = 1.6 # how big a countdown number starts
+background = (0, 0, 0)
+caption_color = (160, 160, 160)
+
+class Renderer(object):
+
+	# wait(seconds) sleeps while keeping the event loop turning, e.g. EventLoop.wait
+	def __init__(self, screen, wait, fps=fps):
+		self.screen = screen
+		self.wait = wait
+		self.fps = fps
+		self.shown = None # rect of the image on screen
+		self.captioned = None # rect of the caption on screen
+		self.digits = {} # countdown number -> pre-rendered frames, largest first
+		self.frames = 0 # animation frames drawn
+		self.dropped = 0 # animation frames skipped because they were already late
+		self.animating = 0 # seconds spent in animations
+		self.animations = 0
+		self.pixels = 0 # pixels sent to the display
+		self.full_pixels = 0 # pixels a full screen flip would have sent
+
+	def update(self, rects):
+		rects = [r for r in rects if r]
+		if rects:
+			pygame.display.update(rects)
+			self.pixels += sum(r.w * r.h for r in rects)
+			self.full_pixels += self.screen.get_width() * self.screen.get_height()
+
+	# put img on screen at offset, clearing only what it doesn't cover
+	def show(self, img, offset):
+		rect = pygame.Rect(offset, img.get_size())
+		dirty = [rect]
+		for old in (self.shown, self.captioned):
+			if old is not None and not rect.contains(old):
+				self.screen.fill(background, old)
+				dirty.append(old)
+		self.screen.blit(img, rect)
+		self.update(dirty)
+		self.shown = rect
+		self.captioned = None
+
+	# a line of small text in the bottom left corner, over whatever is on screen, until the next show()
+	def caption(self, text, color=caption_color):
+		pygame.font.init()
+		font = pygame.font.Font(None, self.screen.get_height() // 24)
+		line = font.render(text, True, color, background)
+		margin = self.screen.get_height() // 40
+		rect = line.get_rect(bottomleft=(margin, self.screen.get_height() - margin))
+		dirty = [rect]
+		if self.captioned is not None:
+			self.screen.fill(background, self.captioned)
+			dirty.append(self.captioned)
+		self.screen.blit(line, rect)
+		self.update(dirty)
+		self.captioned = rect
+
+	def clear(self):
+		shown = [rect for rect in (self.shown, self.captioned) if rect is not None]
+		for rect in shown:
+			self.screen.fill(background, rect)
+		self.update(shown)
+		self.shown = self.captioned = None
+
+	# draw count frames at fps. draw(i) draws frame i and returns the rects it changed.
+	# Late frames are dropped so the animation keeps to time, but the last frame is always drawn.
+	def animate(self, count, draw):
+		period = 1.0 / self.fps
+		start = time.time()
+		for i in range(count):
+			due = start + i * period
+			late = time.time() - due
+			if late >= period and i < count - 1:
+				self.dropped += 1
+				continue
+			if late < 0:
+				self.wait(-late)
+			self.update(draw(i))
+			self.frames += 1
+		self.animating += time.time() - start
+		self.animations += 1
+
+	# the frames of a cross fade from one image to another, not including either end
+	def fade(self, a, a_offset, b, b_offset):
+		if fade_frames <= 0 or a_offset != b_offset or a.get_size() != b.get_size():
+			return [] # a straight cut
+		if a.get_bitsize() == 8 or b.get_bitsize() == 8: # grey replay pics. Alpha blits between 8-bit surfaces are very slow.
+			a, b = a.convert(), b.convert()
+		frames = []
+		for k in range(1, fade_frames + 1):
+			frame = a.copy()
+			b.set_alpha(255 * k // (fade_frames + 1))
+			frame.blit(b, (0, 0))
+			frames.append(frame)
+		b.set_alpha(None)
+		return frames
+
+	# show each (image, offset) for hold seconds, fading into the next.
+	# The fade to the next image is rendered while the current one is on screen.
+	def slideshow(self, images, hold):
+		fades = []
+		for i, (img, offset) in enumerate(images):
+			start = time.time()
+			if fades:
+				rect = pygame.Rect(offset, img.get_size())
+				def draw(k):
+					self.screen.blit(fades[k] if k < len(fades) else img, rect)
+					return [rect]
+				self.animate(len(fades) + 1, draw)
+				self.shown = rect
+			else:
+				self.show(img, offset)
+			fades = []
+			if i + 1 < len(images):
+				fades = self.fade(img, offset, images[i + 1][0], images[i + 1][1])
+			self.wait(max(0, start + hold - time.time()))
+
+	# the frames of one countdown number, shrinking into place
+	def digit(self, n):
+		if n not in self.digits:
+			font = pygame.font.Font(None, self.screen.get_height() // 3)
+			text = font.render(str(n), True, (255, 255, 255))
+			frames = []
+			for k in range(pop_frames):
+				scale = pop_scale - (pop_scale - 1) * k / float(max(1, pop_frames - 1))
+				size = (int(text.get_width() * scale), int(text.get_height() * scale))
+				frames.append(pygame.transform.smoothscale(text, size))
+			self.digits[n] = frames
+		return self.digits[n]
+
+	# count down from seconds to 1 over whatever is on screen, in the bottom right corner.
+	# Only the number's box is redrawn, and only when it changes.
+	def countdown(self, seconds):
+		if seconds <= 0:
+			return
+		pygame.font.init()
+		numbers = [self.digit(n) for n in range(seconds, 0, -1)]
+		w = max(frames[0].get_width() for frames in numbers)
+		h = max(frames[0].get_height() for frames in numbers)
+		margin = self.screen.get_height() // 20
+		box = pygame.Rect(self.screen.get_width() - w - margin, self.screen.get_height() - h - margin, w, h)
+		behind = self.screen.subsurface(box).copy() # what the numbers cover
+		fps = int(self.fps)
+		def draw(i):
+			n, k = divmod(i, fps)
+			if n >= len(numbers):
+				k = pop_frames # the end: put back what was behind
+			elif k >= pop_frames:
+				return [] # this number is already in place
+			self.screen.blit(behind, box)
+			if k < pop_frames:
+				frame = numbers[n][k]
+				self.screen.blit(frame, frame.get_rect(center=box.center))
+			return [box]
+		self.animate(len(numbers) * fps + 1, draw)
+
+	def report(self):
+		fps = (self.frames - self.animations) / self.animating if self.animating else 0 # frame to frame intervals
+		saved = 1 - self.pixels / float(self.full_pixels) if self.full_pixels else 0
+		return "renderer: %d frames at %.1f fps, %d dropped, %d%% fewer pixels than full flips" % (self.frames, fps, self.dropped, saved * 100)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# Cache of images already loaded and scaled to fit the display.
+# Static screens (intro, instructions, poses...) are loaded once at startup.
+# Replay images go through a small LRU cache, keyed by path and display size.
+# Grey replay images stay 8-bit surfaces, a quarter of the memory of the display's 32-bit ones.
+
+import time
+from collections import OrderedDict
+import pygame
+
+gray_palette = [(i, i, i) for i in range(256)]
+
+# work out how to display an image on screen at the right ratio
+# returns (width, height, offset_x, offset_y)
+def fit(img_w, img_h, monitor_w, monitor_h):
+	ratio_h = (monitor_w * img_h) // img_w
+	if (ratio_h < monitor_h):
+		#Use horizontal black bars
+		return monitor_w, ratio_h, 0, (monitor_h - ratio_h) // 2
+	elif (ratio_h > monitor_h):
+		#Use vertical black bars
+		transform_x = (monitor_h * img_w) // img_h
+		return transform_x, monitor_h, (monitor_w - transform_x) // 2, 0
+	#No need for black bars as photo ratio equals screen ratio
+	return monitor_w, monitor_h, 0, 0
+
+class ScreenCache(object):
+
+	def __init__(self, monitor_w, monitor_h, replay_size=8):
+		self.monitor_w = monitor_w
+		self.monitor_h = monitor_h
+		self.replay_size = replay_size # how many replay images to keep
+		self.static = {} # path -> (surface, offset), never evicted
+		self.replay = OrderedDict() # (path, w, h) -> (surface, offset), least recently used first
+		self.hits = 0
+		self.misses = 0
+
+	# load an image and scale it to fit the display. Needs the display mode set, for convert().
+	# opener is an optional function returning a file-like object to read instead of image_path,
+	# or an RGB or grey ('L') PIL image already decoded
+	def load(self, image_path, opener=None):
+		if opener is not None:
+			src = opener()
+			if hasattr(src, 'tobytes') and src.mode == 'L': # one byte a pixel, drawn through a grey palette
+				img = pygame.image.fromstring(src.tobytes(), src.size, 'P')
+				img.set_palette(gray_palette)
+			elif hasattr(src, 'tobytes'): # a PIL image
+				img = pygame.image.fromstring(src.tobytes(), src.size, src.mode).convert()
+			else:
+				img = pygame.image.load(src, image_path).convert() # the path is only a hint of the format
+		else:
+			img = pygame.image.load(image_path).convert()
+		w, h, x, y = fit(img.get_width(), img.get_height(), self.monitor_w, self.monitor_h)
+		img = pygame.transform.scale(img, (w, h))
+		return img, (x, y)
+
+	# load all the static screens. Returns how long it took.
+	def preload(self, paths):
+		start = time.time()
+		for path in paths:
+			self.static[path] = self.load(path)
+		return time.time() - start
+
+	def get(self, image_path, opener=None):
+		if image_path in self.static:
+			self.hits += 1
+			return self.static[image_path]
+		key = (image_path, self.monitor_w, self.monitor_h)
+		if key in self.replay:
+			self.hits += 1
+			entry = self.replay.pop(key)
+			self.replay[key] = entry # mark as most recently used
+			return entry
+		self.misses += 1
+		entry = self.load(image_path, opener)
+		self.replay[key] = entry
+		while len(self.replay) > self.replay_size:
+			self.replay.popitem(last=False) # drop the least recently used
+		return entry
+
+	def report(self):
+		return "screen cache: %d static, %d replay, %d hits, %d misses" % (len(self.static), len(self.replay), self.hits, self.misses)
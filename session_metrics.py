@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# Timing for every stage of a photo booth session.
+# Each session is written as one json line. Rolling percentiles, counters and histograms
+# are served as plain text at http://<booth>:<port>/metrics (and as json at /metrics.json).
+# On Linux each stage's peak memory is kept too, by resetting the kernel's high water mark as the stage starts.
+
+import json
+import threading
+import time
+from collections import deque
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler # python 2
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+
+window = 200 # how many recent samples the percentiles are taken over
+buckets = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120] # histogram bucket upper bounds, in seconds
+
+# the process's peak resident memory in MB since the last reset_peak_memory(), or since it started. None where /proc has no VmHWM.
+def peak_memory():
+	try:
+		f = open('/proc/self/status')
+	except IOError:
+		return None
+	try:
+		for line in f:
+			if line.startswith('VmHWM:'):
+				return int(line.split()[1]) / 1024.0 # kB
+	finally:
+		f.close()
+	return None
+
+# start a new peak from the memory in use now. Linux 4.0 and later; elsewhere the peak just keeps counting from start.
+def reset_peak_memory():
+	try:
+		f = open('/proc/self/clear_refs', 'w')
+	except IOError:
+		return
+	try:
+		f.write('5')
+	except IOError:
+		pass
+	finally:
+		try:
+			f.close()
+		except IOError:
+			pass
+
+# p-th percentile (0-100) of a list of numbers, nearest rank
+def percentile(values, p):
+	if not values:
+		return 0
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+class Histogram(object):
+
+	def __init__(self):
+		self.counts = [0] * len(buckets)
+		self.count = 0
+		self.total = 0.0
+		self.recent = deque(maxlen=window)
+
+	def observe(self, seconds):
+		for i, bound in enumerate(buckets):
+			if seconds <= bound:
+				self.counts[i] += 1
+		self.count += 1
+		self.total += seconds
+		self.recent.append(seconds)
+
+	def summary(self):
+		recent = list(self.recent)
+		return {'count': self.count, 'sum': self.total,
+			'p50': percentile(recent, 50), 'p95': percentile(recent, 95)}
+
+# the spans of one session
+class SessionTimer(object):
+
+	def __init__(self, metrics, session_id):
+		self.metrics = metrics
+		self.session_id = session_id
+		self.start = time.time()
+		self.spans = [] # [name, seconds from session start, duration]
+		self.peaks = {} # stage name -> peak memory in MB while it ran
+
+	def span(self, name):
+		return Span(self, name)
+
+	def add(self, name, started, duration, peak=None):
+		self.spans.append([name, round(started - self.start, 4), round(duration, 4)])
+		self.metrics.observe(name, duration)
+		if peak is not None:
+			self.peaks[name] = round(max(peak, self.peaks.get(name, 0)), 1)
+			self.metrics.observe_peak(name, peak)
+
+	# write the session's json line and fold it into the rolling stats
+	def finish(self):
+		duration = time.time() - self.start
+		self.metrics.observe_session(self, duration)
+
+class Span(object):
+
+	def __init__(self, timer, name):
+		self.timer = timer
+		self.name = name
+
+	def __enter__(self):
+		reset_peak_memory()
+		self.started = time.time()
+		return self
+
+	def __exit__(self, *exc):
+		self.timer.add(self.name, self.started, time.time() - self.started, peak_memory())
+		return False
+
+class Metrics(object):
+
+	def __init__(self, log_path=None):
+		self.log_path = log_path # json lines file, one line per session. None to skip.
+		self.lock = threading.Lock()
+		self.stages = {} # stage name -> Histogram
+		self.peaks = {} # stage name -> [last peak memory in MB, highest]
+		self.sessions = Histogram()
+		self.uploads = Histogram()
+		self.upload_failures = 0
+		self.online = False # last state from the connectivity monitor
+		self.probe_failures = 0
+		self.online_changes = deque(maxlen=window) # [time, online] at recent changes
+		self.online_change_count = 0
+		self.session_times = deque(maxlen=window) # when recent sessions finished
+		self.storage_headroom = 0 # bytes left before a storage limit
+		self.storage_removed = 0 # bytes pruned since start
+		self.breaches = {} # stage name -> times it missed its deadline
+
+	def session(self, session_id):
+		return SessionTimer(self, session_id)
+
+	def observe(self, name, seconds):
+		with self.lock:
+			if name not in self.stages:
+				self.stages[name] = Histogram()
+			self.stages[name].observe(seconds)
+
+	# a stage's peak memory in MB, from a span or a pipeline worker
+	def observe_peak(self, name, mb):
+		with self.lock:
+			last, highest = self.peaks.get(name, (0, 0))
+			self.peaks[name] = [round(mb, 1), round(max(mb, highest), 1)]
+
+	# passed to deadlines.Deadlines as on_breach
+	def observe_breach(self, name):
+		with self.lock:
+			self.breaches[name] = self.breaches.get(name, 0) + 1
+
+	def observe_session(self, timer, seconds):
+		with self.lock:
+			self.sessions.observe(seconds)
+			self.session_times.append(time.time())
+		if self.log_path:
+			line = json.dumps({'session': timer.session_id, 'start': timer.start, 'duration': round(seconds, 4), 'spans': timer.spans, 'peak_mb': timer.peaks})
+			with self.lock:
+				f = open(self.log_path, 'a')
+				try:
+					f.write(line + '\n')
+				finally:
+					f.close()
+
+	# passed to UploadQueue as on_upload
+	def observe_upload(self, seconds, ok):
+		with self.lock:
+			self.uploads.observe(seconds)
+			if not ok:
+				self.upload_failures += 1
+
+	# passed to connectivity.ConnectivityMonitor as on_probe
+	def observe_connectivity(self, seconds, ok, online):
+		self.observe('connectivity', seconds)
+		with self.lock:
+			if not ok:
+				self.probe_failures += 1
+			if online != self.online:
+				self.online_changes.append([round(time.time(), 3), online])
+				self.online_change_count += 1
+			self.online = online
+
+	# from storage.Storage, after every session
+	def observe_storage(self, headroom, removed):
+		with self.lock:
+			self.storage_headroom = headroom
+			self.storage_removed = removed
+
+	# wrap a function so every call is timed as the named stage
+	def timed(self, name, fn):
+		def wrapper(*args, **kwargs):
+			start = time.time()
+			try:
+				return fn(*args, **kwargs)
+			finally:
+				self.observe(name, time.time() - start)
+		return wrapper
+
+	def sessions_per_hour(self):
+		hour_ago = time.time() - 3600
+		return len([t for t in self.session_times if t > hour_ago])
+
+	def snapshot(self):
+		with self.lock:
+			return {
+				'sessions_total': self.sessions.count,
+				'sessions_per_hour': self.sessions_per_hour(),
+				'session_seconds': self.sessions.summary(),
+				'upload_seconds': self.uploads.summary(),
+				'upload_failures': self.upload_failures,
+				'online': self.online,
+				'connectivity_probe_failures': self.probe_failures,
+				'connectivity_changes': list(self.online_changes),
+				'storage_headroom_bytes': self.storage_headroom,
+				'storage_removed_bytes': self.storage_removed,
+				'deadline_breaches': dict(self.breaches),
+				'stages': dict((name, h.summary()) for name, h in self.stages.items()),
+				'stage_peak_mb': dict((name, {'last': last, 'max': highest}) for name, (last, highest) in self.peaks.items()),
+			}
+
+	# Prometheus style text
+	def text(self):
+		lines = []
+		with self.lock:
+			lines.append('photobooth_sessions_total %d' % self.sessions.count)
+			lines.append('photobooth_sessions_per_hour %d' % self.sessions_per_hour())
+			lines.append('photobooth_upload_failures_total %d' % self.upload_failures)
+			lines.append('photobooth_online %d' % self.online)
+			lines.append('photobooth_connectivity_probe_failures_total %d' % self.probe_failures)
+			lines.append('photobooth_connectivity_changes_total %d' % self.online_change_count)
+			lines.append('photobooth_storage_headroom_bytes %d' % self.storage_headroom)
+			lines.append('photobooth_storage_removed_bytes_total %d' % self.storage_removed)
+			for name, count in sorted(self.breaches.items()):
+				lines.append('photobooth_deadline_breaches_total{stage="%s"} %d' % (name, count))
+			for name, (last, highest) in sorted(self.peaks.items()):
+				lines.append('photobooth_stage_peak_bytes{stage="%s"} %d' % (name, last * 1024 * 1024))
+				lines.append('photobooth_stage_peak_bytes_max{stage="%s"} %d' % (name, highest * 1024 * 1024))
+			histograms = [('photobooth_session_seconds', '', self.sessions), ('photobooth_upload_seconds', '', self.uploads)]
+			histograms += [('photobooth_stage_seconds', 'stage="%s",' % name, h) for name, h in sorted(self.stages.items())]
+			for metric, labels, h in histograms:
+				for bound, count in zip(buckets, h.counts):
+					lines.append('%s_bucket{%sle="%s"} %d' % (metric, labels, bound, count))
+				lines.append('%s_bucket{%sle="+Inf"} %d' % (metric, labels, h.count))
+				lines.append('%s_sum{%s} %.4f' % (metric, labels.rstrip(','), h.total))
+				lines.append('%s_count{%s} %d' % (metric, labels.rstrip(','), h.count))
+				summary = h.summary()
+				lines.append('%s_p50{%s} %.4f' % (metric, labels.rstrip(','), summary['p50']))
+				lines.append('%s_p95{%s} %.4f' % (metric, labels.rstrip(','), summary['p95']))
+		return '\n'.join(lines) + '\n'
+
+	# serve /metrics and /metrics.json from a daemon thread
+	def serve(self, port):
+		metrics = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path == '/metrics.json':
+					body, kind = json.dumps(metrics.snapshot()), 'application/json'
+				elif self.path == '/metrics':
+					body, kind = metrics.text(), 'text/plain; version=0.0.4'
+				else:
+					self.send_error(404)
+					return
+				body = body.encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type', kind)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass # keep the booth's console quiet
+
+		server = HTTPServer(('', port), Handler)
+		thread = threading.Thread(target=server.serve_forever, name='metrics')
+		thread.daemon = True
+		thread.start()
+		return server
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# Where the booth keeps its pics, and how much of the card they may take.
+# Each session is saved in file_path/<event>/<day>/, so an event is one folder to copy off the card.
+# A low priority background thread removes what the retention policy no longer needs,
+# then the oldest finished sessions while the pics are over quota or the card is short of space.
+# Sessions waiting to upload, and sessions still being taken or processed, are never removed.
+# Every removal is printed, with its bytes.
+
+import os
+import threading
+import time
+import traceback
+import catalog as session_catalog
+
+prune_interval = 60 # seconds between checks, on top of the one after every session
+pause = 0.02 # seconds between removals, so pruning never hogs the card mid-session
+nice = 19 # priority of the pruning thread. 19 is the lowest.
+session_guess = 5 * 1024 * 1024 # bytes a session takes, until the catalog has some to go by
+
+# a folder name for an event
+def folder_name(event):
+	name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in (event or 'booth'))
+	return name or 'booth'
+
+def mb(n):
+	return n / 1048576.0
+
+class Storage(object):
+
+	# catalog is the booth's catalog.Catalog, which knows every file and each session's upload status.
+	# quota_mb and min_free_mb of 0 are no limit. keep_days of 0 keeps sessions until space is needed.
+	# keep_frames False removes a session's full size frames once its upload is confirmed.
+	# keep_unposted False lets space be made from sessions never queued for upload (post_online off).
+	def __init__(self, file_path, catalog, event=None, quota_mb=0, min_free_mb=0, keep_days=0, keep_frames=True, keep_unposted=True):
+		self.file_path = file_path
+		self.catalog = catalog
+		self.event = event
+		self.quota = quota_mb * 1048576
+		self.min_free = min_free_mb * 1048576
+		self.keep_days = keep_days
+		self.keep_frames = keep_frames
+		self.finished = ('uploaded',) if keep_unposted else ('uploaded', 'none') # statuses that may be removed
+		self.removed_files = 0
+		self.removed_bytes = 0
+		self.stuck = False # out of space with nothing left that may be removed
+		self.wake = threading.Event()
+		self.open = set() # sessions begun and not yet ended, which pruning leaves alone
+		self.lock = threading.Lock() # held while folders are made or removed
+
+	# the folder for a session, made if needed, ending in a separator like config.file_path
+	def session_path(self, now):
+		path = os.path.join(self.file_path, folder_name(self.event), now[:10])
+		with self.lock:
+			if not os.path.isdir(path):
+				os.makedirs(path)
+		return path + os.sep
+
+	# a session is starting: keep it, and its day and event folders, until end(). Returns its folder.
+	def begin(self, now):
+		with self.lock:
+			self.open.add(now)
+		return self.session_path(now)
+
+	# a session has finished its pipeline, so it may be pruned like any other
+	def end(self, now):
+		with self.lock:
+			self.open.discard(now)
+
+	# the day and event folders of the open sessions
+	def open_folders(self):
+		folders = set()
+		for now in self.open:
+			day = os.path.abspath(os.path.join(self.file_path, folder_name(self.event), now[:10]))
+			folders.update([day, os.path.dirname(day)])
+		return folders
+
+	# the sessions with one of statuses that may be pruned, as (id, created), oldest first
+	def prunable(self, statuses):
+		with self.lock:
+			open_sessions = set(self.open)
+		return [row for row in self.catalog.sessions_with_status(statuses) if row[0] not in open_sessions]
+
+	# bytes free on the card, past which nothing should be written. None where it can't be found.
+	def free(self):
+		try:
+			stat = os.statvfs(self.file_path)
+		except (AttributeError, OSError): # not on Windows
+			return None
+		return stat.f_bavail * stat.f_frsize
+
+	# (bytes free, about how many more sessions fit) before a limit is reached
+	def headroom(self):
+		sessions, used = self.catalog.usage()
+		room = []
+		free = self.free()
+		if free is not None:
+			room.append(free - self.min_free)
+		if self.quota:
+			room.append(self.quota - used)
+		room = max(0, min(room)) if room else 0
+		per_session = used // sessions if sessions and used else session_guess
+		return room, room // per_session
+
+	# a line for the intro screen
+	def status(self):
+		room, sessions = self.headroom()
+		if self.stuck:
+			return "Storage nearly full: %.0fMB left" % mb(room)
+		return "%.1fGB free, room for about %d sessions" % (room / 1073741824.0, sessions)
+
+	# remove a session's files, or all of it when paths is None, waiting wait seconds after each. Returns the bytes removed.
+	def remove(self, session, paths, reason, wait=pause):
+		whole = paths is None
+		if whole:
+			paths = self.catalog.files(session)
+		removed = 0
+		folders = set()
+		for path in paths:
+			try:
+				size = os.path.getsize(path)
+				os.remove(path)
+			except OSError: # already gone
+				continue
+			removed += size
+			folders.add(os.path.dirname(path))
+			time.sleep(wait)
+		if whole:
+			self.catalog.remove_session(session)
+		else:
+			self.catalog.remove_files(paths)
+		with self.lock: # day and event folders go once they are empty, unless a session is about to be saved in them
+			keep = self.open_folders()
+			keep.add(os.path.abspath(self.file_path))
+			for folder in folders:
+				while os.path.abspath(folder) not in keep and os.path.isdir(folder) and not os.listdir(folder):
+					os.rmdir(folder)
+					folder = os.path.dirname(folder)
+		self.removed_files += len(paths)
+		self.removed_bytes += removed
+		print("Storage: removed %s %s (%d files, %.1fMB): %s" % (session, 'session' if whole else 'files', len(paths), mb(removed), reason))
+		return removed
+
+	# one pass of the retention policy and the limits. Returns the bytes removed.
+	def prune(self):
+		removed = 0
+		if not self.keep_frames:
+			for session, created in self.prunable(('uploaded',)):
+				frames = self.catalog.files(session, 'frame')
+				if frames:
+					removed += self.remove(session, frames, 'uploaded, full size frames not kept')
+		finished = self.prunable(self.finished)
+		if self.keep_days:
+			cutoff = time.time() - self.keep_days * 86400
+			while finished and finished[0][1] < cutoff:
+				removed += self.remove(finished.pop(0)[0], None, 'older than %d days' % self.keep_days)
+		sessions, used = self.catalog.usage()
+		free = self.free()
+		while True:
+			if self.quota and used > self.quota:
+				reason = 'over the %.1fMB quota' % mb(self.quota)
+			elif free is not None and self.min_free and free < self.min_free:
+				reason = 'under %.0fMB free' % mb(self.min_free)
+			else:
+				self.stuck = False
+				break
+			if not finished:
+				if not self.stuck:
+					print("Storage: %s, and no session left may be removed yet. Nothing removed." % reason)
+				self.stuck = True
+				break
+			n = self.remove(finished.pop(0)[0], None, reason)
+			removed += n
+			used -= n
+			if free is not None:
+				free += n
+		return removed
+
+	def worker(self):
+		try:
+			os.nice(nice) # on Linux this lowers only this thread
+		except (AttributeError, OSError):
+			pass
+		while True:
+			try:
+				self.prune()
+			except Exception:
+				traceback.print_exc()
+			self.wake.wait(prune_interval)
+			self.wake.clear()
+
+	# start pruning in the background. It is a daemon thread, so it never holds up exiting.
+	def start(self):
+		thread = threading.Thread(target=self.worker, name='storage')
+		thread.daemon = True
+		thread.start()
+		return thread
+
+	# check again now, e.g. after a session is saved or an upload is confirmed
+	def kick(self):
+		self.wake.set()
+
+	# remove every pic, catalogued or not, as fast as possible. Returns the bytes removed.
+	# With uploads, the booth's upload_queue.UploadQueue, posts of the removed pics are dropped from the queue too.
+	def clear(self, uploads=None):
+		removed = 0
+		paths = []
+		for session in self.catalog.sessions():
+			paths.extend(self.catalog.files(session))
+			removed += self.remove(session, None, 'clearing all pics', 0)
+		loose = {} # from before the catalog
+		for path in session_catalog.all_pics(self.file_path):
+			loose.setdefault(os.path.basename(path)[:session_catalog.session_length], []).append(path)
+		for session in sorted(loose):
+			paths.extend(loose[session])
+			removed += self.remove(session, loose[session], 'clearing all pics', 0)
+		if uploads is not None:
+			dropped = uploads.discard(paths)
+			if dropped:
+				print("Storage: dropped %d queued posts of the cleared pics" % dropped)
+		return removed
+
+	def report(self):
+		room, sessions = self.headroom()
+		return "storage: %.0fMB of headroom (about %d sessions), %d files removed (%.1fMB)" % (mb(room), sessions, self.removed_files, mb(self.removed_bytes))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# Encode time and file size of a session's animation in each format that can be made here
+# usage: python animation_benchmark.py [session timestamp]
+# With a timestamp, uses that session's pics from config.file_path. Without, makes camera-like frames.
+
+import os
+import sys
+import tempfile
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config
+import animation
+import catalog
+import gif_encoder
+
+total_pics = 4
+gif_delay = 100 # as in drumminhands_photobooth.py
+runs = 3
+
+if len(sys.argv) > 1:
+	names = [sys.argv[1] + "-0" + str(i) + ".jpg" for i in range(1, total_pics+1)]
+	found = dict((os.path.basename(path), path) for path in catalog.all_pics(config.file_path)) # in its event and day folder
+	frames = gif_encoder.load_frames([found[name] for name in names], 500)
+else:
+	# a gradient with sensor noise and a moving block, at the gif size
+	frames = []
+	for i in range(total_pics):
+		img = Image.blend(Image.linear_gradient('L').resize((500, 375)), Image.effect_noise((500, 375), 30), 0.3).convert('RGB')
+		ImageDraw.Draw(img).rectangle((60 + i * 90, 90, 160 + i * 90, 280), fill=(230, 230, 230))
+		frames.append(img)
+
+work = tempfile.mkdtemp()
+print("%d frames at %dx%d" % (len(frames), frames[0].size[0], frames[0].size[1]))
+for fmt in animation.formats:
+	if not animation.available(fmt):
+		print("%-5s not available here" % fmt)
+		continue
+	path = animation.path(os.path.join(work, 'bench'), fmt)
+	results = [animation.encode(fmt, frames, path, gif_delay) for run in range(runs)]
+	os.remove(path)
+	print("%-5s %.3fs  %6.1fKB" % (fmt, min(r[0] for r in results), results[0][1] / 1024.0))
+os.rmdir(work)
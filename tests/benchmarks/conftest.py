@@ -0,0 +1,98 @@
+# Shared setup for the benchmark suite: synthetic captures at both camera resolutions, a headless display,
+# and the bench fixture, which times a stage and fails it if it has slowed down past its saved baseline.
+# usage: python -m pytest tests/benchmarks                      check against baseline.json
+#        python -m pytest tests/benchmarks --update-baseline    save this machine's timings as the baseline
+# Baselines only compare on the machine they were made on, so make them on the booth's Pi.
+# The --update-baseline and --threshold options (fail a stage this many times slower, 1.5 by default) are in tests/conftest.py.
+
+import json
+import os
+import sys
+import time
+import pytest
+
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..', '..'))
+import config
+
+baseline_path = os.path.join(here, 'baseline.json')
+results_path = os.path.join(here, 'results.json') # the last run, to compare by hand
+rounds = 5 # each stage is timed this many times and the best kept, the least disturbed by anything else running
+slack = 0.005 # seconds on top, so stages of a few ms don't fail on timer noise
+
+# hi res pics (high_res_w x high_res_h) and the low res mode, 500px wide, as in drumminhands_photobooth.py
+resolutions = {
+	'hi': (1296, 972),
+	'low': (500, config.monitor_h * 500 // config.monitor_w),
+}
+
+results = {} # stage name -> best seconds this run
+
+def load_baseline():
+	if not os.path.exists(baseline_path):
+		return {}
+	f = open(baseline_path)
+	try:
+		return json.load(f)
+	finally:
+		f.close()
+
+def save(path, timings):
+	f = open(path, 'w')
+	try:
+		json.dump(timings, f, indent=1, sort_keys=True)
+		f.write('\n')
+	finally:
+		f.close()
+
+def pytest_sessionfinish(session, exitstatus):
+	if not results:
+		return
+	save(results_path, results)
+	if session.config.getoption('--update-baseline'):
+		baseline = load_baseline()
+		baseline.update(results)
+		save(baseline_path, baseline)
+
+class Bench(object):
+
+	def __init__(self, baseline, threshold, update):
+		self.baseline = baseline
+		self.threshold = threshold
+		self.update = update
+
+	# time fn() rounds times, record the best and check it. Returns what fn returned.
+	def __call__(self, name, fn, rounds=rounds):
+		times = []
+		for i in range(rounds):
+			start = time.time()
+			result = fn()
+			times.append(time.time() - start)
+		self.record(name, min(times))
+		return result
+
+	# check a time measured elsewhere, e.g. a stage of a simulated session
+	def record(self, name, seconds):
+		results[name] = round(seconds, 5)
+		if self.update or name not in self.baseline:
+			return
+		limit = self.baseline[name] * self.threshold + slack
+		assert seconds <= limit, "%s took %.4fs, baseline %.4fs, limit %.4fs" % (name, seconds, self.baseline[name], limit)
+
+@pytest.fixture(scope='session')
+def bench(request):
+	return Bench(load_baseline(), request.config.getoption('--threshold'), request.config.getoption('--update-baseline'))
+
+# (resolution name, the session's captures as jpg bytes), for each resolution
+@pytest.fixture(params=sorted(resolutions))
+def captures(request, synthetic):
+	return request.param, synthetic(resolutions[request.param])
+
+# the booth's screen, on SDL's dummy video driver
+@pytest.fixture(scope='session')
+def screen():
+	os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+	pygame = pytest.importorskip('pygame')
+	pygame.display.init()
+	yield pygame.display.set_mode((config.monitor_w, config.monitor_h))
+	pygame.display.quit()
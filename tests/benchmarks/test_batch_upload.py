@@ -0,0 +1,48 @@
+# Finding the sessions to upload in a big pics folder: grouping by scan, and asking the catalog
+
+import os
+import pytest
+import config
+import batch_upload
+import catalog as session_catalog
+import storage as pic_storage
+
+sessions = 2000
+total_pics = 4
+
+# a pics folder after a long event, in event and day folders: frames, web copies and a gif per session.
+# The files are empty, as only their names are read.
+@pytest.fixture(scope='module')
+def pics_folder(tmp_path_factory):
+	work = tmp_path_factory.mktemp('batch')
+	file_path = str(work / 'pics') + os.sep
+	os.makedirs(file_path)
+	catalog = session_catalog.Catalog(str(work / 'catalog.db'), config.event_name)
+	storage = pic_storage.Storage(file_path, catalog, config.event_name)
+	for n in range(sessions):
+		day, minute = divmod(n, 400) # 400 sessions a day, from 10am
+		now = "2016-07-%02d-%02d-%02d-00" % (1 + day, 10 + minute // 60, minute % 60)
+		folder = storage.session_path(now)
+		names = [now + "-0%d.jpg" % i for i in range(1, total_pics+1)]
+		names += [now + "-0%d-web.jpg" % i for i in range(1, total_pics+1)]
+		names.append(now + ".gif")
+		for name in names:
+			open(folder + name, 'w').close()
+	catalog.rebuild(file_path)
+	yield file_path, catalog
+	catalog.close()
+
+@pytest.mark.parametrize('make_gifs', [True, False])
+def test_find_sessions(bench, pics_folder, make_gifs, monkeypatch):
+	file_path, catalog = pics_folder
+	monkeypatch.setattr(config, 'file_path', file_path)
+	monkeypatch.setattr(config, 'make_gifs', make_gifs)
+	found = bench('batch_upload_scan_%s' % ('gifs' if make_gifs else 'jpgs'), batch_upload.find_sessions, rounds=3)
+	assert len(found) == sessions
+
+@pytest.mark.parametrize('make_gifs', [True, False])
+def test_catalog_sessions(bench, pics_folder, make_gifs, monkeypatch):
+	file_path, catalog = pics_folder
+	monkeypatch.setattr(config, 'make_gifs', make_gifs)
+	found = bench('batch_upload_catalog_%s' % ('gifs' if make_gifs else 'jpgs'), lambda: batch_upload.catalog_sessions(catalog), rounds=3)
+	assert len(found) == sessions
@@ -0,0 +1,53 @@
+# Putting images on the screen: working out their fit, and show_image() from a capture in memory or the cache
+
+import io
+import time
+import pytest
+pytest.importorskip('pygame') # the renderer and screen cache draw with it
+import config
+import renderer
+import screen_cache
+
+# set_demensions() in drumminhands_photobooth.py is screen_cache.fit() for the monitor
+def test_set_demensions(bench):
+	sizes = [(1296, 972), (500, 375), (2592, 1555), (config.monitor_w, config.monitor_h)] * 250
+	bench('set_demensions_x1000', lambda: [screen_cache.fit(w, h, config.monitor_w, config.monitor_h) for w, h in sizes])
+
+# a replay pic: decoded from memory and scaled to the screen, as on a cache miss
+def test_show_image(bench, screen, captures):
+	name, pics = captures
+	display = renderer.Renderer(screen, lambda seconds: None)
+	def show():
+		screens = screen_cache.ScreenCache(config.monitor_w, config.monitor_h)
+		for i, data in enumerate(pics):
+			img, offset = screens.get('pic-%d.jpg' % i, lambda: io.BytesIO(data))
+			display.show(img, offset)
+	bench('show_image_%s' % name, show)
+
+# a static screen, preloaded at startup
+def test_show_image_cached(bench, screen, captures):
+	name, pics = captures
+	display = renderer.Renderer(screen, lambda seconds: None)
+	screens = screen_cache.ScreenCache(config.monitor_w, config.monitor_h)
+	for i, data in enumerate(pics):
+		screens.static['pic-%d.jpg' % i] = screens.load('pic-%d.jpg' % i, lambda: io.BytesIO(data))
+	def show():
+		for i in range(len(pics)):
+			img, offset = screens.get('pic-%d.jpg' % i)
+			display.show(img, offset)
+	bench('show_image_cached_%s' % name, show)
+
+# the replay: each pic cross faded into the next. Grey pics (camera_saturation -100) are 8-bit surfaces,
+# and must replay about as quickly as colour ones.
+def test_replay(bench, screen, captures):
+	from PIL import Image
+	name, pics = captures
+	display = renderer.Renderer(screen, lambda seconds: None)
+	times = {}
+	for mode in ['RGB', 'L']:
+		screens = screen_cache.ScreenCache(config.monitor_w, config.monitor_h)
+		images = [screens.get('pic-%d.jpg' % i, lambda: Image.open(io.BytesIO(data)).convert(mode)) for i, data in enumerate(pics)]
+		start = time.time()
+		bench('replay_%s_%s' % (name, mode), lambda: display.slideshow(images, 0), rounds=2)
+		times[mode] = (time.time() - start) / 2
+	assert times['L'] <= times['RGB'] * 3 + 0.05, "grey replay took %.3fs, colour %.3fs" % (times['L'], times['RGB'])
@@ -0,0 +1,37 @@
+# Making the smaller sizes of a session's pics, and its animated gif, in colour and in grey
+
+import io
+import pytest
+pytest.importorskip('PIL') # https://pillow.readthedocs.io/
+import config
+import derivatives
+import gif_encoder
+
+# the booth's derivative_sizes in drumminhands_photobooth.py
+specs = [
+	('gif', (500, 500), False),
+	('replay', (config.monitor_w, config.monitor_h), False),
+	('web', (1024, 1024), True),
+	('thumb', (320, 320), True),
+]
+
+def readers(pics):
+	return [io.BytesIO(data) for data in pics]
+
+def test_thumbnail(bench, captures):
+	name, pics = captures
+	bench('thumbnail_%s' % name, lambda: derivatives.make_all(readers(pics), specs[:1]))
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_derivatives(bench, captures, mode, tmp_path):
+	name, pics = captures
+	prefixes = [str(tmp_path / ('pic-0%d' % (i + 1))) for i in range(len(pics))]
+	bench('derivatives_%s_%s' % (name, mode), lambda: derivatives.make_all(readers(pics), specs, prefixes, mode))
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_gif(bench, captures, mode, tmp_path):
+	name, pics = captures
+	frames = derivatives.make_all(readers(pics), specs[:1], None, mode)[0]['gif']
+	path = str(tmp_path / 'session.gif')
+	count = bench('gif_%s_%s' % (name, mode), lambda: gif_encoder.encode_frames(frames, path, 100))
+	assert count == len(pics)
@@ -0,0 +1,103 @@
+# Peak memory of a full sensor session: 5 MP captures through the derivatives, the gif and the print strip.
+# Each run is a fresh process, started from here, so nothing the suite did before counts against it.
+# The peak is read from the kernel's high water mark, reset as each session starts (Linux 4.0 and later).
+
+import io
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..', '..'))
+import session_metrics
+
+full_sensor = (2592, 1944) # full_res_w x full_res_h in drumminhands_photobooth.py
+sessions = 5
+# most a session may peak above the memory in use before the first session, in MB. Four threads each decoding at half size,
+# with what they resize from it, stay under; another decode at once, or a full size one, goes over.
+ceilings = {'RGB': 88, 'L': 32}
+# The first session sets up the worker threads, and the second is the first to reuse their memory.
+# MB a later session may peak above the second, before it counts as memory not being reused.
+growth = 3
+
+# the booth's derivative_sizes and derivative_uses in drumminhands_photobooth.py, plus the print size
+def session_specs(count, pic_size):
+	import config
+	import photo_strip
+	specs = [
+		('gif', (500, 500), False),
+		('replay', (config.monitor_w, config.monitor_h), False),
+		('web', (1024, 1024), True),
+		('thumb', (320, 320), True),
+		('print', photo_strip.print_size(count, pic_size), False),
+	]
+	return specs, ['gif', 'replay', 'print']
+
+def captures_in(folder):
+	return sorted(name for name in os.listdir(folder) if name.endswith('.jpg') and '-' not in name)
+
+# run in the child: process the jpgs in folder as sessions, print each session's peak above the memory in use before the first
+def run_sessions(folder, mode):
+	import derivatives
+	import gif_encoder
+	import photo_strip
+	from PIL import Image
+	names = captures_in(folder)
+	pics = []
+	for name in names:
+		f = open(os.path.join(folder, name), 'rb')
+		try:
+			pics.append(f.read())
+		finally:
+			f.close()
+	specs, keep = session_specs(len(pics), Image.open(io.BytesIO(pics[0])).size)
+	peaks = []
+	before = resident()
+	for n in range(sessions):
+		session_metrics.reset_peak_memory()
+		prefixes = [os.path.join(folder, 's%d-0%d' % (n, i + 1)) for i in range(len(pics))]
+		made, timings = derivatives.make_all([io.BytesIO(data) for data in pics], specs, prefixes, mode, keep)
+		gif_encoder.encode_frames(made['gif'], os.path.join(folder, 's%d.gif' % n), 100)
+		photo_strip.make_strip(made['print'], os.path.join(folder, 's%d-strip.jpg' % n), None, None, mode)
+		del made
+		peaks.append(session_metrics.peak_memory() - before)
+	sys.stdout.write(json.dumps(peaks) + '\n')
+
+# memory in use now, in MB
+def resident():
+	f = open('/proc/self/status')
+	try:
+		for line in f:
+			if line.startswith('VmRSS:'):
+				return int(line.split()[1]) / 1024.0
+	finally:
+		f.close()
+
+@pytest.fixture(scope='module')
+def full_sensor_captures(tmp_path_factory, synthetic):
+	if session_metrics.peak_memory() is None:
+		pytest.skip('no /proc/self/status here')
+	session_metrics.reset_peak_memory()
+	if session_metrics.peak_memory() > resident() + 1:
+		pytest.skip("this kernel can't reset the peak memory")
+	folder = tmp_path_factory.mktemp('full_sensor')
+	for i, data in enumerate(synthetic(full_sensor)):
+		f = open(str(folder / ('pic%d.jpg' % (i + 1))), 'wb')
+		try:
+			f.write(data)
+		finally:
+			f.close()
+	return str(folder)
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_full_sensor_memory(full_sensor_captures, mode):
+	output = subprocess.check_output([sys.executable, os.path.realpath(__file__), full_sensor_captures, mode], cwd=full_sensor_captures)
+	peaks = json.loads(output.decode('ascii').strip().splitlines()[-1])
+	assert len(peaks) == sessions
+	assert max(peaks) <= ceilings[mode], "a %s session peaked at %.0fMB above its start, ceiling %dMB" % (mode, max(peaks), ceilings[mode])
+	assert max(peaks[2:]) <= peaks[1] + growth, "%s sessions kept needing more memory: %s" % (mode, ', '.join('%.0fMB' % mb for mb in peaks))
+
+if __name__ == '__main__':
+	run_sessions(sys.argv[1], sys.argv[2])
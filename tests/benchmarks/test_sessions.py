@@ -0,0 +1,42 @@
+# Whole sessions on the simulated backend, at both camera resolutions, timed by the booth's own metrics log.
+# Runs drumminhands_photobooth.py with the python running the suite, so run it with the booth's python.
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+sessions = 3
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) // 2]
+
+@pytest.mark.parametrize('resolution', ['hi', 'low'])
+def test_session(bench, runnable, resolution, tmp_path):
+	log = tmp_path / 'sessions.jsonl'
+	command = [sys.executable, runnable, '--backend', 'sim', '--metrics-port', '0', '--sessions', str(sessions), '--no-delays',
+		'--file-path', str(tmp_path / 'pics') + os.sep, '--queue-path', str(tmp_path / 'queue') + os.sep,
+		'--metrics-log', str(log), '--catalog', str(tmp_path / 'catalog.db')]
+	if resolution == 'hi':
+		command.append('--hi-res')
+	env = dict(os.environ, SDL_VIDEODRIVER='dummy')
+	devnull = open(os.devnull, 'w')
+	try:
+		subprocess.check_call(command, cwd=os.path.dirname(runnable), env=env, stdout=devnull)
+	finally:
+		devnull.close()
+	f = open(str(log))
+	try:
+		lines = [json.loads(line) for line in f]
+	finally:
+		f.close()
+	assert len(lines) == sessions
+	bench.record('session_%s' % resolution, median(line['duration'] for line in lines))
+	stages = {}
+	for line in lines:
+		for name, started, seconds in line['spans']:
+			stages.setdefault(name, []).append(seconds)
+	for name in sorted(stages):
+		bench.record('session_%s_%s' % (resolution, name), median(stages[name]))
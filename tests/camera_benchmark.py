@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Time-to-first-shot and inter-shot latency, old per-session camera vs the kept-open camera
+# Uses camera_manager.FakeCamera, so it runs on any Linux box. No Pi needed.
+# usage: python camera_benchmark.py [sessions]
+
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import camera_manager
+
+total_pics = 4 # number of pics to be taken
+resolution = (500, 300) # low res pics
+sessions = 3
+if len(sys.argv) > 1:
+	sessions = int(sys.argv[1])
+
+out = tempfile.mkdtemp()
+
+# what start_photobooth() used to do: open the camera every session and sleep 2s before every shot
+def old_session(n):
+	camera = camera_manager.FakeCamera()
+	start = time.time()
+	camera.open()
+	camera.configure(resolution, 800, -100)
+	shots = []
+	for i in range(1, total_pics+1):
+		camera.show_preview()
+		time.sleep(2) #warm up camera
+		camera.capture(os.path.join(out, "old-%d-%d.jpg" % (n, i)))
+		shots.append(time.time())
+		camera.hide_preview()
+	camera.close()
+	return start, shots
+
+# the camera is opened once and each shot waits only for the exposure to settle
+def new_session(camera, n):
+	start = time.time()
+	camera.configure(resolution, 800, -100)
+	shots = []
+	for i in range(1, total_pics+1):
+		camera.show_preview()
+		camera.settle()
+		camera.capture(os.path.join(out, "new-%d-%d.jpg" % (n, i)))
+		shots.append(time.time())
+		camera.hide_preview()
+	return start, shots
+
+def report(name, results):
+	first = [shots[0] - start for start, shots in results]
+	gaps = [b - a for start, shots in results for a, b in zip(shots, shots[1:])]
+	print("%-10s time to first shot %.2fs  inter-shot %.2fs" % (name, sum(first) / len(first), sum(gaps) / len(gaps)))
+
+report("old", [old_session(n) for n in range(sessions)])
+warm = camera_manager.FakeCamera()
+warm.open() # once, at startup
+report("kept open", [new_session(warm, n) for n in range(sessions)])
+print("done")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# Finding sessions by globbing the pics folder vs asking the catalog
+# usage: python catalog_benchmark.py [sessions]
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import catalog as session_catalog
+
+sessions = 10000 # 5 files each: 4 jpgs and a gif
+if len(sys.argv) > 1:
+	sessions = int(sys.argv[1])
+
+work = tempfile.mkdtemp()
+pics = os.path.join(work, 'pics') + '/'
+os.mkdir(pics)
+names = []
+for n in range(sessions):
+	now = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(1469960786 + n * 60))
+	names.append(now)
+	for i in range(4):
+		open(pics + now + "-0" + str(i+1) + ".jpg", 'w').close()
+	open(pics + now + ".gif", 'w').close()
+uploaded = names[:sessions // 2]
+
+try:
+	# the old way: glob, sort, group by the first 19 characters, then skip what the manifest lists
+	start = time.time()
+	files = sorted(glob.glob(pics + '*.jpg'))
+	groups = []
+	previous = None
+	for f in files:
+		group = f[len(pics):][:19]
+		if group != previous:
+			groups.append(group)
+			previous = group
+	done = set(uploaded)
+	pending = [g for g in groups if g not in done]
+	globbed = time.time() - start
+
+	catalog = session_catalog.Catalog(os.path.join(work, 'catalog.db'))
+	start = time.time()
+	catalog.rebuild(pics, uploaded)
+	rebuilt = time.time() - start
+
+	start = time.time()
+	from_catalog = catalog.pending_uploads()
+	queried = time.time() - start
+
+	start = time.time()
+	for session in from_catalog[:1000]:
+		catalog.files(session, 'frame')
+	per_session = (time.time() - start) / min(1000, len(from_catalog))
+
+	assert from_catalog == pending
+	print("%d sessions, %d files" % (sessions, sessions * 5))
+	print("glob + sort + group:       %.3fs" % globbed)
+	print("catalog rebuild (once):    %.3fs" % rebuilt)
+	print("catalog pending uploads:   %.3fs" % queried)
+	print("catalog files of session:  %.3fms" % (per_session * 1000))
+	catalog.close()
+finally:
+	shutil.rmtree(work)
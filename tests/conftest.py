@@ -0,0 +1,59 @@
+# Shared setup for the tests: the booth's modules on the path, and a check that the booth itself can run here.
+# usage: python -m pytest                      from the top of the repo, everything in tests/ named test_*.py
+#        python -m pytest tests/benchmarks     the benchmarks only
+
+import io
+import os
+import sys
+import pytest
+
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+booth = os.path.join(here, '..', 'drumminhands_photobooth.py')
+total_pics = 4 # as in drumminhands_photobooth.py
+
+# The benchmark options live here, not in tests/benchmarks/conftest.py: pytest only reads options
+# from the conftests it loads before collecting, and with testpaths that is this one.
+def pytest_addoption(parser):
+	parser.addoption('--update-baseline', action='store_true', help='save the benchmark timings as the new baseline')
+	parser.addoption('--threshold', type=float, default=1.5, help='how many times slower than its baseline fails a benchmark')
+
+# tests that run whole sessions start drumminhands_photobooth.py with the python running the suite,
+# so run them with the booth's python. Elsewhere they are skipped.
+@pytest.fixture(scope='session')
+def runnable():
+	f = open(booth)
+	try:
+		compile(f.read(), booth, 'exec')
+	except SyntaxError:
+		pytest.skip("drumminhands_photobooth.py doesn't run on this python")
+	finally:
+		f.close()
+	pytest.importorskip('pygame')
+	return booth
+
+# camera-like jpgs: a gradient with sensor noise and a block that moves from pic to pic
+def synthetic_captures(size):
+	from PIL import Image, ImageDraw # https://pillow.readthedocs.io/
+	w, h = size
+	pics = []
+	for i in range(total_pics):
+		img = Image.blend(Image.linear_gradient('L').resize(size), Image.effect_noise(size, 30), 0.3).convert('RGB')
+		ImageDraw.Draw(img).rectangle((w // 8 + i * w // 6, h // 4, w // 3 + i * w // 6, h * 3 // 4), fill=(230, 230, 230))
+		data = io.BytesIO()
+		img.save(data, 'JPEG', quality=85)
+		pics.append(data.getvalue())
+	return pics
+
+made = {}
+
+# a session's synthetic captures at a size, as jpg bytes: synthetic(size). Each size is made once per run.
+@pytest.fixture(scope='session')
+def synthetic():
+	pytest.importorskip('PIL')
+	def captures(size):
+		if size not in made:
+			made[size] = synthetic_captures(size)
+		return made[size]
+	return captures
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Every derivative of a session's pics: a decode per size, as before, vs one decode per pic,
+# on one thread and on a thread per pic
+# usage: python derivatives_benchmark.py [width] [height]
+
+import io
+import os
+import sys
+import time
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config
+import derivatives
+import photo_strip
+import session_metrics
+
+width, height = 1296, 972 # high_res_w x high_res_h in drumminhands_photobooth.py
+if len(sys.argv) > 2:
+	width, height = int(sys.argv[1]), int(sys.argv[2])
+total_pics = 4
+runs = 3
+
+specs = [
+	('gif', (500, 500), False),
+	('replay', (config.monitor_w, config.monitor_h), False),
+	('web', (1024, 1024), False),
+	('print', photo_strip.print_size(total_pics, (width, height)), False),
+]
+
+# camera-like jpgs, kept in memory like the booth's frames
+pics = []
+for i in range(total_pics):
+	img = Image.effect_noise((width, height), 40 + i * 10).convert('RGB')
+	data = io.BytesIO()
+	img.save(data, 'JPEG', quality=85)
+	pics.append(data.getvalue())
+
+# the old way: every size decodes every pic again
+def decode_per_size():
+	for name, box, save in specs:
+		for data in pics:
+			img = Image.open(io.BytesIO(data))
+			img.draft('RGB', box)
+			img = img.convert('RGB')
+			img.thumbnail(box, Image.LANCZOS)
+
+def one_decode(workers):
+	derivatives.workers = workers
+	return derivatives.make_all([io.BytesIO(data) for data in pics], specs)[1]
+
+def best(fn, *args):
+	times = []
+	for run in range(runs):
+		start = time.time()
+		fn(*args)
+		times.append(time.time() - start)
+	return min(times)
+
+print("%d pics at %dx%d, sizes: %s" % (total_pics, width, height, ", ".join("%s %dx%d" % (n, b[0], b[1]) for n, b, s in specs)))
+print("decode per size:           %.3fs" % best(decode_per_size))
+print("one decode, 1 thread:      %.3fs" % best(one_decode, 1))
+print("one decode, %d threads:     %.3fs" % (total_pics, best(one_decode, total_pics)))
+session_metrics.reset_peak_memory()
+timings = one_decode(total_pics)
+print(derivatives.report(timings, session_metrics.peak_memory()))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Compare the in-process gif encoder against the old GraphicsMagick path
+# Move this file to the main directory (next to config.py) to test, or run it from there
+# usage: python gif_benchmark.py [session timestamp] [hi|lo]
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config # this is the config python file config.py
+import gif_encoder
+
+now = "2016-07-31-10-26-26" # run the photobooth at least once, to get a batch of photos in there. Then set this to match their filenames.
+total_pics = 4 # number of pics to be taken
+gif_delay = 100 # How much time between frames in the animated gif
+runs = 5 # how many times to time each path
+
+if len(sys.argv) > 1:
+	now = sys.argv[1]
+hi_res = len(sys.argv) > 2 and sys.argv[2] == 'hi'
+
+jpgs = [config.file_path + now + "-0" + str(x) + ".jpg" for x in range(1, total_pics+1)]
+gm_gif = config.file_path + now + "-bench-gm.gif"
+pil_gif = config.file_path + now + "-bench-pil.gif"
+
+# the old path, exactly as start_photobooth() used to run it
+def graphicsmagick():
+	if hi_res:
+		small = []
+		for x in range(1, total_pics+1):
+			sm = config.file_path + now + "-0" + str(x) + "-bench-sm.jpg"
+			os.system("gm convert -size 500x500 " + jpgs[x-1] + " -thumbnail 500x500 " + sm)
+			small.append(sm)
+		os.system("gm convert -delay " + str(gif_delay) + " " + " ".join(small) + " " + gm_gif)
+		for sm in small:
+			os.remove(sm)
+	else:
+		os.system("gm convert -delay " + str(gif_delay) + " " + " ".join(jpgs) + " " + gm_gif)
+
+def encoder():
+	if hi_res:
+		gif_encoder.make_gif(jpgs, pil_gif, gif_delay, max_size=500)
+	else:
+		gif_encoder.make_gif(jpgs, pil_gif, gif_delay)
+
+def timed(fn):
+	times = []
+	for x in range(runs):
+		start = time.time()
+		fn()
+		times.append(time.time() - start)
+	return min(times), sum(times) / len(times)
+
+for name, fn, out in (("gm convert", graphicsmagick, gm_gif), ("gif_encoder", encoder, pil_gif)):
+	best, mean = timed(fn)
+	print("%-12s best %.3fs  mean %.3fs  size %d bytes" % (name, best, mean, os.path.getsize(out)))
+	os.remove(out)
+
+print("done")
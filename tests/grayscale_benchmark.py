@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Black and white sessions, kept in colour as before vs as one channel grey:
+# decoded memory per frame, derivative and animation times, file sizes and replay surface memory
+# usage: python grayscale_benchmark.py [width] [height]
+
+import io
+import os
+import sys
+import tempfile
+import time
+from PIL import Image, ImageDraw
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy') # no monitor needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import pygame
+import config
+import animation
+import derivatives
+import photo_strip
+import screen_cache
+
+width, height = 1296, 972 # high_res_w x high_res_h in drumminhands_photobooth.py
+if len(sys.argv) > 2:
+	width, height = int(sys.argv[1]), int(sys.argv[2])
+total_pics = 4
+gif_delay = 100 # as in drumminhands_photobooth.py
+runs = 3
+
+specs = [
+	('gif', (500, 500), False),
+	('replay', (config.monitor_w, config.monitor_h), False),
+	('web', (1024, 1024), True),
+	('print', photo_strip.print_size(total_pics, (width, height)), False),
+]
+
+# what the camera gives at saturation -100: a three channel jpg with nothing in the colour planes
+pics = []
+for i in range(total_pics):
+	img = Image.blend(Image.linear_gradient('L').resize((width, height)), Image.effect_noise((width, height), 30), 0.3)
+	ImageDraw.Draw(img).rectangle((width // 8 + i * width // 6, height // 4, width // 3 + i * width // 6, height * 3 // 4), fill=230)
+	data = io.BytesIO()
+	img.convert('RGB').save(data, 'JPEG', quality=85)
+	pics.append(data.getvalue())
+
+pygame.display.init()
+pygame.display.set_mode((config.monitor_w, config.monitor_h))
+screens = screen_cache.ScreenCache(config.monitor_w, config.monitor_h)
+work = tempfile.mkdtemp()
+
+def best(fn):
+	times = []
+	for run in range(runs):
+		start = time.time()
+		result = fn()
+		times.append(time.time() - start)
+	return min(times), result
+
+def measure(mode):
+	results = {}
+	full = Image.open(io.BytesIO(pics[0])).convert(mode)
+	results['frame MB'] = len(full.tobytes()) / 1048576.0
+	prefixes = [os.path.join(work, mode + '-0' + str(i + 1)) for i in range(total_pics)]
+	results['derivatives s'], (made, timings) = best(lambda: derivatives.make_all([io.BytesIO(d) for d in pics], specs, prefixes, mode))
+	results['derivatives MB'] = sum(len(img.tobytes()) for name in made for img in made[name]) / 1048576.0
+	results['web jpg KB'] = sum(os.path.getsize(p + '-web.jpg') for p in prefixes) / 1024.0
+	for fmt in animation.formats:
+		if animation.available(fmt):
+			path = animation.path(os.path.join(work, mode), fmt)
+			results[fmt + ' s'], (seconds, size) = best(lambda: animation.encode(fmt, made['gif'], path, gif_delay))
+			results[fmt + ' KB'] = size / 1024.0
+	strip = os.path.join(work, mode + '-strip.jpg')
+	results['strip s'] = best(lambda: photo_strip.make_strip(made['print'], strip, mode=mode))[0]
+	results['strip KB'] = os.path.getsize(strip) / 1024.0
+	surfaces = [screens.load(p, lambda img=img: img)[0] for p, img in zip(prefixes, made['replay'])]
+	results['replay MB'] = sum(s.get_bytesize() * s.get_width() * s.get_height() for s in surfaces) / 1048576.0
+	return results
+
+colour = measure('RGB')
+grey = measure('L')
+print("%d black and white pics at %dx%d" % (total_pics, width, height))
+print("%-16s %9s %9s %7s" % ('', 'RGB', 'L', 'saved'))
+for name in sorted(colour):
+	print("%-16s %9.3f %9.3f %6.1fx" % (name, colour[name], grey[name], colour[name] / grey[name] if grey[name] else 0))
+for name in os.listdir(work):
+	os.remove(os.path.join(work, name))
+os.rmdir(work)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# Sessions per hour with and without pipelining, on the simulated backend
+# usage: python pipeline_benchmark.py [sessions] [workers]
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sessions = 20
+workers = 2
+if len(sys.argv) > 1:
+	sessions = int(sys.argv[1])
+if len(sys.argv) > 2:
+	workers = int(sys.argv[2])
+
+booth = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'drumminhands_photobooth.py')
+
+def run(pipeline_workers):
+	work = tempfile.mkdtemp()
+	os.mkdir(os.path.join(work, 'pics'))
+	try:
+		output = subprocess.check_output([sys.executable, booth, '--backend', 'sim', '--metrics-port', '0', '--no-delays', '--hi-res',
+			'--sessions', str(sessions), '--pipeline-workers', str(pipeline_workers),
+			'--file-path', os.path.join(work, 'pics') + '/', '--queue-path', os.path.join(work, 'queue') + '/',
+			'--metrics-log', os.path.join(work, 'sessions.jsonl'), '--catalog', os.path.join(work, 'catalog.db'),
+			'--gallery-port', '0'], stderr=subprocess.STDOUT)
+	finally:
+		shutil.rmtree(work)
+	return float(re.search(r'\((\d+) sessions/hour\)', output.decode('utf-8')).group(1))
+
+without = run(0)
+with_pipeline = run(workers)
+print("without pipelining:  %.0f sessions/hour" % without)
+print("with %d workers:      %.0f sessions/hour (%+.0f%%)" % (workers, with_pipeline, (with_pipeline / without - 1) * 100))
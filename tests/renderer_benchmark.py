@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# Frame rate of the countdown and replay, and full screen flips vs dirty rectangle updates.
+# Run it on the Pi for real numbers. Elsewhere it draws to a headless display.
+# usage: python renderer_benchmark.py [fps]
+
+import os
+import sys
+import time
+import pygame
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config
+import renderer
+
+fps = 30
+if len(sys.argv) > 1:
+	fps = int(sys.argv[1])
+
+if not os.environ.get('DISPLAY'):
+	os.environ['SDL_VIDEODRIVER'] = 'dummy'
+pygame.init()
+screen = pygame.display.set_mode((config.monitor_w, config.monitor_h))
+
+def wait(seconds):
+	time.sleep(seconds)
+
+# replay sized pics, letterboxed like the real ones
+pics = []
+for shade in (60, 120, 180, 240):
+	img = pygame.Surface((config.monitor_w, config.monitor_h * 3 // 4)).convert()
+	img.fill((shade, shade, shade))
+	pics.append((img, (0, config.monitor_h // 8)))
+
+# the old way: fill, blit and flip the whole screen per frame
+frames = 300
+start = time.time()
+for i in range(frames):
+	img, offset = pics[i % len(pics)]
+	screen.fill((0, 0, 0))
+	screen.blit(img, offset)
+	pygame.display.flip()
+flip = (time.time() - start) / frames
+
+display = renderer.Renderer(screen, wait, fps)
+start = time.time()
+for i in range(frames):
+	img, offset = pics[i % len(pics)]
+	display.show(img, offset)
+dirty = (time.time() - start) / frames
+
+display = renderer.Renderer(screen, wait, fps)
+start = time.time()
+display.countdown(3)
+countdown = time.time() - start
+countdown_report = display.report()
+
+display = renderer.Renderer(screen, wait, fps)
+start = time.time()
+display.slideshow(pics * 2, 1)
+slideshow = time.time() - start
+
+print("full screen flip:    %.2fms per frame" % (flip * 1000))
+print("dirty rect update:   %.2fms per frame" % (dirty * 1000))
+print("countdown(3):        %.2fs, %s" % (countdown, countdown_report))
+print("slideshow 8 x 1s:    %.2fs, %s" % (slideshow, display.report()))
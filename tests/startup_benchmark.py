@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# Time from launch to the intro screen and to ready for the first guest, on the simulated backend
+# usage: python startup_benchmark.py [runs] [camera open seconds]
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+runs = 5
+camera_open = 1.0 # picamera.PiCamera() takes about this long on a Pi
+target = 1.5 # seconds to ready, with the camera taking camera_open of it
+if len(sys.argv) > 1:
+	runs = int(sys.argv[1])
+if len(sys.argv) > 2:
+	camera_open = float(sys.argv[2])
+
+booth = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'drumminhands_photobooth.py')
+
+def run():
+	work = tempfile.mkdtemp()
+	os.mkdir(os.path.join(work, 'pics'))
+	try:
+		output = subprocess.check_output([sys.executable, booth, '--backend', 'sim', '--metrics-port', '0', '--no-delays', '--sessions', '1',
+			'--sim-camera-open', str(camera_open),
+			'--file-path', os.path.join(work, 'pics') + '/', '--queue-path', os.path.join(work, 'queue') + '/',
+			'--metrics-log', os.path.join(work, 'sessions.jsonl'), '--catalog', os.path.join(work, 'catalog.db')],
+			stderr=subprocess.STDOUT).decode('utf-8')
+	finally:
+		shutil.rmtree(work)
+	found = re.search(r'Intro shown at ([\d.]+)s, ready at ([\d.]+)s', output)
+	return float(found.group(1)), float(found.group(2)), re.search(r'Startup: (.*)', output).group(1)
+
+results = [run() for i in range(runs)]
+best = min(results, key=lambda r: r[1])
+print("camera takes %.1fs to open" % camera_open)
+print("intro shown:  best %.2fs" % min(r[0] for r in results))
+print("ready:        best %.2fs, worst %.2fs (target %.1fs: %s)" % (best[1], max(r[1] for r in results), target, "met" if best[1] <= target else "MISSED"))
+print("stages of the best run: " + best[2])
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# How long a print strip takes to compose from a session's pics, at the booth's hi res size
+# usage: python strip_benchmark.py [width] [height]
+
+import io
+import os
+import sys
+import tempfile
+import time
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import photo_strip
+
+width, height = 1296, 972 # high_res_w x high_res_h in drumminhands_photobooth.py
+if len(sys.argv) > 2:
+	width, height = int(sys.argv[1]), int(sys.argv[2])
+total_pics = 4
+runs = 5
+logo = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'templates', 'cam.jpg')
+
+# camera-like jpgs, kept in memory like the booth's frames
+pics = []
+for i in range(total_pics):
+	img = Image.effect_noise((width, height), 40 + i * 10).convert('RGB')
+	data = io.BytesIO()
+	img.save(data, 'JPEG', quality=85)
+	pics.append(data.getvalue())
+
+out = os.path.join(tempfile.mkdtemp(), 'strip.jpg')
+times = []
+for run in range(runs):
+	start = time.time()
+	photo_strip.make_strip([io.BytesIO(data) for data in pics], out, logo)
+	times.append(time.time() - start)
+
+result = Image.open(out)
+print("%d pics at %dx%d -> %dx%d strip at %s dpi" % (total_pics, width, height, result.size[0], result.size[1], result.info.get('dpi', ('?',))[0]))
+print("best %.3fs, mean %.3fs over %d runs" % (min(times), sum(times) / len(times), runs))
+os.remove(out)
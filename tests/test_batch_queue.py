@@ -0,0 +1,43 @@
+# batch_upload.py after an event: sessions the booth's own upload queue still holds are left to it,
+# so they aren't posted twice. The rest are posted, through the stand-in client.
+
+import argparse
+import os
+import pytest
+
+import batch_upload
+import catalog as session_catalog
+import config
+import upload_queue
+
+sessions = ["2016-07-31-10-00-00", "2016-07-31-10-05-00", "2016-07-31-10-10-00"]
+
+@pytest.fixture
+def event(tmp_path, monkeypatch):
+	pics = str(tmp_path / 'pics') + os.sep
+	os.makedirs(pics)
+	monkeypatch.setattr(config, 'file_path', pics)
+	monkeypatch.setattr(config, 'make_gifs', True)
+	catalog = session_catalog.Catalog(str(tmp_path / 'catalog.db'), 'My Event')
+	for now in sessions:
+		catalog.add_session(now)
+		open(pics + now + '.gif', 'w').close()
+		catalog.add_file(now, pics + now + '.gif', 'animation')
+	uploads = upload_queue.UploadQueue(None, str(tmp_path / 'queue'), 'blog', 'tag')
+	uploads.enqueue_gif(pics + sessions[1] + '.gif', sessions[1]) # still waiting in the booth
+	catalog.set_upload_status(sessions[1], 'pending')
+	catalog.close()
+	return tmp_path, uploads
+
+def test_queued_sessions(event):
+	work, uploads = event
+	assert batch_upload.queued_sessions(uploads.queue_path) == set([sessions[1]])
+
+@pytest.mark.parametrize('scan', [False, True])
+def test_queued_sessions_are_left_to_the_booth(event, scan, monkeypatch):
+	work, uploads = event
+	posted = []
+	monkeypatch.setattr(batch_upload, 'upload_session', lambda client, limiter, session, data, retries: posted.append(session) or True)
+	batch_upload.main(argparse.Namespace(stub=True, stub_latency=0, stub_fail_every=0, workers=2, rate=6000, burst=10, max_retries=1,
+		manifest=str(work / 'manifest.txt'), catalog=str(work / 'catalog.db'), scan=scan, queue_path=uploads.queue_path))
+	assert sorted(posted) == [sessions[0], sessions[2]]
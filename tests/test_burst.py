@@ -0,0 +1,66 @@
+# Does burst scoring keep the right frame, and is it quick enough to fit in capture_delay?
+# Each set is a sharp, well exposed frame among blurred, dark, bright and clipped copies of it.
+
+import io
+import pytest
+Image = pytest.importorskip('PIL.Image') # https://pillow.readthedocs.io/
+from PIL import ImageDraw, ImageEnhance, ImageFilter
+
+import burst
+
+width, height = 1296, 972 # high_res_w x high_res_h in drumminhands_photobooth.py
+capture_delay = 1 # as in drumminhands_photobooth.py
+burst_size = 5
+
+def jpg(img):
+	data = io.BytesIO()
+	img.save(data, 'JPEG', quality=85)
+	return data.getvalue()
+
+# a camera-like scene: a gradient, sensor noise and a few edges
+def scene(seed):
+	img = Image.blend(Image.linear_gradient('L').resize((width, height)), Image.effect_noise((width, height), 20 + seed), 0.2).convert('RGB')
+	draw = ImageDraw.Draw(img)
+	for i in range(4):
+		x = (seed * 97 + i * width // 4) % width
+		draw.rectangle((x, height // 5, x + width // 10, height * 4 // 5), fill=(40 + i * 50, 200 - i * 40, 120))
+	return img
+
+def variants(img):
+	return [
+		('blurred', img.filter(ImageFilter.GaussianBlur(4))),
+		('motion', img.filter(ImageFilter.BoxBlur(2))),
+		('dark', ImageEnhance.Brightness(img).enhance(0.25)),
+		('bright', ImageEnhance.Brightness(img).enhance(1.8)),
+		('clipped', ImageEnhance.Contrast(img).enhance(4)),
+	]
+
+made = {}
+
+# (name, jpg) of a sharp scene and the poorer copies of it, made once per seed
+def frames(seed):
+	if seed not in made:
+		sharp = scene(seed)
+		made[seed] = [('sharp', jpg(sharp))] + [(name, jpg(img)) for name, img in variants(sharp)[:burst_size - 1]]
+	return made[seed]
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('position', range(burst_size))
+def test_the_sharp_frame_is_kept(seed, position):
+	named = frames(seed)[1:]
+	named.insert(position, frames(seed)[0])
+	shots = burst.Burst(burst_size)
+	for name, data in named:
+		shots.frames.append(data)
+	data, index = shots.best()
+	assert named[index][0] == 'sharp', "kept the %s frame, not the sharp one at %d" % (named[index][0], position)
+
+# every frame of a burst is scored in the pause after it
+def test_scoring_fits_in_capture_delay():
+	shots = burst.Burst(burst_size)
+	for i in range(burst_size):
+		shots.frames.append(jpg(scene(i)))
+	for run in range(5):
+		shots.best()
+	per_burst = shots.per_frame() * burst_size
+	assert per_burst <= capture_delay, "a %d frame burst took %.3fs to score, capture_delay is %ds" % (burst_size, per_burst, capture_delay)
@@ -0,0 +1,132 @@
+# The connectivity monitor against a local stand-in for the upload host: up, taken down, and brought back,
+# checking the state only flips once enough probes agree. With requests installed, also that probes
+# reuse one keep-alive connection.
+
+import threading
+import time
+import pytest
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler # python 2
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import connectivity
+
+connections = [] # client ports the stand-in has seen
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1' # keep-alive
+
+	def do_HEAD(self):
+		if self.client_address[1] not in connections:
+			connections.append(self.client_address[1])
+		self.send_response(200)
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def log_message(self, *args):
+		pass
+
+def serve(port):
+	server = HTTPServer(('127.0.0.1', port), Handler)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
+
+def stop(server):
+	server.shutdown()
+	server.server_close()
+
+@pytest.fixture
+def host(monkeypatch):
+	monkeypatch.setattr(connectivity, 'timeout', 0.5)
+	monkeypatch.setattr(connectivity, 'down_after', 2)
+	server = serve(0)
+	yield server
+	stop(server)
+
+def url(server):
+	return 'http://127.0.0.1:%d/' % server.server_address[1]
+
+def test_state_flips_once_probes_agree(host):
+	port = host.server_address[1]
+	probes = []
+	monitor = connectivity.ConnectivityMonitor(url(host), on_probe=lambda seconds, ok, online: probes.append((seconds, ok, online)))
+	assert not monitor.online(), "offline before the first probe"
+	assert monitor.check() and monitor.online(), "online once the host answers"
+
+	stop(host)
+	assert monitor.check(), "one failed probe keeps it online"
+	assert not monitor.check() and not monitor.online(), "a second failed probe takes it offline"
+
+	server = serve(port)
+	try:
+		assert not monitor.check(), "one lucky probe keeps it offline"
+		assert monitor.check(), "online again once the host is back for a second probe"
+	finally:
+		stop(server)
+	assert [online for t, online in monitor.history] == [True, False, True]
+	assert [(ok, online) for seconds, ok, online in probes] == [(True, True), (False, True), (False, False), (True, False), (True, True)]
+
+def test_stale_result_counts_as_offline(host, monkeypatch):
+	monitor = connectivity.ConnectivityMonitor(url(host))
+	assert monitor.check()
+	monkeypatch.setattr(connectivity, 'ttl', 0.2)
+	time.sleep(0.3)
+	assert not monitor.online()
+
+def test_cached_reads_dont_touch_the_network(host):
+	monitor = connectivity.ConnectivityMonitor(url(host))
+	monitor.check()
+	start = time.time()
+	for i in range(100):
+		monitor.online()
+	assert time.time() - start < 0.05
+
+def test_probes_reuse_one_connection(host):
+	requests = pytest.importorskip('requests')
+	del connections[:]
+	session = requests.Session()
+	try:
+		pooled = connectivity.ConnectivityMonitor(url(host), session)
+		for i in range(5):
+			pooled.check()
+	finally:
+		session.close()
+	assert len(connections) == 1
+
+# batch_upload.ThreadSessions: a session per thread, each keeping its own connection
+def test_each_thread_keeps_its_own_connection(host):
+	pytest.importorskip('requests')
+	import batch_upload
+	del connections[:]
+	sessions = batch_upload.tumblr_sessions()
+	monitor = connectivity.ConnectivityMonitor(url(host), sessions)
+	def probes():
+		for i in range(5):
+			monitor.check()
+	threads = [threading.Thread(target=probes) for i in range(2)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert len(connections) == 2
+
+# a request that doesn't give its own timeout gets the sessions' one, and a stalled host doesn't hold it up
+def test_sessions_timeout_reaches_requests():
+	requests = pytest.importorskip('requests')
+	import socket
+	import batch_upload
+	stalled = socket.socket()
+	stalled.bind(('127.0.0.1', 0))
+	stalled.listen(1) # accepts the connection, never answers
+	try:
+		sessions = batch_upload.tumblr_sessions(0.2)
+		start = time.time()
+		with pytest.raises(requests.exceptions.Timeout):
+			sessions.post('http://127.0.0.1:%d/' % stalled.getsockname()[1], data='post')
+		assert time.time() - start < 2
+	finally:
+		stalled.close()
+	assert socket.getdefaulttimeout() is None
@@ -0,0 +1,137 @@
+# The stage deadlines: deadlines.py on its own, then whole sessions on the simulated backend with one stage
+# at a time held up far past its budget. Each session must still finish, within a bounded time,
+# with the stage's fallback taken and the miss reported.
+
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+import deadlines as deadline_timers
+
+stall = 120 # seconds a held up stage would take without its deadline
+worst_case = 45 # most a session may take with any one stage held up, at the booth's stage_budgets
+
+def timed(deadlines, name, seconds, work):
+	start = time.time()
+	with deadlines.stage(name, seconds) as stage:
+		work()
+	return stage, time.time() - start
+
+@pytest.fixture
+def missed():
+	missed = []
+	deadlines = deadline_timers.Deadlines({'fast': 1.0, 'slow': 0.2}, missed.append)
+	yield deadlines, missed
+	time.sleep(0.3)
+	assert deadlines.breaches == dict((name, missed.count(name)) for name in set(missed)), "no alarm is left over"
+
+def test_a_stage_inside_its_budget_finishes(missed):
+	deadlines, names = missed
+	stage, took = timed(deadlines, 'fast', None, lambda: time.sleep(0.1))
+	assert not stage.breached and took < 0.5
+
+def test_a_stage_past_its_budget_is_cut_short(missed):
+	deadlines, names = missed
+	stage, took = timed(deadlines, 'slow', None, lambda: time.sleep(5))
+	assert stage.breached and took < 0.5
+	assert names == ['slow'] and deadlines.breaches == {'slow': 1}, "the miss is counted"
+
+def test_an_inner_stage_ends_with_the_outer_one(missed):
+	deadlines, names = missed
+	def nested():
+		with deadlines.stage('fast', 10):
+			time.sleep(5)
+	stage, took = timed(deadlines, 'outer', 0.3, nested)
+	assert stage.breached and took < 0.8
+	assert deadlines.breaches == {'outer': 1}, "only the outer stage is counted"
+
+def test_a_stage_without_a_budget_runs_as_long_as_it_needs(missed):
+	deadlines, names = missed
+	stage, took = timed(deadlines, 'unlimited', None, lambda: time.sleep(0.3))
+	assert not stage.breached and took >= 0.3
+
+def test_a_stage_off_the_main_thread_isnt_limited(missed):
+	deadlines, names = missed
+	result = {}
+	def elsewhere():
+		result['stage'], result['took'] = timed(deadlines, 'slow', None, lambda: time.sleep(0.4))
+	thread = threading.Thread(target=elsewhere)
+	thread.start()
+	thread.join()
+	assert not result['stage'].breached and result['took'] >= 0.4
+
+def test_a_guarded_callback_finishes_before_the_stage_ends(missed):
+	deadlines, names = missed
+	done = []
+	def callback():
+		with deadlines.guard():
+			time.sleep(0.4)
+			done.append(True)
+	stage, took = timed(deadlines, 'slow', None, callback)
+	assert stage.breached and done == [True]
+
+# the stage runs out while the loop is running a result from another thread, then its repeating timer
+def test_the_loop_keeps_its_callbacks_past_a_deadline(missed):
+	pytest.importorskip('pygame')
+	import event_loop
+	deadlines, names = missed
+	loop = event_loop.EventLoop(guard=deadlines.guard)
+	results = []
+	def result(value):
+		time.sleep(0.3)
+		results.append(value)
+	loop.call_soon_threadsafe(result, 1)
+	stage, took = timed(deadlines, 'slow', None, lambda: loop.wait(5))
+	assert stage.breached and took < 0.5
+	assert results == [1], "the result is delivered"
+
+	ticks = []
+	def tick(late):
+		ticks.append(late)
+		time.sleep(0.3)
+	repeating = loop.every(0.01, tick)
+	stage, took = timed(deadlines, 'slow', None, lambda: loop.wait(5))
+	assert stage.breached and took < 0.5
+	count = len(ticks)
+	loop.wait(0.5)
+	assert len(ticks) > count, "the timer keeps repeating"
+	repeating.cancel()
+
+def test_the_report_lists_the_misses(missed):
+	deadlines, names = missed
+	assert deadlines.report() == "deadlines: none missed"
+	timed(deadlines, 'slow', None, lambda: time.sleep(5))
+	timed(deadlines, 'outer', 0.1, lambda: time.sleep(5))
+	assert deadlines.report() == "deadlines: 2 missed (outer 1, slow 1)"
+
+# the held up stage, and what the booth should fall back to
+@pytest.mark.parametrize('stage, fallback', [
+	('camera_init', "The camera isn't responding, ending the session"),
+	('capture', "The camera isn't responding, ending the session"),
+	('derivatives', "The smaller pics missed their deadline"),
+	('gif', "posting the jpgs instead"),
+])
+def test_a_held_up_stage_falls_back(runnable, tmp_path, stage, fallback):
+	log = tmp_path / 'sessions.jsonl'
+	start = time.time()
+	output = subprocess.check_output([sys.executable, runnable, '--backend', 'sim', '--metrics-port', '0', '--gallery-port', '0',
+		'--no-delays', '--hi-res', '--sessions', '1', '--sim-stall', '%s=%d' % (stage, stall),
+		'--file-path', str(tmp_path / 'pics') + os.sep, '--queue-path', str(tmp_path / 'queue') + os.sep,
+		'--metrics-log', str(log), '--catalog', str(tmp_path / 'catalog.db')],
+		stderr=subprocess.STDOUT, env=dict(os.environ, SDL_VIDEODRIVER='dummy')).decode('utf-8')
+	took = time.time() - start
+	f = open(str(log))
+	try:
+		lines = [json.loads(line) for line in f]
+	finally:
+		f.close()
+	assert lines and lines[0]['duration'] <= worst_case, "the session ends in time"
+	assert took < stall / 2, "the booth exits without waiting on the stalled work"
+	assert fallback in output
+	report = re.search(r'deadlines: (\d+) missed \(([^)]*)\)', output)
+	assert report is not None and stage in report.group(2), "the miss is reported"
@@ -0,0 +1,279 @@
+# The guests' gallery over HTTP: the session list, conditional and range requests, the memory cache,
+# and new sessions pushed to open pages. Then simulated sessions on the booth while a crowd of phones
+# browses the gallery, printing the request latency percentiles (python -m pytest -s to see them).
+
+import json
+import os
+import random
+import re
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+try:
+	import httplib as http_client # python 2
+except ImportError:
+	import http.client as http_client
+
+import gallery as guest_gallery
+
+total_pics = 4
+phones = 300 # holding the page's event stream open, of which up to 50 browse
+sessions = 5
+
+def write(path, data):
+	f = open(path, 'wb')
+	try:
+		f.write(data)
+	finally:
+		f.close()
+
+# a session's files as the booth saves them: frames, web copies, thumbnails and the gif
+def session(folder, now, gif_bytes=50000):
+	for i in range(1, total_pics+1):
+		for suffix in ['', '-web', '-thumb']:
+			write(os.path.join(folder, now + "-0" + str(i) + suffix + ".jpg"), os.urandom(2000))
+	write(os.path.join(folder, now + ".gif"), os.urandom(gif_bytes))
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def get(connection, path, headers={}, method='GET'):
+	connection.request(method, path, headers=headers)
+	response = connection.getresponse()
+	return response, response.read()
+
+def listed(body):
+	return [s['id'] for s in json.loads(body.decode('utf-8'))]
+
+# a connection to /events, reading every pushed session
+class Listener(object):
+
+	def __init__(self, port):
+		self.sock = socket.create_connection(('127.0.0.1', port))
+		self.sock.sendall(b'GET /events HTTP/1.1\r\nHost: booth\r\n\r\n')
+		self.received = b''
+
+	# read until done() or for up to timeout seconds
+	def read(self, timeout, done):
+		deadline = time.time() + timeout
+		while time.time() < deadline and not done():
+			readers = select.select([self.sock], [], [], max(0, deadline - time.time()))[0]
+			if not readers:
+				break
+			data = self.sock.recv(65536)
+			if not data:
+				break
+			self.received += data
+
+	# whether the gallery has answered, so it pushes every session from now on, waiting up to timeout
+	def subscribed(self, timeout):
+		self.read(timeout, lambda: b'retry: ' in self.received)
+		return b'retry: ' in self.received
+
+	# the sessions pushed so far, waiting up to timeout for at least want of them
+	def sessions(self, timeout, want=None):
+		self.read(timeout, lambda: want is not None and self.received.count(b'\ndata: ') >= want)
+		return [json.loads(line[len('data: '):]) for line in self.received.decode('utf-8').split('\n') if line.startswith('data: ')]
+
+	def close(self):
+		self.sock.close()
+
+# three whole sessions and one still being written, served on a free port. Returns (gallery, folder, connection).
+@pytest.fixture
+def served(tmp_path):
+	folder = str(tmp_path / 'pics' / 'MyEvent' / '2016-07-01')
+	os.makedirs(folder)
+	for minute in range(3):
+		session(folder, "2016-07-01-10-%02d-00" % minute)
+	write(os.path.join(folder, "2016-07-01-10-03-00-01.jpg"), b'half written session') # no animation or copies yet
+	gallery = guest_gallery.Gallery(str(tmp_path / 'pics') + os.sep, 0).start()
+	time.sleep(0.2)
+	connection = http_client.HTTPConnection('127.0.0.1', gallery.port, timeout=5)
+	yield gallery, folder, connection
+	connection.close()
+	gallery.stop()
+
+gif = '/pics/2016-07-01-10-02-00.gif'
+
+def test_sessions_newest_first(served):
+	gallery, folder, connection = served
+	response, body = get(connection, '/sessions.json')
+	assert listed(body) == ["2016-07-01-10-03-00", "2016-07-01-10-02-00", "2016-07-01-10-01-00", "2016-07-01-10-00-00"]
+	item = json.loads(body.decode('utf-8'))[1]
+	assert item['animation'] == gif and item['thumb'] == '/pics/2016-07-01-10-02-00-01-thumb.jpg' and len(item['pics']) == total_pics
+	response, body = get(connection, '/sessions.json?before=2016-07-01-10-02-00&limit=1')
+	assert listed(body) == ["2016-07-01-10-01-00"], "the list pages from a session"
+	response, body = get(connection, '/sessions.json?limit=many')
+	assert len(listed(body)) == 4, "a bad limit gets a page"
+	response, body = get(connection, '/')
+	assert response.status == 200 and body.find(b'10-03-00') < body.find(b'10-02-00')
+
+def test_conditional_requests(served):
+	gallery, folder, connection = served
+	response, body = get(connection, gif)
+	etag, modified = response.getheader('ETag'), response.getheader('Last-Modified')
+	assert response.status == 200 and len(body) == 50000 and response.getheader('Content-Type') == 'image/gif' and etag and modified
+	response, body = get(connection, gif, {'If-None-Match': etag})
+	assert response.status == 304 and body == b''
+	response, body = get(connection, gif, {'If-Modified-Since': modified})
+	assert response.status == 304
+	response, body = get(connection, gif, method='HEAD')
+	assert response.status == 200 and body == b'' and response.getheader('Content-Length') == '50000', "HEAD sends the headers only"
+
+def test_ranges(served):
+	gallery, folder, connection = served
+	etag = get(connection, gif)[0].getheader('ETag')
+	response, body = get(connection, gif, {'Range': 'bytes=100-199'})
+	assert response.status == 206 and len(body) == 100 and response.getheader('Content-Range') == 'bytes 100-199/50000'
+	response, body = get(connection, gif, {'Range': 'bytes=-10'})
+	assert response.status == 206 and response.getheader('Content-Range') == 'bytes 49990-49999/50000', "a suffix range"
+	response, body = get(connection, gif, {'Range': 'bytes=60000-'})
+	assert response.status == 416 and response.getheader('Content-Range') == 'bytes */50000'
+	response, body = get(connection, gif, {'Range': 'bytes=0-9', 'If-Range': etag})
+	assert response.status == 206 and len(body) == 10
+	response, body = get(connection, gif, {'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+	assert response.status == 200 and len(body) == 50000, "a range of a changed file gets the whole new file"
+
+def test_files_come_from_memory_after_the_first_time(served):
+	gallery, folder, connection = served
+	for i in range(4):
+		get(connection, gif)
+	assert gallery.cache.hits == 3 and gallery.cache.misses == 1
+
+def test_only_the_sessions_files_are_found(served):
+	gallery, folder, connection = served
+	for path in ['/pics/../../config.py', '/pics/%2e%2e%2fconfig.py', '/pics/nothing.gif', '/elsewhere']:
+		response, body = get(connection, path)
+		assert response.status == 404, path
+	os.remove(os.path.join(folder, "2016-07-01-10-00-00.gif"))
+	response, body = get(connection, '/pics/2016-07-01-10-00-00.gif')
+	assert response.status == 404, "a pruned file is not found"
+	assert len(gallery.connections) == 1, "every request went over one kept alive connection"
+
+def test_new_sessions_are_pushed(served):
+	gallery, folder, connection = served
+	listener = Listener(gallery.port)
+	try:
+		time.sleep(0.2)
+		session(folder, "2016-07-01-10-04-00")
+		published = time.time()
+		gallery.publish("2016-07-01-10-04-00", folder)
+		pushed = listener.sessions(2, 1)
+		assert [s['id'] for s in pushed] == ["2016-07-01-10-04-00"]
+		assert time.time() - published < 1
+	finally:
+		listener.close()
+	response, body = get(connection, '/sessions.json?limit=1')
+	assert listed(body) == ["2016-07-01-10-04-00"], "and listed first"
+
+# a port nothing is listening on
+def free_port():
+	s = socket.socket()
+	try:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+	finally:
+		s.close()
+
+# simulated sessions on the booth, with the gallery on port. Returns the running booth.
+# With hold, a path, the sessions start once that file is made.
+def start_booth(booth, work, port, hold=None):
+	command = [sys.executable, booth, '--backend', 'sim', '--metrics-port', '0', '--no-delays', '--hi-res',
+		'--sessions', str(sessions), '--gallery-port', str(port), '--file-path', str(work / 'pics') + os.sep,
+		'--queue-path', str(work / 'queue') + os.sep, '--metrics-log', str(work / 'sessions.jsonl'),
+		'--catalog', str(work / 'catalog.db')]
+	if hold is not None:
+		command += ['--sim-hold', hold]
+	return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=dict(os.environ, SDL_VIDEODRIVER='dummy'))
+
+# the json line of every session the booth in work ran
+def logged(work):
+	f = open(str(work / 'sessions.jsonl'))
+	try:
+		return [json.loads(line) for line in f]
+	finally:
+		f.close()
+
+# a crowd of phones: each holds the page's event stream open and browses now and then
+def test_load(runnable, tmp_path):
+	start_booth(runnable, tmp_path / 'alone', 0).communicate() # the same sessions without the gallery, to compare
+	alone = [line['duration'] for line in logged(tmp_path / 'alone')]
+
+	work = tmp_path / 'crowd'
+	port = free_port()
+	hold = str(tmp_path / 'start')
+	running = start_booth(runnable, work, port, hold)
+	listeners = []
+	try:
+		for attempt in range(100): # until the gallery is up
+			try:
+				socket.create_connection(('127.0.0.1', port)).close()
+				break
+			except socket.error:
+				time.sleep(0.1)
+		listeners = [Listener(port) for i in range(phones)]
+		# every phone has the page open before the first session, so each should be pushed all of them
+		assert all(listener.subscribed(10) for listener in listeners), "every phone's event stream is open"
+		write(hold, b'')
+		latencies = []
+		errors = [] # (when, what)
+		done = threading.Event()
+
+		def browse():
+			try:
+				os.nice(guest_gallery.nice) # phones are other devices. Here they share the booth's cpu, so keep them behind it like the gallery.
+			except (AttributeError, OSError):
+				pass
+			connection = http_client.HTTPConnection('127.0.0.1', port, timeout=10)
+			while not done.is_set():
+				try:
+					start = time.time()
+					response, body = get(connection, '/')
+					latencies.append(time.time() - start)
+					found = json.loads(get(connection, '/sessions.json?limit=4')[1].decode('utf-8'))
+					for item in found[:2]:
+						for path in [item['thumb'], item['animation'] or item['pics'][0]]:
+							start = time.time()
+							response, body = get(connection, path)
+							latencies.append(time.time() - start)
+							if response.status != 200:
+								errors.append((time.time(), path))
+				except Exception as e:
+					errors.append((time.time(), repr(e)))
+					connection = http_client.HTTPConnection('127.0.0.1', port, timeout=10)
+				time.sleep(random.uniform(0.1, 0.5)) # a phone's worth of browsing
+		browsers = [threading.Thread(target=browse) for i in range(min(phones, 50))]
+		for thread in browsers:
+			thread.daemon = True
+			thread.start()
+		output = running.communicate()[0].decode('utf-8', 'replace')
+		done.set()
+		for thread in browsers:
+			thread.join()
+		pushes = [len(listener.sessions(1, sessions)) for listener in listeners]
+	finally:
+		for listener in listeners:
+			listener.close()
+		if running.poll() is None:
+			running.kill()
+	lines = logged(work)
+	durations = [line['duration'] for line in lines]
+	ended = max(line['start'] + line['duration'] for line in lines)
+	errors = [what for when, what in errors if when < ended] # not those from the booth shutting down after its last session
+	reports = re.findall(r'gallery: .*', output)
+	print("%d phones connected, %d browsing, %d requests" % (phones, len(browsers), len(latencies)))
+	if latencies:
+		print("request latency: p50 %.1fms  p95 %.1fms  p99 %.1fms  max %.1fms" % tuple(1000 * v for v in
+			[percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99), max(latencies)]))
+	print("sessions: p50 %.2fs, max %.2fs. Without the gallery: p50 %.2fs, max %.2fs" % (percentile(durations, 50), max(durations),
+		percentile(alone, 50), max(alone)))
+	if reports:
+		print(reports[-1])
+	assert latencies and not errors, "%d requests failed, e.g. %s" % (len(errors), errors[:1])
+	assert min(pushes) == sessions, "every phone was pushed every session (%d-%d of %d)" % (min(pushes), max(pushes), sessions)
+	assert len(durations) == sessions
@@ -0,0 +1,103 @@
+# A few sessions through the upload queue to a throttled stand-in for Tumblr: once the link speed is known,
+# posts are shrunk to the budget and go up faster, and a retry reuses the prepared file instead of encoding it again.
+# Needs pytumblr, as the booth does.
+
+import io
+import os
+import pytest
+Image = pytest.importorskip('PIL.Image') # https://pillow.readthedocs.io/
+
+import gif_encoder
+import payload
+import upload_queue
+import throttled_server
+
+rate = 200 # KB per second
+target_seconds = 1
+gif_delay = 100 # as in drumminhands_photobooth.py
+
+# three gif sessions at the gif size and a jpg session at hi res, from the shared synthetic captures
+@pytest.fixture
+def sessions(tmp_path, synthetic):
+	work = str(tmp_path)
+	gifs = []
+	for session in range(3):
+		path = os.path.join(work, 'session-%d.gif' % session)
+		gif_encoder.encode_frames([Image.open(io.BytesIO(data)).convert('RGB') for data in synthetic((500, 375))], path, gif_delay)
+		gifs.append(path)
+	jpgs = []
+	for i, data in enumerate(synthetic((1296, 972))):
+		path = os.path.join(work, 'session-3-0%d.jpg' % (i + 1))
+		f = open(path, 'wb')
+		try:
+			f.write(data)
+		finally:
+			f.close()
+		jpgs.append(path)
+	return work, gifs, jpgs
+
+@pytest.fixture
+def server():
+	server = throttled_server.serve(rate * 1024)
+	yield server
+	server.shutdown()
+	server.server_close()
+
+def test_posts_shrink_to_the_link(sessions, server):
+	pytumblr = pytest.importorskip('pytumblr') # https://github.com/tumblr/pytumblr
+	work, gifs, jpgs = sessions
+	client = pytumblr.TumblrRestClient('key', 'secret', 'token', 'secret', host='http://127.0.0.1:%d' % server.server_address[1])
+	payloads = payload.PayloadPreparer(os.path.join(work, 'queue', 'prepared'), target_seconds)
+	uploads = upload_queue.UploadQueue(client, os.path.join(work, 'queue'), 'blog', 'tag', payloads=payloads)
+
+	for gif in gifs:
+		uploads.enqueue_gif(gif)
+	uploads.enqueue_jpgs(jpgs)
+	while uploads.drain_once() is not None:
+		pass
+
+	posts = server.posts
+	budget = payloads.budget()
+	assert len(posts) == 4 and uploads.succeeded == 4, "every post arrived"
+	assert posts[0][0] > os.path.getsize(gifs[0]), "the first post goes full size"
+	assert all(b <= budget * 1.1 for b, s in posts[1:3]), "later gifs fit the budget" # multipart adds a little
+	assert all(s < posts[0][1] for b, s in posts[1:3]), "later gifs upload faster"
+	assert posts[3][0] <= budget * 1.1, "the jpgs fit the budget"
+	assert not os.listdir(payloads.cache_path), "prepared files are dropped once posted"
+
+def test_a_retry_reuses_the_prepared_files(sessions):
+	work, gifs, jpgs = sessions
+	payloads = payload.PayloadPreparer(os.path.join(work, 'prepared'), target_seconds)
+	payloads.observe(rate * 1024, 1.0, True) # a known link speed, so the jpgs are shrunk
+	first = payloads.prepare(jpgs)[0]
+	assert first != jpgs and payloads.encodes == len(jpgs), "the jpgs are shrunk"
+	encodes = payloads.encodes
+	again = payloads.prepare(jpgs)[0]
+	assert first == again and payloads.encodes == encodes and payloads.hits >= len(jpgs)
+
+# the bottom of the ladder fits the smallest budget, even for a gif of hi res pics
+def test_the_ladder_reaches_min_budget(tmp_path, synthetic):
+	path = str(tmp_path / 'hi-res.gif')
+	gif_encoder.encode_frames([Image.open(io.BytesIO(data)).convert('RGB') for data in synthetic((1296, 972))], path, gif_delay)
+	payloads = payload.PayloadPreparer(str(tmp_path / 'prepared'), target_seconds)
+	shrunk = payloads.shrink(path, payload.min_budget)
+	assert shrunk != path and os.path.getsize(shrunk) <= payload.min_budget
+
+# a black and white gif shrinks on the grey palette, and frames gif_encoder merged keep their hold
+def test_a_grey_gif_stays_grey_with_its_holds(tmp_path, synthetic):
+	path = str(tmp_path / 'grey.gif')
+	frames = [Image.open(io.BytesIO(data)).convert('L') for data in synthetic((1296, 972))]
+	gif_encoder.encode_frames(frames[:1] + frames, path, gif_delay) # the first frame shown twice as long
+	payloads = payload.PayloadPreparer(str(tmp_path / 'prepared'), target_seconds)
+	shrunk = payloads.shrink(path, payload.min_budget)
+	assert shrunk != path
+	before, after = payload.load_animation(path), payload.load_animation(shrunk)
+	assert after[1] == before[1] == [2 * gif_delay] + [gif_delay] * (len(frames) - 1)
+	assert all(f.mode == 'L' for f in after[0]) and payload.is_gray(Image.open(shrunk))
+
+def test_a_grey_jpg_stays_one_channel(tmp_path, synthetic):
+	path = str(tmp_path / 'grey.jpg')
+	Image.open(io.BytesIO(synthetic((1296, 972))[0])).convert('L').save(path, quality=95)
+	payloads = payload.PayloadPreparer(str(tmp_path / 'prepared'), target_seconds)
+	shrunk = payloads.shrink(path, os.path.getsize(path) // 2)
+	assert shrunk != path and Image.open(shrunk).mode == 'L'
@@ -0,0 +1,138 @@
+# The storage manager over a made up pics folder: the event and day layout, the retention policy,
+# the quota and free space limits, and pruning on its background thread.
+# Sessions waiting to upload, or still being taken or processed, are never removed.
+
+import os
+import threading
+import time
+import pytest
+
+import catalog as session_catalog
+import storage as pic_storage
+
+total_pics = 4
+pic_bytes = 100 * 1024
+session_bytes = (total_pics + 1) * pic_bytes
+
+def write(path, size):
+	f = open(path, 'wb')
+	try:
+		f.write(b'\0' * size)
+	finally:
+		f.close()
+
+# a session of frames and a gif, saved and catalogued the way the booth does it
+def session(storage, catalog, now, status, created=None):
+	catalog.add_session(now, created=created)
+	folder = storage.session_path(now)
+	for i in range(1, total_pics+1):
+		write(folder + now + "-0" + str(i) + ".jpg", pic_bytes)
+		catalog.add_file(now, folder + now + "-0" + str(i) + ".jpg", 'frame')
+	write(folder + now + ".gif", pic_bytes)
+	catalog.add_file(now, folder + now + ".gif", 'animation')
+	catalog.set_upload_status(now, status)
+	return folder
+
+# setup(**limits) returns (catalog, storage) over an empty pics folder
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+	monkeypatch.setattr(pic_storage, 'pause', 0)
+	def make(**limits):
+		pics = str(tmp_path / 'pics') + os.sep
+		os.makedirs(pics)
+		catalog = session_catalog.Catalog(str(tmp_path / 'catalog.db'), 'My Event')
+		return catalog, pic_storage.Storage(pics, catalog, 'My Event', **limits)
+	return make
+
+def test_event_and_day_folders(setup):
+	catalog, storage = setup()
+	folder = storage.session_path("2016-07-31-10-26-26")
+	assert folder == os.path.join(storage.file_path, 'My_Event', '2016-07-31') + os.sep and os.path.isdir(folder)
+
+def test_frames_kept_only_until_uploaded(setup):
+	catalog, storage = setup(keep_frames=False)
+	uploaded = session(storage, catalog, "2016-07-31-10-00-00", 'uploaded')
+	session(storage, catalog, "2016-07-31-10-05-00", 'pending')
+	removed = storage.prune()
+	assert not catalog.files("2016-07-31-10-00-00", 'frame') and removed == total_pics * pic_bytes, "uploaded frames are removed"
+	assert os.path.exists(uploaded + "2016-07-31-10-00-00.gif"), "the uploaded animation stays"
+	assert len(catalog.files("2016-07-31-10-05-00", 'frame')) == total_pics, "frames waiting to upload stay"
+
+# the oldest uploaded sessions go first, pending ones never
+def test_quota(setup):
+	catalog, storage = setup(quota_mb=4.5 * session_bytes / 1048576.0)
+	session(storage, catalog, "2016-07-30-20-00-00", 'pending')
+	session(storage, catalog, "2016-07-30-21-00-00", 'uploaded')
+	session(storage, catalog, "2016-07-31-10-00-00", 'uploaded')
+	session(storage, catalog, "2016-07-31-11-00-00", 'none')
+	session(storage, catalog, "2016-07-31-12-00-00", 'pending')
+	storage.prune()
+	assert catalog.sessions() == ["2016-07-30-20-00-00", "2016-07-31-10-00-00", "2016-07-31-11-00-00", "2016-07-31-12-00-00"]
+	assert not os.path.exists(os.path.join(storage.file_path, 'My_Event', '2016-07-30', "2016-07-30-21-00-00.gif"))
+	assert not storage.stuck
+	storage.quota = session_bytes
+	storage.prune()
+	assert catalog.sessions() == ["2016-07-30-20-00-00", "2016-07-31-11-00-00", "2016-07-31-12-00-00"], "sessions never posted are kept by default"
+	assert storage.stuck and storage.status().startswith("Storage nearly full"), "with nothing left to remove it is stuck"
+
+def test_age_and_free_space(setup):
+	catalog, storage = setup(keep_days=7)
+	session(storage, catalog, "2016-07-01-10-00-00", 'uploaded', created=time.time() - 30 * 86400)
+	session(storage, catalog, "2016-07-31-10-00-00", 'uploaded')
+	session(storage, catalog, "2016-07-31-11-00-00", 'pending')
+	storage.prune()
+	assert catalog.sessions() == ["2016-07-31-10-00-00", "2016-07-31-11-00-00"], "uploaded sessions past keep_days are removed"
+	storage.min_free = storage.free() + 1024 * 1048576 # more than there is
+	storage.prune()
+	assert catalog.sessions() == ["2016-07-31-11-00-00"], "short of free space removes uploaded sessions"
+	assert storage.headroom() == (0, 0)
+	storage.min_free = 0
+	room, sessions = storage.headroom()
+	assert room > 0 and sessions == room // session_bytes, "headroom counts sessions of the catalogued size"
+
+def test_pruning_in_the_background(setup):
+	catalog, storage = setup(keep_frames=False)
+	storage.start()
+	time.sleep(0.2)
+	session(storage, catalog, "2016-07-31-10-00-00", 'uploaded')
+	start = time.time()
+	storage.kick()
+	while catalog.files("2016-07-31-10-00-00", 'frame') and time.time() - start < 5:
+		time.sleep(0.05)
+	assert not catalog.files("2016-07-31-10-00-00", 'frame')
+	thread = [t for t in threading.enumerate() if t.name == 'storage'][0]
+	if hasattr(os, 'getpriority') and hasattr(thread, 'native_id'): # python 3.8 and up
+		assert os.getpriority(os.PRIO_PROCESS, thread.native_id) > os.getpriority(os.PRIO_PROCESS, 0), "pruning runs at lower priority than the booth"
+
+# everything, including pics from before the catalog
+def test_clear(setup):
+	catalog, storage = setup()
+	session(storage, catalog, "2016-07-31-10-00-00", 'pending')
+	write(storage.file_path + "2015-01-01-10-00-00-01.jpg", pic_bytes)
+	removed = storage.clear()
+	assert removed == session_bytes + pic_bytes and not session_catalog.all_pics(storage.file_path) and not catalog.sessions()
+
+# a session still being taken or processed is never removed, nor the folders it is about to be saved in
+def test_open_sessions_are_kept(setup):
+	catalog, storage = setup(quota_mb=0.5 * session_bytes / 1048576.0, keep_unposted=False)
+	session(storage, catalog, "2016-07-30-10-00-00", 'none')
+	catalog.add_session("2016-07-31-10-00-00")
+	folder = storage.begin("2016-07-31-10-00-00") # nothing saved yet
+	session(storage, catalog, "2016-07-31-09-00-00", 'none') # the same day
+	storage.prune()
+	assert catalog.sessions() == ["2016-07-31-10-00-00"], "only the open session is left"
+	assert os.path.isdir(folder), "its day folder stays, though it is empty"
+	assert not os.path.exists(os.path.join(storage.file_path, 'My_Event', '2016-07-30')), "other empty day folders go"
+	storage.end("2016-07-31-10-00-00")
+	assert [row[0] for row in storage.prunable(storage.finished)] == ["2016-07-31-10-00-00"], "once ended it may be removed"
+
+# posts of cleared pics are dropped from the upload queue, rather than retried until given up on
+def test_clear_drops_queued_posts(setup, tmp_path):
+	import upload_queue
+	catalog, storage = setup()
+	folder = session(storage, catalog, "2016-07-31-10-00-00", 'pending')
+	uploads = upload_queue.UploadQueue(None, str(tmp_path / 'queue'), 'blog', 'tag')
+	uploads.enqueue_gif(folder + "2016-07-31-10-00-00.gif", "2016-07-31-10-00-00")
+	uploads.enqueue_gif(str(tmp_path / 'elsewhere.gif'))
+	storage.clear(uploads)
+	assert [job['files'] for job in uploads.jobs()] == [[str(tmp_path / 'elsewhere.gif')]]
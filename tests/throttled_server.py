@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# A stand-in for the Tumblr API behind a slow venue uplink.
+# Reads each post's body at a capped rate and answers like a created post.
+# Point a client at it with host='http://127.0.0.1:<port>' in pytumblr.TumblrRestClient.
+# usage: python throttled_server.py [KB per second] [port]
+
+import json
+import sys
+import threading
+import time
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler # python 2
+	from SocketServer import ThreadingMixIn
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import ThreadingMixIn
+
+chunk = 4096
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1' # keep-alive, like the real API
+
+	def do_POST(self):
+		length = int(self.headers.get('Content-Length', 0))
+		start = time.time()
+		received = 0
+		while received < length:
+			received += len(self.rfile.read(min(chunk, length - received)))
+			ahead = received / float(self.server.rate) - (time.time() - start)
+			if ahead > 0:
+				time.sleep(ahead) # hold the upload to the rate
+		self.server.posts.append((received, time.time() - start))
+		body = json.dumps({'meta': {'status': 201, 'msg': 'Created'}, 'response': {'id': len(self.server.posts)}}).encode('utf-8')
+		self.send_response(201)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+class ThrottledServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	def __init__(self, port, rate):
+		HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+		self.rate = rate # bytes per second
+		self.posts = [] # (bytes, seconds) of every post received
+
+# start a server in the background. Port 0 picks a free one.
+def serve(rate, port=0):
+	server = ThrottledServer(port, rate)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
+
+if __name__ == '__main__':
+	rate = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	port = int(sys.argv[2]) if len(sys.argv) > 2 else 8081
+	server = ThrottledServer(port, rate * 1024)
+	print("Taking posts at %dKB/s on http://127.0.0.1:%d/" % (rate, port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# Durable background upload queue for Tumblr posts.
+# Each post is a small json job file on disk, so jobs survive a crash or a reboot.
+# A background worker drains the queue, retrying failed posts with exponential backoff.
+# With a PayloadPreparer, each post is first shrunk to suit the measured link speed.
+
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+
+retry_base = 5 # seconds to wait after the first failed attempt
+retry_max = 600 # never wait longer than this between attempts
+max_attempts = 50 # give up on a job after this many tries and move it to failed/
+
+# pytumblr returns the whole reply, including 'meta', only when the request failed
+def post_failed(response):
+	return isinstance(response, dict) and 'meta' in response and response['meta'].get('status', 500) >= 300
+
+# the jobs waiting in queue_path, oldest first
+def read_jobs(queue_path):
+	found = []
+	for path in sorted(glob.glob(os.path.join(queue_path, '*.json'))):
+		try:
+			f = open(path)
+			try:
+				found.append(json.load(f))
+			finally:
+				f.close()
+		except (IOError, OSError, ValueError):
+			print("Skipping unreadable upload job " + path)
+	return found
+
+class UploadQueue(object):
+
+	def __init__(self, client, queue_path, blog, tags, online=None, on_upload=None, on_finished=None, payloads=None):
+		self.client = client # pytumblr.TumblrRestClient or anything with create_photo()
+		self.queue_path = queue_path
+		self.failed_path = os.path.join(queue_path, 'failed')
+		self.blog = blog
+		self.tags = tags
+		self.online = online # optional function returning False when there is no point trying
+		self.on_upload = on_upload # optional function called with (seconds, ok) after every attempt
+		self.on_finished = on_finished # optional function called with (job, 'uploaded' or 'failed') once a job is done
+		self.payloads = payloads # optional payload.PayloadPreparer, to shrink posts to the link speed
+		self.succeeded = 0 # posts uploaded since start
+		self.failed = 0 # failed attempts since start
+		self.gave_up = 0 # jobs moved to failed/ since start
+		self.lock = threading.Lock()
+		self.wake = threading.Event()
+		self.counter = 0
+		for path in (self.queue_path, self.failed_path):
+			if not os.path.isdir(path):
+				os.makedirs(path)
+
+	# add an animated gif post, or a webp or mp4 animation
+	def enqueue_gif(self, gif_path, session=None):
+		return self.enqueue('gif', [gif_path], session)
+
+	# add a post with several jpgs
+	def enqueue_jpgs(self, jpg_paths, session=None):
+		return self.enqueue('jpgs', list(jpg_paths), session)
+
+	# session is the booth's session timestamp, passed back in the job to on_finished
+	def enqueue(self, kind, files, session=None):
+		with self.lock:
+			self.counter += 1
+			now = time.time()
+			job_id = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(now)) + "-%03d" % (self.counter % 1000)
+			job = {'id': job_id, 'kind': kind, 'files': files, 'session': session, 'created': now, 'attempts': 0, 'next_try': now}
+			self.write_job(job)
+		self.wake.set()
+		return job_id
+
+	# write to a temp file and rename, so a power cut never leaves half a job behind
+	def write_job(self, job):
+		path = os.path.join(self.queue_path, job['id'] + '.json')
+		tmp = path + '.tmp'
+		f = open(tmp, 'w')
+		try:
+			json.dump(job, f)
+			f.flush()
+			os.fsync(f.fileno())
+		finally:
+			f.close()
+		os.rename(tmp, path)
+
+	# drop the jobs posting any of files, e.g. once they have been deleted. Returns how many were dropped.
+	def discard(self, files):
+		files = set(os.path.normpath(f) for f in files)
+		dropped = 0
+		with self.lock:
+			for job in self.jobs():
+				if not files.intersection(os.path.normpath(f) for f in job['files']):
+					continue
+				try:
+					os.remove(os.path.join(self.queue_path, job['id'] + '.json'))
+				except OSError: # just finished
+					continue
+				dropped += 1
+				if self.payloads is not None:
+					self.payloads.release(job['files'])
+		return dropped
+
+	def jobs(self):
+		return read_jobs(self.queue_path)
+
+	def stats(self):
+		jobs = self.jobs()
+		oldest = min([j['created'] for j in jobs]) if jobs else None
+		return {
+			'depth': len(jobs),
+			'oldest_age': (time.time() - oldest) if oldest else 0,
+			'succeeded': self.succeeded,
+			'failed': self.failed,
+			'gave_up': self.gave_up,
+		}
+
+	# post one job, sending files in place of the job's own. Returns True if Tumblr accepted it.
+	def post(self, job, files=None):
+		files = files or job['files']
+		if job['kind'] == 'gif' and files[0].endswith('.mp4'): # an mp4 animation is a video post
+			response = self.client.create_video(self.blog, state="published", tags=[self.tags], data=files[0])
+		elif job['kind'] == 'gif': # a gif or webp animation
+			response = self.client.create_photo(self.blog, state="published", tags=[self.tags], data=files[0])
+		else:
+			response = self.client.create_photo(self.blog, state="published", tags=[self.tags], format="markdown", data=files)
+		return not post_failed(response)
+
+	# the files to send for a job, and a note for the log. Falls back to the job's own files.
+	def prepare(self, job):
+		if self.payloads is None:
+			return job['files'], None
+		try:
+			return self.payloads.prepare(job['files'])
+		except Exception:
+			traceback.print_exc()
+			return job['files'], 'full size, preparing failed'
+
+	def run_job(self, job):
+		path = os.path.join(self.queue_path, job['id'] + '.json')
+		files, note = self.prepare(job)
+		try:
+			size = sum(os.path.getsize(f) for f in files)
+		except OSError: # e.g. cleared since it was queued. The post fails and is retried, then given up on.
+			size = None
+		start = time.time()
+		try:
+			ok = self.post(job, files)
+		except Exception:
+			traceback.print_exc()
+			ok = False
+		seconds = time.time() - start
+		if self.on_upload is not None:
+			self.on_upload(seconds, ok)
+		if self.payloads is not None and ok and size is not None:
+			self.payloads.observe(size, seconds, ok)
+		if ok:
+			try:
+				os.remove(path)
+			except OSError: # discarded while it was being posted
+				pass
+			self.succeeded += 1
+			print("Uploaded " + job['id'] + (" in %.1fs (%s)" % (seconds, note) if note else ""))
+			if self.payloads is not None:
+				self.payloads.release(job['files'])
+			if self.on_finished is not None:
+				self.on_finished(job, 'uploaded')
+			return
+		self.failed += 1
+		job['attempts'] += 1
+		with self.lock:
+			if not os.path.exists(path): # discarded while it was being posted
+				return
+			if job['attempts'] < max_attempts:
+				job['next_try'] = time.time() + min(retry_max, retry_base * 2 ** (job['attempts'] - 1))
+				self.write_job(job)
+				print("Upload of " + job['id'] + " failed, try " + str(job['attempts']) + ". Will retry later.")
+				return
+			os.rename(path, os.path.join(self.failed_path, job['id'] + '.json'))
+			self.gave_up += 1
+			print("Gave up uploading " + job['id'])
+			if self.payloads is not None:
+				self.payloads.release(job['files'])
+			if self.on_finished is not None:
+				self.on_finished(job, 'failed')
+
+	# run the next job that is due. Returns seconds to wait before the next one is due, or None if empty.
+	def drain_once(self):
+		jobs = self.jobs()
+		if not jobs:
+			return None
+		now = time.time()
+		due = [j for j in jobs if j['next_try'] <= now]
+		if not due:
+			return min(j['next_try'] for j in jobs) - now
+		if self.online is not None and not self.online():
+			return retry_base
+		self.run_job(due[0])
+		return 0
+
+	def worker(self):
+		while True:
+			try:
+				wait = self.drain_once()
+			except Exception: # one bad job mustn't stop the queue
+				traceback.print_exc()
+				wait = retry_base
+			if wait == 0:
+				continue
+			self.wake.wait(wait if wait is not None else retry_max)
+			self.wake.clear()
+
+	# start the background worker. It is a daemon thread, so it never holds up exiting.
+	def start(self):
+		thread = threading.Thread(target=self.worker, name='upload_queue')
+		thread.daemon = True
+		thread.start()
+		return thread